@@ -0,0 +1,316 @@
+#!/usr/bin/python
+"""
+Benchmark suite for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+
+Measures SDK-call overhead, single-frame and live acquisition rates and
+latencies over a grid of regions, binnings and bit depths, camera startup
+times with a cold and a warm capability cache, and per-frame copy and
+allocation costs. By default the simulated SDK
+is used, so that the wrapper overhead can be tracked on any machine.
+Results are written as JSON, and two result files can be compared:
+
+    PYTHONPATH=. python benchmarks/bench_qhpyccd.py -o new.json
+    python benchmarks/bench_qhpyccd.py --compare old.json new.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+
+def percentiles(times):
+    """Return summary statistics of a list of durations (in seconds)
+
+    Parameters
+    ----------
+    times : float[]
+        durations in seconds
+
+    Returns
+    -------
+    stats : dict
+        mean, min, p50, p90, p99 and max in microseconds
+    """
+    t = np.asarray(times) * 1.0e6
+    p50, p90, p99 = np.percentile(t, [50.0, 90.0, 99.0])
+    return {'n': len(t), 'mean_us': float(t.mean()), 'min_us': float(t.min()),
+            'p50_us': float(p50), 'p90_us': float(p90), 'p99_us': float(p99),
+            'max_us': float(t.max())}
+
+
+def time_calls(func, ncalls):
+    """Time repeated calls of a function
+
+    Parameters
+    ----------
+    func : callable
+        function to call without arguments
+    ncalls : int
+        number of calls
+
+    Returns
+    -------
+    stats : dict
+        latency statistics (see percentiles())
+    """
+    times = []
+    for i in range(ncalls):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return percentiles(times)
+
+
+def quiet(func, *args, **kwargs):
+    """Call a function with its standard output discarded
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def bench_startup(qhpyccd, args):
+    """Camera object creation time, with a cold and a warm capability cache
+
+    The capability cache is kept in a temporary directory, so that the
+    user's cache is neither used nor written.
+    """
+    cold = []
+    warm = []
+    with tempfile.TemporaryDirectory(prefix='qhpyccd-bench-') as tmpdir:
+        for i in range(args.nstartup):
+            # A new, empty cache directory for every cold startup
+            cache_dir = os.path.join(tmpdir, f'cold{i}')
+            for times in (cold, warm):
+                t0 = time.perf_counter()
+                cam = quiet(qhpyccd.qhyccd, exptime=args.exptime,
+                            cache_dir=cache_dir)
+                times.append(time.perf_counter() - t0)
+                cam.close()
+    return {'cold': percentiles(cold), 'warm': percentiles(warm)}
+
+
+def bench_controls(cam, args):
+    """Per-call overhead of the control parameter methods
+    """
+    return {
+        'has_control': time_calls(
+            lambda: cam.has_control('CONTROL_GAIN'), args.ncalls),
+        'set_control': time_calls(
+            lambda: cam.set_control('CONTROL_GAIN', 100), args.ncalls),
+        'query_control': time_calls(
+            lambda: cam.query_control('CONTROL_GAIN'), args.ncalls),
+        'get_temperature': time_calls(cam.get_temperature, args.ncalls)
+    }
+
+
+def configurations(cam, args):
+    """Iterate over the region, binning and bit depth grid
+    """
+    width, height = cam.get_image_size()
+    for fraction in args.regions:
+        size = [int(width * fraction) // 8 * 8, int(height * fraction) // 8 * 8]
+        start = [(width - size[0]) // 2, (height - size[1]) // 2]
+        for binning in args.binnings:
+            for bitdepth in args.bitdepths:
+                quiet(cam.set_region, start, size)
+                quiet(cam.set_binsize, [binning, binning])
+                quiet(cam.set_bitdepth, bitdepth)
+                yield {'size': size, 'binning': binning, 'bitdepth': bitdepth}
+
+
+def bench_single(cam, args):
+    """Single frame acquisition rate and latency
+    """
+    results = []
+    for config in configurations(cam, args):
+        cam.get_image()
+        t0 = time.perf_counter()
+        stats = time_calls(cam.get_image, args.nframes)
+        config.update(stats)
+        config['fps'] = args.nframes / (time.perf_counter() - t0)
+        results.append(config)
+    return results
+
+
+def bench_live(cam, args):
+    """Live frame acquisition rate and latency
+
+    Frames are polled every poll_interval seconds; a stream delivering no
+    frame for live_timeout seconds raises TimeoutError.
+    """
+    results = []
+    cam.set_stream_mode('live')
+    try:
+        for config in configurations(cam, args):
+            cam.begin_live(args.nbuffers)
+            try:
+                times = []
+                t0 = time.perf_counter()
+                deadline = t0 + args.live_timeout
+                while len(times) < args.nframes:
+                    t1 = time.perf_counter()
+                    frame = cam.poll_live_frame()
+                    if frame is None:
+                        if t1 > deadline:
+                            raise TimeoutError('live stream stalled')
+                        time.sleep(args.poll_interval)
+                        continue
+                    times.append(time.perf_counter() - t1)
+                    frame.release()
+                    deadline = time.perf_counter() + args.live_timeout
+                config['fps'] = args.nframes / (time.perf_counter() - t0)
+            finally:
+                cam.stop_live()
+            config.update(percentiles(times))
+            results.append(config)
+    finally:
+        cam.set_stream_mode('single')
+    return results
+
+
+def bench_buffers(cam, args):
+    """Per-frame copy and allocation cost
+    """
+    width, height = cam.get_image_size()
+    quiet(cam.set_region, [0, 0], [width, height])
+    quiet(cam.set_binsize, [1, 1])
+    quiet(cam.set_bitdepth, 16)
+    cam.get_image()
+    image = cam.image
+    out = np.empty_like(image)
+    return {
+        'frame_bytes': int(image.nbytes),
+        'copy': time_calls(lambda: np.copy(image), args.nframes),
+        'copyto': time_calls(lambda: np.copyto(out, image), args.nframes),
+        'zeros': time_calls(lambda: np.zeros(image.shape, image.dtype),
+                            args.nframes),
+        'empty': time_calls(lambda: np.empty(image.shape, image.dtype),
+                            args.nframes)
+    }
+
+
+def compare(old_file, new_file, threshold):
+    """Print the relative change of every timing between two result files
+
+    Returns
+    -------
+    nregressions : int
+        number of timings that got slower by more than threshold
+    """
+    with open(old_file) as f:
+        old = flatten(json.load(f)['results'])
+    with open(new_file) as f:
+        new = flatten(json.load(f)['results'])
+    nregressions = 0
+    for key in sorted(set(old) & set(new)):
+        if not key.endswith(('mean_us', 'p50_us', 'p99_us', 'fps')) \
+                or old[key] == 0.0:
+            continue
+        change = new[key] / old[key] - 1.0
+        # A higher frame rate is an improvement, a higher latency is not
+        slower = -change if key.endswith('fps') else change
+        flag = ''
+        if slower > threshold:
+            flag = '  <-- slower'
+            nregressions += 1
+        print(f'{key:60s} {old[key]:12.2f} {new[key]:12.2f} ' \
+              f'{change * 100.0:+7.1f}%{flag}')
+    return nregressions
+
+
+def flatten(results, prefix=''):
+    """Flatten nested benchmark results into a {path: value} dictionary
+    """
+    flat = {}
+    if isinstance(results, dict):
+        items = results.items()
+    else:
+        # Configuration lists are keyed by their parameters
+        items = ((f"{r['size'][0]}x{r['size'][1]}_bin{r['binning']}" \
+                  f"_{r['bitdepth']}bit", r) for r in results)
+    for key, value in items:
+        path = f'{prefix}{key}'
+        if isinstance(value, (dict, list)) and not key == 'size':
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)):
+            flat[path] = float(value)
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help='JSON output file ' \
+                        '(default: standard output)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files and exit')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slow-down reported as a regression')
+    parser.add_argument('--hardware', action='store_true',
+                        help='use the real QHYCCD SDK instead of the simulator')
+    parser.add_argument('--size', type=int, nargs=2, default=[2048, 2048],
+                        help='simulated sensor size')
+    parser.add_argument('--readout-rate', type=float, default=1.0e10,
+                        help='simulated readout rate in pixels/s')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated readout latency in s')
+    parser.add_argument('--exptime', type=float, default=0.0,
+                        help='exposure time in s')
+    parser.add_argument('--regions', type=float, nargs='+',
+                        default=[1.0, 0.5, 0.25],
+                        help='region sizes as fractions of the sensor size')
+    parser.add_argument('--binnings', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--bitdepths', type=int, nargs='+', default=[16, 8])
+    parser.add_argument('--nframes', type=int, default=50)
+    parser.add_argument('--nbuffers', type=int, default=4)
+    parser.add_argument('--ncalls', type=int, default=2000)
+    parser.add_argument('--nstartup', type=int, default=5)
+    parser.add_argument('--poll-interval', type=float, default=0.0005,
+                        help='wait between live frame polls in s')
+    parser.add_argument('--live-timeout', type=float, default=10.0,
+                        help='maximum wait for a live frame in s')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    import qhpyccd
+    if not args.hardware:
+        qhpyccd.use_simulator(size=args.size, readout_rate=args.readout_rate,
+                              latency=args.latency)
+
+    results = {'startup': bench_startup(qhpyccd, args)}
+    cam = quiet(qhpyccd.qhyccd, exptime=args.exptime, cache_dir=None)
+    results['controls'] = bench_controls(cam, args)
+    results['single'] = bench_single(cam, args)
+    results['live'] = bench_live(cam, args)
+    results['buffers'] = bench_buffers(cam, args)
+
+    report = {
+        'backend': 'hardware' if args.hardware else 'simulator',
+        'camera': cam.get_camera_name(),
+        'sdk_version': cam.get_sdk_version(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'arguments': {k: v for k, v in vars(args).items() \
+                      if k not in ('output', 'compare')},
+        'results': results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 #!/usr/bin/python
-import numpy as np
 from qhpyccd import qhyccd
 from astropy.io import fits
 
@@ -7,8 +6,10 @@ cam = qhyccd(gain=200, offset=20)
 print("Acquisition start!")
 cam.get_image()
 print("Acquisition end!")
-print(f"Image mean:   {np.mean(cam.image):.2f}")
-print(f"Image stddev: {np.std(cam.image):.2f}")
-hdu = fits.PrimaryHDU(cam.image)
+stats = cam.get_image_stats()
+print(f"Image mean:   {stats['mean']:.2f}")
+print(f"Image stddev: {stats['std']:.2f}")
+hdu = fits.PrimaryHDU(cam.image,
+    fits.Header.fromstring(cam.frame.metadata.to_header(cam.frame)))
 hdu.writeto('qhyccd1.fits', overwrite=True)
 
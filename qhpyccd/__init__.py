@@ -2,9 +2,41 @@
 Simplified Python wrapper for the QHYCCD cameras.
 (c) 2021 E.Bertin IAP/CNRS/SorbonneU
 """
-from _qhpyccd_cffi import ffi, lib
+import contextlib
+import logging
+import os
 import numpy as np
 import sys
+import threading
+import time
+
+# Select the SDK backend: the compiled QHYCCD SDK module (default),
+# or the simulated SDK with QHPYCCD_BACKEND=sim
+if os.environ.get('QHPYCCD_BACKEND', 'sdk').lower() == 'sim':
+    from .simulator import ffi, lib
+else:
+    try:
+        from _qhpyccd_cffi import ffi, lib
+    except ImportError:
+        ffi = lib = None
+
+from .frames import Frame, FrameRing
+from .stream import LiveStream, LiveCounters
+from .aio import AsyncQhyccd
+from .fitswriter import FitsCubeWriter
+from .group import CameraGroup
+from .coadd import FrameAccumulator, Stack
+from .stats import frame_stats, FrameStatistics
+from .binning import SoftwareBinning, bin_frame
+from .calibration import Calibration, CalibrationLibrary
+from .archive import ArchiveWriter, ArchiveReader
+from .metadata import FrameMetadata
+from .plan import ExposureSpec, ExposurePlan
+from .telemetry import TelemetrySampler, CoolerSettle
+from .profiling import CallProfile, InstrumentedSDK
+from . import capcache
+
+logger = logging.getLogger(__name__)
 
 CONTROL_CODES = (
 ('CONTROL_BRIGHTNESS', 0, 'Image brightness'),
@@ -78,6 +110,16 @@ CONTROL_CODES = (
 CONTROL_CODE_DICT = dict([(code[0], code[1]) for code in CONTROL_CODES])
 CONTROL_DESC_DICT = dict([(code[1], code[2]) for code in CONTROL_CODES])
 
+# Control parameters that change on their own: their values are never cached
+VOLATILE_CONTROLS = frozenset((
+'CONTROL_CURTEMP',
+'CONTROL_CURPWM',
+'IS_EXPOSING_DONE',
+'DDR_BUFFER_CAPACITY',
+'CAM_HUMIDITY',
+'CAM_PRESSURE'
+))
+
 ERROR_CODES = (
 ('QHYCCD_SUCCESS', 0x00000000, 'Camera works well'),
 ('QHYCCD_ERROR', 0xFFFFFFFF, 'Error'),
@@ -115,6 +157,11 @@ ERROR_DESC_DICT = dict([(code[1], code[2]) for code in ERROR_CODES])
 QHYCCD_STREAM_SINGLE = 0x00
 QHYCCD_STREAM_LIVE = 0x01
 
+# Static camera properties stored in the capability cache
+CACHED_CAPABILITIES = ('control_mask', 'chip_size', 'image_size',
+                       'pixel_size', 'bpp', 'overscan_limits',
+                       'effective_limits', 'read_modes')
+
 def check_status(status_code):
     """Examine return status code of function call
     and raise RunTimeError if appropriate
@@ -136,6 +183,198 @@ def check_status(status_code):
 
     return status_code
 
+def frame_layout(w, h, bpp, channels):
+    """Return the array shape and pixel type matching a frame geometry
+
+    Parameters
+    ----------
+    w, h : int
+        frame width and height in pixels
+    bpp : int
+        number of bits per pixel and channel
+    channels : int
+        number of channels
+
+    Returns
+    -------
+    shape : tuple
+        array shape: (h, w), or (h, w, channels) for multi-channel frames
+    dtype : numpy.dtype
+        pixel type: uint8 up to 8 bits per pixel, uint16 otherwise
+    """
+    shape = (int(h), int(w)) if channels <= 1 \
+            else (int(h), int(w), int(channels))
+    return shape, np.dtype(np.uint8 if bpp <= 8 else np.uint16)
+
+# The QHYCCD SDK resource and camera scan are shared by all camera objects
+_sdk_lock = threading.Lock()
+_sdk_nusers = 0
+_sdk_ncam = None
+
+def init_sdk_resource():
+    """Initialize the QHYCCD SDK resource
+
+    Initialize the QHYCCD SDK resource. The resource is reference-counted:
+    only the first call initializes it.
+    Raises RunTimeError in case of error
+    """
+    global _sdk_nusers
+    with _sdk_lock:
+        if _sdk_nusers == 0:
+            check_status(lib.InitQHYCCDResource())
+        _sdk_nusers += 1
+
+def release_sdk_resource():
+    """Release the QHYCCD SDK resource
+
+    Release the QHYCCD SDK resource once all its users have released it.
+    Raises RunTimeError in case of error
+    """
+    global _sdk_nusers, _sdk_ncam
+    with _sdk_lock:
+        if _sdk_nusers == 0:
+            return
+        _sdk_nusers -= 1
+        if _sdk_nusers == 0:
+            _sdk_ncam = None
+            check_status(lib.ReleaseQHYCCDResource())
+
+def scan_cameras(rescan=True):
+    """Scan for connected QHYCCD cameras
+
+    Scan for connected QHYCCD cameras, or return the result of the previous
+    scan. The SDK resource must be initialized.
+    Raises RunTimeError in case of error.
+
+    Parameters
+    ----------
+    rescan : boolean
+        scan even if a previous scan result is available (default)
+
+    Returns
+    -------
+    ncam : integer
+        number of connected cameras
+    """
+    global _sdk_ncam
+    with _sdk_lock:
+        if rescan or _sdk_ncam is None:
+            _sdk_ncam = check_status(lib.ScanQHYCCD())
+        return _sdk_ncam
+
+def get_camera_ids():
+    """Return the ids of the connected QHYCCD cameras
+
+    Return the ids of the cameras found by the last scan.
+    Raises RunTimeError in case of error.
+
+    Returns
+    -------
+    ids : list of strings
+        camera ids, in camera index order
+    """
+    ids = []
+    cam_id = ffi.new('char[32]')
+    for cam_no in range(scan_cameras(rescan=False)):
+        check_status(lib.GetQHYCCDId(cam_no, cam_id))
+        ids.append(ffi.string(cam_id).decode())
+    return ids
+
+def use_simulator(**kwargs):
+    """Switch to the simulated QHYCCD SDK
+
+    Replace the QHYCCD SDK backend with the simulated SDK for all camera
+    objects created afterwards (see qhpyccd.simulator).
+
+    Parameters
+    ----------
+    **kwargs
+        simulator parameters (see simulator.SimulatedSDK); if none are
+        given, the simulator is configured from environment variables
+
+    Returns
+    -------
+    sdk : simulator.SimulatedSDK
+        simulated SDK, e.g. for error injection
+    """
+    global ffi, lib, _sdk_nusers, _sdk_ncam
+    from . import simulator
+    _sdk_nusers = 0
+    _sdk_ncam = None
+    ffi = simulator.ffi
+    sdk = simulator.SimulatedSDK(**kwargs) if kwargs else simulator.lib
+    # Keep profiling the new backend
+    lib = InstrumentedSDK(sdk, lib.profiles) \
+          if isinstance(lib, InstrumentedSDK) else sdk
+    return sdk
+
+def enable_profiling(profile=None):
+    """Time all the calls to the QHYCCD SDK
+
+    Wrap the SDK backend with a timing proxy (see
+    profiling.InstrumentedSDK). Profiling is disabled by default, SDK calls
+    are then made directly, without overhead.
+
+    Parameters
+    ----------
+    profile : profiling.CallProfile or None
+        profile to fill (default: a new profile)
+
+    Returns
+    -------
+    profile : profiling.CallProfile
+        profile filled with the timings of the SDK calls
+    """
+    global lib
+    if profile is None:
+        profile = CallProfile()
+    if lib is None:
+        raise ImportError("QHYCCD SDK module _qhpyccd_cffi not found: " \
+                          "build it or set QHPYCCD_BACKEND=sim")
+    if not isinstance(lib, InstrumentedSDK):
+        lib = InstrumentedSDK(lib)
+    lib.profiles += (profile,)
+    return profile
+
+def disable_profiling(profile=None):
+    """Stop timing the calls to the QHYCCD SDK
+
+    The timing proxy is removed once no profile is attached anymore.
+
+    Parameters
+    ----------
+    profile : profiling.CallProfile or None
+        profile to detach (default: all profiles)
+    """
+    global lib
+    if not isinstance(lib, InstrumentedSDK):
+        return
+    if profile is None:
+        lib.profiles = ()
+    else:
+        lib.profiles = tuple(p for p in lib.profiles if p is not profile)
+    if not lib.profiles:
+        lib = lib.sdk
+
+@contextlib.contextmanager
+def profile_sdk():
+    """Context manager timing the QHYCCD SDK calls made in its block
+
+        with qhpyccd.profile_sdk() as profile:
+            cam.get_image()
+        print(profile.report())
+
+    Returns
+    -------
+    profile : profiling.CallProfile
+        profile of the SDK calls made in the block
+    """
+    profile = enable_profiling()
+    try:
+        yield profile
+    finally:
+        disable_profiling(profile)
+
 def error(status_string):
     """Return the error description that matches a status string
 
@@ -153,6 +392,31 @@ def error(status_string):
    
 class qhyccd(object):
     """Minimalistic wrapper object around the QHYCCD camera driver
+
+    Parameters
+    ----------
+    cam_no : int
+        camera index
+    usbtraffic : int
+        USB speed factor between 0 (fastest) and 100 (slowest)
+    gain : float
+        detector gain (in cB)
+    offset : int
+        detector offset
+    exptime : float
+        exposure time (in seconds)
+    region_start : int[2]
+        acquisition region start [startX, startY]
+    region_size : int[2]
+        acquisition region size [sizeX, sizeY] ([0,0]: full raster)
+    bin_size : int[2]
+        pixel binsize [sizeX, sizeY]
+    bit_depth : int
+        bit depth in bits
+    rescan : boolean
+        scan for cameras even if another camera object already did (default)
+    cache_dir : string or None
+        directory of the on-disk camera capability cache (None: no cache)
     """
                    
     def __init__(self,
@@ -164,79 +428,123 @@ class qhyccd(object):
                  region_start=[0,0],
                  region_size=[0,0],
                  bin_size=[1,1],
-                 bit_depth=16):
+                 bit_depth=16,
+                 rescan=True,
+                 cache_dir=capcache.CACHE_DIR):
 
+        if lib is None:
+            raise ImportError("QHYCCD SDK module _qhpyccd_cffi not found: " \
+                              "build it or set QHPYCCD_BACKEND=sim")
         lib.SetQHYCCDLogLevel(0)
-        print(f"Driver version: {self.get_sdk_version()}")
+        self._cache_dir = cache_dir
+        # Serializes SDK calls with background ones (telemetry); exposures
+        # are waited for without holding it
+        self._lock = threading.RLock()
+        # Set by cancel_exposure() to interrupt the wait for an exposure
+        self._cancelled = threading.Event()
+        self.telemetry = None
+        self._binner = None
+        self._statistics = None
+        # Frame metadata and live mode counters
+        self.frame = None
+        self.live_counters = LiveCounters()
+        self._seqno = 0
+        self._metadata = None
+        self._metadata_key = None
+        self._t_exposure = None
+        # Status messages are logged at debug level; versions and other
+        # read-backs are only queried when they are actually logged
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Driver version: {self.get_sdk_version()}")
         self.init_resource()
-        if self.scan_cameras() == 0:
+        if self.scan_cameras(rescan) == 0:
             raise RuntimeError(error('QHYCCD_ERROR_NO_DEVICE'))
         self.set_camera(cam_no)
-        print(f"QHYCCD camera found: {self.get_camera_name()}")
+        logger.debug(f"QHYCCD camera found: {self._cam_idstr}")
         self.open_camera()
-        print(f"Firmware version: {self.get_firmware_version()}")
+        if debug:
+            logger.debug(f"Firmware version: {self.get_firmware_version()}")
         if self.has_control('CAM_SINGLEFRAMEMODE') == False:
-            print("Error: Single-Frame mode not supported")
+            logger.error("Single-Frame mode not supported")
             raise KeyError(error('QHYCCD_ERROR_UNSUPPORTED'))
         self.set_stream_mode(mode='single')
-        print(f"Acquisition mode set to {self.get_stream_mode()}")
-        print("Initializing...", end='\r', flush=True)
         self.init_camera()
-        print(f"{self.get_camera_name()} initialized")
-        print("Color sensor" if self.has_control('CAM_COLOR') else "B/W sensor")
-        print(f"Max resolution: {self.get_image_size()[0]:d} x {self.get_image_size()[1]:d}")
-        print(f"Chip size: {self.get_chip_size()[0]:.2f}mm x {self.get_chip_size()[1]:.2f}mm")
-        print(f"Pixel size: {self.get_pixel_size()[0]:.2f}um x {self.get_pixel_size()[1]:.2f}um")
         self.set_usbtraffic(usbtraffic)
-        print(f"USBtraffic parameter: {self.get_usbtraffic()}")
         self.set_gain(gain)
-        print(f"Gain: {self.get_gain()} cB")
         self.set_offset(offset)
-        print(f"Offset: {self.get_offset()}")
         self.set_exptime(exptime)
-        print(f"Exposure time: {self.get_exptime():.6f} s")
-        self.set_region(region_start,region_size)
-        print(f"Acquisition region: {self.get_region()[0][0]}-" + \
-              f"{self.get_region()[0][0] + self.get_region()[1][0]} x " + \
-              f"{self.get_region()[0][1]}-" + \
-              f"{self.get_region()[0][1] + self.get_region()[1][1]}")
+        self.set_region(region_start, region_size)
         self.set_binsize(bin_size)
-        print(f"Binsize: {self.get_binsize()[0]} x {self.get_binsize()[1]}")
         self.set_bitdepth(bit_depth)
-        print(f"Bitdepth: {self.get_bitdepth()}")
+        if debug:
+            start, size = self.get_region()
+            image_size = self.get_image_size()
+            chip_size = self.get_chip_size()
+            pixel_size = self.get_pixel_size()
+            logger.debug(f"{self._cam_idstr} initialized in " \
+                         f"{self._stream_mode} mode")
+            logger.debug("Color sensor" if self.has_control('CAM_COLOR') \
+                         else "B/W sensor")
+            logger.debug(f"Max resolution: {image_size[0]:d} x " \
+                         f"{image_size[1]:d}")
+            logger.debug(f"Chip size: {chip_size[0]:.2f}mm x " \
+                         f"{chip_size[1]:.2f}mm")
+            logger.debug(f"Pixel size: {pixel_size[0]:.2f}um x " \
+                         f"{pixel_size[1]:.2f}um")
+            logger.debug(f"USBtraffic parameter: {self._usbtraffic}")
+            logger.debug(f"Gain: {self._gain} cB")
+            logger.debug(f"Offset: {self._offset}")
+            logger.debug(f"Exposure time: {self._exptime:.6f} s")
+            logger.debug(f"Acquisition region: {start[0]}-" \
+                         f"{start[0] + size[0]} x {start[1]}-" \
+                         f"{start[1] + size[1]}")
+            logger.debug(f"Binsize: {self._binsize[0]} x {self._binsize[1]}")
+            logger.debug(f"Bitdepth: {self._bitdepth}")
 
     def init_resource(self):
         """Initialize QHYCCD SDK resource
 
-        Initialize the QHYCCD SDK resource
+        Initialize the QHYCCD SDK resource, which is shared with the other
+        camera objects.
         Raises RunTimeError in case of error
         """
-        check_status(lib.InitQHYCCDResource())
+        if not hasattr(self, '_resource_init'):
+            init_sdk_resource()
+            self._resource_init = True
         return self
 
     def release_resource(self):
         """Release QHYCCD SDK resource
 
-        Release the QHYCCD SDK resource
+        Release the QHYCCD SDK resource; it is actually released with the
+        last camera object using it.
         Raises RunTimeError in case of error
         """
-        check_status(lib.ReleaseQHYCCDResource())
+        if hasattr(self, '_resource_init'):
+            del self._resource_init
+            release_sdk_resource()
         return self
 
     ################################# Camera ##################################
 
-    def scan_cameras(self):
+    def scan_cameras(self, rescan=True):
         """Scan for connected QHYCCD cameras
 
         Update the number of connected QHYCCD cameras.
         Raises RunTimeError in case of error.
 
+        Parameters
+        ----------
+        rescan : boolean
+            scan even if another camera object already did (default)
+
         Returns
         -------
         ncam : integer
             number of connected cameras
         """
-        self._ncam = check_status(lib.ScanQHYCCD())
+        self._ncam = scan_cameras(rescan)
         return self._ncam
 
     def set_camera(self, cam_no):
@@ -283,6 +591,8 @@ class qhyccd(object):
         self._cam_handle = lib.OpenQHYCCD(self._cam_id)
         if ffi.cast('uintptr_t', self._cam_handle) == 0:
             raise RuntimeError(error('QHYCCD_ERROR_ERROR_OPENCAM'))
+        if not self.load_capabilities():
+            self.probe_controls()
         return self
 
     def close_camera(self):
@@ -294,6 +604,24 @@ class qhyccd(object):
         if hasattr(self, '_cam_handle'):
             check_status(lib.CloseQHYCCD(self._cam_handle))
             del self._cam_handle
+        self._control_mask = None
+        self._control_cache = {}
+        self._mem_length = 0
+        return self
+
+    def close(self):
+        """Close the current camera and release the SDK resource
+
+        Stop the telemetry sampler, cancel any exposure in progress, close
+        the current QHYCCD camera and release the SDK resource. Closing a
+        camera more than once has no effect.
+        Raises RunTimeError in case of error.
+        """
+        self.stop_telemetry()
+        if hasattr(self, '_cam_handle') and hasattr(self, '_region_set'):
+            self.cancel_exposure()
+        self.close_camera()
+        self.release_resource()
         return self
 
     def init_camera(self):
@@ -307,41 +635,398 @@ class qhyccd(object):
             raise RuntimeError(error('QHYCCD_ERROR'))
 
         check_status(lib.InitQHYCCD(self._cam_handle))
+        # Control parameters may have been reset
+        self.invalidate_controls()
+        if getattr(self, '_cache_dir', None) \
+                and not getattr(self, '_capabilities_loaded', False):
+            self.save_capabilities()
+        return self
+
+    ######################### Capability cache ################################
+
+    def load_capabilities(self):
+        """Load the static properties of the current camera from the cache
+
+        Load the capability bitmap, chip information, overscan and effective
+        areas and readout modes saved for the same camera ID, firmware and
+        SDK versions, if any.
+
+        Returns
+        -------
+        flag : boolean
+            whether the properties were found in the cache
+        """
+        self._capabilities_loaded = False
+        if not getattr(self, '_cache_dir', None):
+            return False
+        capabilities = capcache.load_capabilities(self._cache_dir,
+            self._cam_idstr, self.get_firmware_version(),
+            self.get_sdk_version())
+        if capabilities is None \
+                or any(key not in capabilities \
+                       for key in CACHED_CAPABILITIES):
+            return False
+        for key in CACHED_CAPABILITIES:
+            setattr(self, '_' + key, capabilities[key])
+        self._control_cache = {}
+        self._capabilities_loaded = True
+        logger.debug(f"Capabilities of {self._cam_idstr} loaded from cache")
+        return True
+
+    def save_capabilities(self):
+        """Save the static properties of the current camera to the cache
+
+        Query the chip information, overscan and effective areas and
+        readout modes of the initialized camera, and save them with the
+        capability bitmap. Failing to write the cache is not an error.
+        """
+        if not getattr(self, '_cache_dir', None):
+            return self
+        self.query_chip_info()
+        self.query_overscan_area()
+        self.query_effective_area()
+        self.query_read_modes()
+        capabilities = {key: getattr(self, '_' + key) \
+                        for key in CACHED_CAPABILITIES}
+        try:
+            capcache.save_capabilities(self._cache_dir, self._cam_idstr,
+                self.get_firmware_version(), self.get_sdk_version(),
+                capabilities)
+        except OSError as e:
+            logger.warning(f"Cannot write camera capability cache: {e}")
         return self
 
     ############################## Acquisition ################################
-    def get_image(self):
+    def get_image(self, out=None):
         """Acquire an image with the current QHYCCD camera
         
         Acquire an image with the current QHYCCD camera.
+        Raises RunTimeError in case of error or if the camera is not open,
+        and TypeError or ValueError if out is not a suitable buffer (no
+        exposure is then started).
+
+        Parameters
+        ----------
+        out : writable buffer
+            optional C-contiguous buffer (e.g. a numpy.memmap slice of a raw
+            data cube) the SDK writes the frame to directly, instead of the
+            internal image buffer. It must hold at least the expected frame
+            size (see get_frame_layout()). Pixels are stored in native byte
+            order (FITS data units must be byte-swapped in place).
+
+        Sets attributes
+        ---------------
+        image : numpy.ndarray
+            acquired frame (a view of out if provided)
+        frame : Frame
+            frame metadata (sequence number, host times and SDK layout),
+            with image as data
+        """
+        if not hasattr(self, '_cam_handle'):
+            print("Error: camera is not open")
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
+        if not hasattr(self, 'image'):
+            print("Error: Acquisition region has not been set")
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
+        # Check the buffer before exposing, so that a bad one does not leave
+        # an exposure running
+        data = self.imageData if out is None else self._get_out_data(out)
+        self.start_exposure()
+        return self._read_image(data, out)
+
+    def start_exposure(self):
+        """Start an exposure with the current QHYCCD camera
+        
+        Start a single frame exposure with the current QHYCCD camera; the
+        frame is then read with read_image().
         Raises RunTimeError in case of error or if the camera is not open.
         """
         if not hasattr(self, '_cam_handle'):
             print("Error: camera is not open")
             raise RuntimeError(error('QHYCCD_ERROR'))
 
+        with self._lock:
+            self._cancelled.clear()
+            self._t_exposure = time.time()
+            check_status(lib.ExpQHYCCDSingleFrame(self._cam_handle))
+        return self
+
+    def _wait_exposure(self, t_start):
+        """Wait for the end of an exposure without holding the camera lock
+
+        The frame read that follows only holds the lock during the readout,
+        so that background SDK calls (telemetry) may run during exposures.
+        The wait is interrupted by cancel_exposure().
+
+        Parameters
+        ----------
+        t_start : float or None
+            host time just before the exposure was started, if known
+        """
+        if t_start is None:
+            return self
+        delay = t_start + self.get_exptime() - time.time()
+        if delay > 0.0:
+            self._cancelled.wait(delay)
+        return self
+
+    def read_image(self, out=None):
+        """Read the image exposed with the current QHYCCD camera
+        
+        Wait for the end of the exposure started with start_exposure() and
+        read the frame out.
+        Raises RunTimeError in case of error or if the camera is not open,
+        and TypeError or ValueError if out is not a suitable buffer (the
+        exposure may then still be read).
+
+        Parameters
+        ----------
+        out : writable buffer
+            optional buffer the SDK writes the frame to (see get_image())
+
+        Sets attributes
+        ---------------
+        image : numpy.ndarray
+            acquired frame (a view of out if provided)
+        frame : Frame
+            frame metadata, with t_start the host time just before the
+            exposure was started, and image as data
+        """
+        if not hasattr(self, '_cam_handle'):
+            print("Error: camera is not open")
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
         if not hasattr(self, 'image'):
             print("Error: Acquisition region has not been set")
             raise RuntimeError(error('QHYCCD_ERROR'))
 
-        check_status(lib.ExpQHYCCDSingleFrame(self._cam_handle))
-        #memsize = lib.GetQHYCCDMemLength(self._cam_handle)
+        data = self.imageData if out is None else self._get_out_data(out)
+        return self._read_image(data, out)
+
+    def _read_image(self, data, out=None):
+        """Read the exposed frame into a checked buffer (see read_image())
+
+        Parameters
+        ----------
+        data : cdata
+            pointer to the frame buffer (see _get_out_data())
+        out : writable buffer
+            user-supplied buffer data points to, if any
+        """
+        if self._binner is not None:
+            # Full resolution frames go to the image buffer before binning
+            data = self.imageData
         roi_size = ffi.new('uint32_t[2]')
         bpp = ffi.new('uint32_t *')
         channels = ffi.new('uint32_t *')
-        self.imageData = ffi.cast("uint8_t *", self.image.ctypes.data)
-        check_status(lib.GetQHYCCDSingleFrame(self._cam_handle, \
-                                              roi_size, roi_size + 1, \
-                                              bpp, \
-                                              channels, \
-                                              self.imageData))
+        self._wait_exposure(self._t_exposure)
+        with self._lock:
+            check_status(lib.GetQHYCCDSingleFrame(self._cam_handle, \
+                                                  roi_size, roi_size + 1, \
+                                                  bpp, \
+                                                  channels, \
+                                                  data))
+            t_end = time.time()
+            seqno = self._next_seqno()
+        self._update_image(roi_size[0], roi_size[1], bpp[0], channels[0], out)
+        self.frame = Frame(None, 0, self.image, self._t_exposure, t_end,
+                           seqno, (roi_size[0], roi_size[1], bpp[0],
+                                   channels[0]))
+        self.frame.metadata = self.get_metadata()
+        if self._statistics is not None:
+            self._statistics(self.frame)
 
         return self
 
+    def sequence(self, nframes, nbuffers=2, autorelease=True):
+        """Acquire a sequence of images with pipelined exposures
+        
+        Generator that acquires nframes images in single frame mode with
+        the current QHYCCD camera. Each frame is read into a spare buffer of
+        a ring of preallocated buffers, and the next exposure is triggered
+        right after readout, before the frame is handed to the caller, so
+        that processing frame k overlaps with the exposure of frame k+1.
+        Closing the generator early cancels the pending exposure.
+        Raises RunTimeError in case of error, if the camera is not open, or
+        if all the buffers are in use.
+
+        Parameters
+        ----------
+        nframes : int
+            number of images to acquire
+        nbuffers : int
+            number of preallocated frame buffers
+        autorelease : boolean
+            release each frame automatically when the next one is requested
+            (default); otherwise frames must be released by the caller
+
+        Yields
+        ------
+        frame : Frame
+            zero-copy view of the buffer holding the frame, with t_start the
+            host time just before its exposure was started
+        """
+        if not hasattr(self, '_cam_handle'):
+            print("Error: camera is not open")
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
+        if not hasattr(self, 'image'):
+            print("Error: Acquisition region has not been set")
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
+        ring = FrameRing(nbuffers, self.image.shape, self.image.dtype,
+                         self._image_buffer.nbytes)
+        ring_data = [ffi.cast("uint8_t *", buf.ctypes.data) \
+                     for buf in ring.buffers]
+        roi_size = ffi.new('uint32_t[2]')
+        bpp = ffi.new('uint32_t *')
+        channels = ffi.new('uint32_t *')
+
+        if nframes < 1:
+            return
+        t_start = self.start_exposure()._t_exposure
+        exposing = True
+        try:
+            for i in range(nframes):
+                slot = ring.acquire()
+                if slot is None:
+                    print("Error: no free sequence frame buffer")
+                    raise RuntimeError(error('QHYCCD_ERROR'))
+                try:
+                    self._wait_exposure(t_start)
+                    with self._lock:
+                        check_status(lib.GetQHYCCDSingleFrame( \
+                                     self._cam_handle, \
+                                     roi_size, roi_size + 1, \
+                                     bpp, \
+                                     channels, \
+                                     ring_data[slot]))
+                        t_end = time.time()
+                        seqno = self._next_seqno()
+                except BaseException:
+                    ring.release(slot)
+                    raise
+                exposing = False
+                layout = (roi_size[0], roi_size[1], bpp[0], channels[0])
+                frame = Frame(ring, slot, ring.view(slot, *frame_layout( \
+                              *layout)), t_start, t_end, seqno, layout)
+                frame.metadata = self.get_metadata()
+                # Start the next exposure before handing out the frame
+                if i < nframes - 1:
+                    t_start = self.start_exposure()._t_exposure
+                    exposing = True
+                if self._binner is not None:
+                    frame = self._binner(frame)
+                if self._statistics is not None:
+                    self._statistics(frame)
+                yield frame
+                if autorelease:
+                    frame.release()
+        finally:
+            if exposing:
+                lib.CancelQHYCCDExposingAndReadout(self._cam_handle)
+
+    def set_frame_statistics(self, stride=1, roi=None, saturation=None,
+                             nbins=256, enable=True):
+        """Compute statistics of every acquired frame
+
+        Statistics are computed right after every single frame, sequence
+        and live frame acquisition, and attached to the frame as its stats
+        attribute (see stats.FrameStatistics).
+
+        Parameters
+        ----------
+        stride : int
+            pixel subsampling step along both axes
+        roi : (int[2], int[2]) or None
+            region of interest ([startX, startY], [sizeX, sizeY])
+        saturation : int or None
+            lowest saturated pixel value (default: largest possible value)
+        nbins : int or None
+            number of histogram bins, a power of 2 (None: one bin per value)
+        enable : boolean
+            compute statistics (default); False stops computing them
+        """
+        self._statistics = FrameStatistics(stride, roi, saturation, nbins) \
+                           if enable else None
+        return self
+
+    def get_image_stats(self, stride=1, roi=None, saturation=None, nbins=256):
+        """Compute the statistics of the last acquired image
+
+        The image is read only once (see stats.frame_stats()). The
+        statistics are also attached to the last frame as its stats
+        attribute.
+
+        Parameters
+        ----------
+        stride : int
+            pixel subsampling step along both axes
+        roi : (int[2], int[2]) or None
+            region of interest ([startX, startY], [sizeX, sizeY])
+        saturation : int or None
+            lowest saturated pixel value (default: largest possible value)
+        nbins : int or None
+            number of histogram bins, a power of 2 (None: one bin per value)
+
+        Returns
+        -------
+        stats : dict
+            'npix', 'mean', 'std', 'min', 'max', 'nsaturated' and
+            'histogram'
+        """
+        if not hasattr(self, 'image'):
+            print("Error: Acquisition region has not been set")
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
+        stats = frame_stats(self.image, stride, roi, saturation, nbins)
+        if self.frame is not None and self.frame.data is self.image:
+            self.frame.stats = stats
+        return stats
+
+    def cancel_exposure(self):
+        """Cancel the ongoing exposure and readout of the current camera
+
+        Abort the ongoing exposure and readout of the current QHYCCD camera;
+        a pending get_image() call then fails.
+        Raises RunTimeError in case of error or if the camera is not open.
+        """
+        if not hasattr(self, '_cam_handle'):
+            print("Error: camera is not open")
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
+        self._cancelled.set()
+        with self._lock:
+            check_status(lib.CancelQHYCCDExposingAndReadout(self._cam_handle))
+        return self
+
 
     ########################## Control parameters #############################
 
-    def has_control(self, control):
+    def probe_controls(self):
+        """Probe the control parameters available in the current camera
+
+        Check every control parameter in CONTROL_CODES once and store the
+        result as a capability bitmap, which is then used by has_control().
+        The cache of control parameter values is cleared.
+
+        Sets attributes
+        ---------------
+        _control_mask : int
+            capability bitmap, with bit n set if control code n is available
+        """
+        mask = 0
+        for name, code, desc in CONTROL_CODES:
+            if lib.IsQHYCCDControlAvailable(self._cam_handle, code) \
+                    == ERROR_CODE_DICT['QHYCCD_SUCCESS']:
+                mask |= 1 << code
+        self._control_mask = mask
+        self._control_cache = {}
+        return self
+
+    def has_control(self, control, refresh=False):
         """Check if the current camera has a given control parameter
         
         Check if the current camera has a given control parameter.
@@ -350,21 +1035,26 @@ class qhyccd(object):
         ----------
         control: string
             control parameter code string
+        refresh: boolean
+            query the camera instead of the capability bitmap
 
         Returns
         -------
         flag : boolean
             whether the control exists for the current camera
         """
-        ret = lib.IsQHYCCDControlAvailable(self._cam_handle,
-        	CONTROL_CODE_DICT[control])
-        flag = (ret == ERROR_CODE_DICT['QHYCCD_SUCCESS'])
-        return flag
+        code = CONTROL_CODE_DICT[control]
+        if refresh or getattr(self, '_control_mask', None) is None:
+            ret = lib.IsQHYCCDControlAvailable(self._cam_handle, code)
+            return ret == ERROR_CODE_DICT['QHYCCD_SUCCESS']
+        return bool(self._control_mask >> code & 1)
 
-    def set_control(self, control, value):
+    def set_control(self, control, value, refresh=False):
         """Set a given control parameter in the current camera
         
-        Set a control parameter in the current QHYCCD camera.
+        Set a control parameter in the current QHYCCD camera. The value is
+        written through the control parameter cache; nothing is sent to the
+        camera if the cached value is already the requested one.
         Raises RunTimeError in case of error.
 
         Parameters
@@ -373,29 +1063,67 @@ class qhyccd(object):
             control parameter code string
         value: float
             control parameter value
+        refresh: boolean
+            set the value even if it is cached
         """
-        check_status(lib.SetQHYCCDParam(self._cam_handle, \
-                     CONTROL_CODE_DICT[control], float(value)))
+        cache = self._control_cache
+        if not refresh and cache.get(control) == float(value):
+            return self
+        cache.pop(control, None)
+        with self._lock:
+            check_status(lib.SetQHYCCDParam(self._cam_handle, \
+                         CONTROL_CODE_DICT[control], float(value)))
+        if control not in VOLATILE_CONTROLS:
+            cache[control] = float(value)
         return self
 
-    def query_control(self, control):
+    def query_control(self, control, refresh=False):
         """Query a given control parameter from the current camera
         
         Query a given control parameter from the current QHYCCD camera.
+        Values of settable controls are cached; controls listed in
+        VOLATILE_CONTROLS, such as the current temperature, are always
+        queried.
 
         Parameters
         ----------
         control : string
             control parameter code string
+        refresh: boolean
+            query the camera even if the value is cached
 
         Returns
         -------
         value: float
             control parameter value
         """
-        value = lib.GetQHYCCDParam(self._cam_handle, CONTROL_CODE_DICT[control])
-        
-        return float(value)
+        cache = self._control_cache
+        if not refresh and control in cache:
+            return cache[control]
+        with self._lock:
+            value = float(lib.GetQHYCCDParam(self._cam_handle,
+                                             CONTROL_CODE_DICT[control]))
+        if control not in VOLATILE_CONTROLS:
+            cache[control] = value
+        return value
+
+    def invalidate_controls(self, controls=None):
+        """Invalidate cached control parameter values
+
+        Must be called after a control parameter was changed by other means
+        than set_control(), e.g. by an auto-exposure mode or a camera reset.
+
+        Parameters
+        ----------
+        controls: string[] or None
+            control parameter code strings (default: all)
+        """
+        if controls is None:
+            self._control_cache.clear()
+        else:
+            for control in controls:
+                self._control_cache.pop(control, None)
+        return self
 
     ################################ USB speed ################################
 
@@ -603,9 +1331,16 @@ class qhyccd(object):
         _bitdepth : int
             Bit depth in bits
         """
-        check_status(lib.SetQHYCCDBitsMode(self._cam_handle, int(bitdepth)))
+        if bitdepth == getattr(self, '_bitdepth', None):
+            return self
+
+        with self._lock:
+            check_status(lib.SetQHYCCDBitsMode(self._cam_handle,
+                                               int(bitdepth)))
 
         self._bitdepth = bitdepth
+        if hasattr(self, '_region_set'):
+            self._alloc_image()
 
         return self
 
@@ -645,6 +1380,8 @@ class qhyccd(object):
             imode = 0x01
         else:
             raise KeyError(error('QHYCCD_ERROR_UNSUPPORTED'))
+        if mode == getattr(self, '_stream_mode', None):
+            return self
         check_status(lib.SetQHYCCDStreamMode(self._cam_handle, imode))
 
         self._stream_mode = mode
@@ -668,7 +1405,27 @@ class qhyccd(object):
 
         return  self._stream_mode
 
-    def begin_live(self):
+    def begin_live(self, nbuffers=0):
+        """Start live (video) acquisition with the current QHYCCD camera
+
+        Start live acquisition with the current QHYCCD camera.
+        Raises RunTimeError in case of error or if the camera is not open.
+
+        Parameters
+        ----------
+        nbuffers : int
+            number of preallocated frame buffers in the live ring.
+            0 (default): every frame is written into the shared image array.
+            N > 0: frames are written in turn into N reusable buffers and
+            returned by get_live_frame() as zero-copy Frame views.
+
+        Sets attributes
+        ---------------
+        _ring : FrameRing
+            live frame buffer ring (only if nbuffers > 0)
+        live_counters : LiveCounters
+            new counters of delivered and dropped live frames
+        """
         if not hasattr(self, '_cam_handle'):
             print("Error: camera is not open")
             raise RuntimeError(error('QHYCCD_ERROR'))
@@ -680,26 +1437,194 @@ class qhyccd(object):
         self.roi_size = ffi.new('uint32_t[2]')
         self.bpp = ffi.new('uint32_t *')
         self.channels = ffi.new('uint32_t *')
-        self.imageData = ffi.cast("uint8_t *", self.image.ctypes.data)
 
+        if nbuffers > 0:
+            self._ring = FrameRing(nbuffers, self.image.shape, self.image.dtype,
+                                   self._image_buffer.nbytes)
+            self._ring_data = [ffi.cast("uint8_t *", buf.ctypes.data) \
+                               for buf in self._ring.buffers]
+        elif hasattr(self, '_ring'):
+            del self._ring, self._ring_data
+
+        self.live_counters = LiveCounters()
         check_status(lib.BeginQHYCCDLive(self._cam_handle))
-        
+        return self
+
     def stop_live(self):
+        """Stop live (video) acquisition with the current QHYCCD camera
+
+        Stop live acquisition with the current QHYCCD camera.
+        Frames still held from the live ring remain valid.
+        Raises RunTimeError in case of error.
+        """
         check_status(lib.StopQHYCCDLive(self._cam_handle))
+        if hasattr(self, '_ring'):
+            del self._ring, self._ring_data
+        return self
 
-    def get_live_frame(self):
-        """Acquire an image with the current QHYCCD camera
+    def get_live_frame(self, out=None):
+        """Acquire a live frame with the current QHYCCD camera
         
-        Acquire an image with the current QHYCCD camera.
-        Raises RunTimeError in case of error or if the camera is not open.
+        Acquire a live frame with the current QHYCCD camera.
+        Raises RunTimeError in case of error, or if all the buffers of the
+        live ring are in use, and TypeError or ValueError if out is not a
+        suitable buffer.
+
+        Parameters
+        ----------
+        out : writable buffer
+            optional C-contiguous buffer the SDK writes the frame to directly
+            (see get_image()), bypassing the live ring and the image buffer
+
+        Returns
+        -------
+        frame : Frame or qhyccd
+            zero-copy view of the ring slot holding the frame if live mode
+            was started with buffers (to be released by the caller),
+            otherwise the camera object itself, with the frame in image and
+            its metadata in frame (see get_image())
         """
-        check_status(lib.GetQHYCCDLiveFrame(self._cam_handle,
-                                            self.roi_size, self.roi_size + 1,
-                                            self.bpp, \
-                                            self.channels, \
-                                            self.imageData))
+        if out is not None or not hasattr(self, '_ring'):
+            data = self.imageData if out is None else self._get_out_data(out)
+            if self._binner is not None:
+                data = self.imageData
+            with self._lock:
+                t_start = time.time()
+                check_status(lib.GetQHYCCDLiveFrame(self._cam_handle,
+                                                    self.roi_size,
+                                                    self.roi_size + 1,
+                                                    self.bpp, \
+                                                    self.channels, \
+                                                    data))
+                t_end = time.time()
+                seqno = self._next_seqno()
+            self.live_counters.update(t_end)
+            layout = (self.roi_size[0], self.roi_size[1],
+                      self.bpp[0], self.channels[0])
+            self._update_image(*layout, out)
+            self.frame = Frame(None, 0, self.image, t_start, t_end, seqno,
+                               layout)
+            self.frame.metadata = self.get_metadata(live=True)
+            if self._statistics is not None:
+                self._statistics(self.frame)
+            return self
+
+        if self._ring.get_nfree() == 0:
+            print("Error: no free live frame buffer")
+            raise RuntimeError(error('QHYCCD_ERROR'))
 
+        frame = self.poll_live_frame()
+        if frame is None:
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
+        return frame
+
+    def poll_live_frame(self, timeout=0.0):
+        """Acquire a live frame into the live ring, if one is ready
         
+        Acquire a live frame into a free slot of the live ring. Contrary to
+        get_live_frame(), no exception is raised if no frame is ready yet.
+        Raises RunTimeError in case of any other error or if live mode was
+        not started with buffers.
+
+        Parameters
+        ----------
+        timeout : float or None
+            how long to wait for a ring slot to be released (in seconds);
+            0 (default) returns immediately, None waits forever
+
+        Returns
+        -------
+        frame : Frame or None
+            zero-copy view of the ring slot holding the frame (to be released
+            by the caller), or None if no frame is ready or no slot is free
+        """
+        if not hasattr(self, '_ring'):
+            print("Error: live mode was not started with frame buffers")
+            raise RuntimeError(error('QHYCCD_ERROR'))
+
+        ring = self._ring
+        slot = ring.acquire(timeout)
+        if slot is None:
+            return None
+        try:
+            with self._lock:
+                t_start = time.time()
+                status = lib.GetQHYCCDLiveFrame(self._cam_handle,
+                                                self.roi_size,
+                                                self.roi_size + 1,
+                                                self.bpp, \
+                                                self.channels, \
+                                                self._ring_data[slot])
+                t_end = time.time()
+                # The SDK returns a generic error while the next frame is
+                # pending
+                if status == ERROR_CODE_DICT['QHYCCD_ERROR']:
+                    ring.release(slot)
+                    return None
+                check_status(status)
+                seqno = self._next_seqno()
+        except BaseException:
+            ring.release(slot)
+            raise
+
+        self.live_counters.update(t_end)
+        layout = (self.roi_size[0], self.roi_size[1],
+                  self.bpp[0], self.channels[0])
+        frame = Frame(ring, slot, ring.view(slot, *frame_layout(*layout)),
+                      t_start, t_end, seqno, layout)
+        frame.metadata = self.get_metadata(live=True)
+        if self._binner is not None:
+            frame = self._binner(frame)
+        if self._statistics is not None:
+            self._statistics(frame)
+        return frame
+
+    def start_stream(self, nbuffers=8, queue_size=4, overflow='block',
+                     poll_interval=0.0005, stages=()):
+        """Start streaming live frames from a background acquisition thread
+
+        Switch the camera to live mode and start a reader thread that owns
+        the live frame loop (the SDK calls run with the GIL released) and
+        pushes filled ring buffers into a bounded queue.
+        Raises RunTimeError in case of error.
+
+        Parameters
+        ----------
+        nbuffers : int
+            number of preallocated frame buffers in the live ring
+        queue_size : int
+            maximum number of frames waiting in the queue
+        overflow : string
+            what to do when the queue is full:
+            'block': wait for the consumer (default)
+            'drop-oldest': discard the oldest queued frame
+            'drop-newest': discard the frame just acquired
+        poll_interval : float
+            delay between two attempts to read a frame that is not ready yet
+            (in seconds)
+        stages : sequence of callables
+            processing stages applied to every frame by the reader thread,
+            e.g. a FrameAccumulator (see LiveStream)
+
+        Returns
+        -------
+        stream : LiveStream
+            running stream; iterate over it to get frames, and release each
+            frame when done with it. Stopping the stream sets the camera
+            back to its previous stream mode.
+        """
+        if nbuffers <= queue_size:
+            print("Error: the live ring must have more buffers than the queue")
+            raise RuntimeError(error('QHYCCD_ERROR_SETPARAMS'))
+
+        mode = self.get_stream_mode()
+        if mode != 'live':
+            self.set_stream_mode('live')
+        self.begin_live(nbuffers)
+        return LiveStream(self, queue_size, overflow, poll_interval,
+                          restore_mode=mode, stages=stages).start()
+
     ############################ Detector geometry ############################
 
     def set_region(self, start, size):
@@ -725,18 +1650,23 @@ class qhyccd(object):
         if size[0]*size[1] == 0:
             size = self.get_image_size()
 
-        # Need this if region updated
-        if hasattr(self, '_region_set'):
-            check_status(lib.CancelQHYCCDExposingAndReadout(self._cam_handle))
+        if hasattr(self, '_region_set') and list(start) == self._region_start \
+                and list(size) == self._region_size:
+            return self
 
-        check_status(lib.SetQHYCCDResolution(self._cam_handle, \
-                     start[0], start[1], size[0], size[1]))
+        with self._lock:
+            # Need this if region updated
+            if hasattr(self, '_region_set'):
+                check_status(lib.CancelQHYCCDExposingAndReadout( \
+                             self._cam_handle))
 
-        self._region_start = start.copy()
-        self._region_size = size.copy()
+            check_status(lib.SetQHYCCDResolution(self._cam_handle, \
+                         start[0], start[1], size[0], size[1]))
+
+        self._region_start = list(start)
+        self._region_size = list(size)
         self._region_set = True
-        
-        self.image = np.zeros([self._region_size[1], self._region_size[0]], dtype=np.uint16)
+        self._alloc_image()
 
         return self
 
@@ -770,7 +1700,9 @@ class qhyccd(object):
     def set_binsize(self, binsize):
         """Set the pixel binsize
         
-        Set the camera pixel binsize.
+        Set the camera pixel binsize. Binning factors not supported by the
+        camera hardware are applied in software (summing pixels, clipped
+        to the pixel type range) to all the acquired frames.
         Raises RuntimeError in case of error.
         
         Parameters
@@ -783,11 +1715,39 @@ class qhyccd(object):
         _binsize : int[2]
             [sizeX, sizeY]
         """
-        check_status(lib.SetQHYCCDBinMode(self._cam_handle, \
-                     binsize[0], binsize[1]))
+        if list(binsize) == getattr(self, '_binsize', None):
+            return self
+
+        self._set_bin_mode(binsize)
+        self._binsize = list(binsize)
+        if hasattr(self, '_region_set'):
+            self._alloc_image()
+
+        return self
 
-        self._binsize = binsize.copy()
+    def _set_bin_mode(self, binsize):
+        """Select hardware or software binning
 
+        Sets attributes
+        ---------------
+        _hw_binsize : int[2]
+            binning applied by the camera
+        _binner : SoftwareBinning or None
+            software binning stage, if the hardware does not support binsize
+        """
+        if binsize[0] == binsize[1] and (binsize[0] == 1 \
+                or (binsize[0] <= 4 \
+                    and self.has_control(f'CAM_BIN{binsize[0]}X{binsize[0]}MODE'))):
+            hw_binsize = list(binsize)
+            self._binner = None
+        else:
+            hw_binsize = [1, 1]
+            self._binner = SoftwareBinning(binsize)
+        if hw_binsize != getattr(self, '_hw_binsize', None):
+            with self._lock:
+                check_status(lib.SetQHYCCDBinMode(self._cam_handle, \
+                             hw_binsize[0], hw_binsize[1]))
+            self._hw_binsize = hw_binsize
         return self
 
     def get_binsize(self):
@@ -801,10 +1761,158 @@ class qhyccd(object):
             [sizeX, sizeY]
         """
         if not hasattr(self, '_binsize'):
-            self._binsize = [1, 1]
+            return [1, 1]
 
         return self._binsize.copy()
 
+    def get_channels(self):
+        """Get the number of image channels
+        
+        Get the number of image channels of the current camera.
+        
+        Returns
+        ---------------
+        channels : int
+            number of channels (1 for raw or monochrome frames)
+        """
+        if not hasattr(self, '_channels'):
+            if self.has_control('CONTROL_CHANNELS'):
+                self._channels = int(self.query_control('CONTROL_CHANNELS'))
+            else:
+                self._channels = 1
+
+        return self._channels
+
+    def get_frame_layout(self):
+        """Get the expected frame array layout
+        
+        Get the shape and pixel type of frames acquired with the current
+        region, binning, bit depth and number of channels.
+        
+        Returns
+        ---------------
+        shape : tuple
+            array shape: (h, w), or (h, w, channels) for multi-channel frames
+        dtype : numpy.dtype
+            pixel type
+        """
+        start, size = self.get_region()
+        binsize = self.get_binsize()
+        bitdepth = self._bitdepth if hasattr(self, '_bitdepth') else 16
+        return frame_layout(size[0] // binsize[0], size[1] // binsize[1], \
+                            bitdepth, self.get_channels())
+
+    def _alloc_image(self):
+        """Allocate the image buffer for the current frame layout
+
+        The buffer is large enough for both the expected frame layout and
+        the memory length required by the SDK; the image array is a view of
+        it with the expected frame layout. Pages beyond the frame size are
+        never touched.
+        Raises RunTimeError in case of error.
+
+        Sets attributes
+        ---------------
+        image : numpy.ndarray
+            image array
+        imageData : cdata
+            pointer to the image buffer
+        """
+        shape, dtype = self.get_frame_layout()
+        if not getattr(self, '_mem_length', 0):
+            self._mem_length = check_status(
+                lib.GetQHYCCDMemLength(self._cam_handle))
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, self._mem_length)
+        if not hasattr(self, '_image_buffer') \
+                or self._image_buffer.nbytes < nbytes:
+            self._image_buffer = np.zeros(nbytes, dtype=np.uint8)
+            self.imageData = ffi.cast("uint8_t *", \
+                                      self._image_buffer.ctypes.data)
+        self.image = self._image_buffer[:int(np.prod(shape)) \
+                                         * dtype.itemsize] \
+                         .view(dtype).reshape(shape)
+        return self
+
+    def _get_out_data(self, out):
+        """Return a pointer to a user-supplied frame buffer
+
+        Raises TypeError if the buffer is not writable nor contiguous, and
+        ValueError if it is too small for the expected frame.
+
+        Parameters
+        ----------
+        out : writable buffer
+            C-contiguous frame buffer
+
+        Returns
+        -------
+        data : cdata
+            pointer to the buffer
+        """
+        shape, dtype = self.get_frame_layout()
+        try:
+            data = ffi.from_buffer('uint8_t[]', out, require_writable=True)
+        except (TypeError, ValueError, BufferError) as e:
+            raise TypeError(f'invalid output buffer: {e}') from None
+
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if len(data) < nbytes:
+            raise ValueError(f'output buffer too small for the frame: ' \
+                             f'{len(data)} < {nbytes} bytes')
+
+        return data
+
+    def _next_seqno(self):
+        """Return the sequence number of a new frame
+
+        Must be called with the camera lock held.
+        """
+        seqno = self._seqno
+        self._seqno += 1
+        return seqno
+
+    def _update_image(self, w, h, bpp, channels, out=None):
+        """Match the image array with the frame geometry reported by the SDK
+
+        Parameters
+        ----------
+        w, h : int
+            frame width and height in pixels
+        bpp : int
+            number of bits per pixel and channel
+        channels : int
+            number of channels
+        out : writable buffer
+            user-supplied buffer holding the frame, if any
+        """
+        shape, dtype = frame_layout(w, h, bpp, channels)
+        if self._binner is not None:
+            raw = self._image_buffer[:int(np.prod(shape)) * dtype.itemsize] \
+                      .view(dtype).reshape(shape)
+            shape, dtype = self._binner.get_layout(shape, dtype)
+            if out is not None:
+                image = np.frombuffer(out, dtype=np.uint8, \
+                                      count=int(np.prod(shape)) \
+                                            * dtype.itemsize) \
+                            .view(dtype).reshape(shape)
+            else:
+                image = getattr(self, '_binned_image', None)
+                if image is None or image.shape != shape \
+                        or image.dtype != dtype:
+                    image = self._binned_image = np.empty(shape, dtype)
+            self.image = self._binner.bin(raw, image)
+        elif out is not None:
+            self.image = np.frombuffer(out, dtype=np.uint8, \
+                                       count=int(np.prod(shape)) \
+                                             * dtype.itemsize) \
+                             .view(dtype).reshape(shape)
+        elif self.image.base is not self._image_buffer \
+                or self.image.shape != shape or self.image.dtype != dtype:
+            self.image = self._image_buffer[:int(np.prod(shape)) \
+                                             * dtype.itemsize] \
+                             .view(dtype).reshape(shape)
+        return self
+
     def query_chip_info(self):
         """Query information from the current camera
         
@@ -826,7 +1934,7 @@ class qhyccd(object):
         image_size = ffi.new('uint32_t[2]')
         pixel_size = ffi.new('double[2]')
         bpp = ffi.new('uint32_t *')
-        
+
         check_status(lib.GetQHYCCDChipInfo(self._cam_handle, \
                      chip_size, chip_size + 1, \
                      image_size, image_size + 1, \
@@ -909,7 +2017,7 @@ class qhyccd(object):
             [startX, startY, sizeX, sizeY]
         """
         if not hasattr(self, '_overscan_limits'):
-            self.query_oversan_area()
+            self.query_overscan_area()
         return self._overscan_limits.copy()
 
     def query_effective_area(self):
@@ -924,7 +2032,7 @@ class qhyccd(object):
             [startX, startY, sizeX, sizeY]
         """
         limits = ffi.new('uint32_t[4]')
-        check_status(lib.GetQHYCCDOverScanArea(self._cam_handle, \
+        check_status(lib.GetQHYCCDEffectiveArea(self._cam_handle, \
                      limits, limits + 1, limits + 2, limits + 3))
         self._effective_limits = list(limits)
         return self
@@ -989,6 +2097,80 @@ class qhyccd(object):
             raise KeyError(error('QHYCCD_ERROR_UNSUPPORTED'))
 
 
+    def start_telemetry(self, rate=1.0, nsamples=3600):
+        """Start sampling the temperature and cooling in the background
+
+        A running sampler is replaced.
+
+        Parameters
+        ----------
+        rate : float
+            sampling rate (in Hz)
+        nsamples : int
+            number of samples kept
+
+        Returns
+        -------
+        sampler : TelemetrySampler
+            sampler, also available as the telemetry attribute
+        """
+        self.stop_telemetry()
+        self.telemetry = TelemetrySampler(self, rate, nsamples).start()
+        return self.telemetry
+
+    def stop_telemetry(self):
+        """Stop the background telemetry sampler, if any
+        """
+        if getattr(self, 'telemetry', None) is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+        return self
+
+    def wait_for_cooler(self, tolerance=0.5, max_slope=0.002,
+                        pwm_tolerance=5.0, window=30.0, timeout=None,
+                        callback=None):
+        """Monitor the sensor temperature until it settles at the target
+
+        Telemetry sampling is started at 1 Hz if it is not running. The
+        returned monitor does not block: use its wait() method or event,
+        await it, or provide a callback (see CoolerSettle).
+        Raises RuntimeError if the camera has no cooler, and ValueError if
+        the running sampler does not keep window seconds of samples.
+
+        Parameters
+        ----------
+        tolerance : float
+            maximum deviation of the temperature from the target (in °C)
+        max_slope : float
+            maximum absolute temperature slope (in °C/s)
+        pwm_tolerance : float
+            maximum standard deviation of the cooling power (0-255 scale)
+        window : float
+            time span over which the criteria must be met (in seconds)
+        timeout : float or None
+            give up after this time (in seconds); None waits forever
+        callback : callable or None
+            function called with the settled flag once done
+
+        Returns
+        -------
+        settle : CoolerSettle
+            settle monitor
+        """
+        if not self.has_control('CONTROL_CURTEMP'):
+            print("Error: curtemp not supported")
+            raise KeyError(error('QHYCCD_ERROR_UNSUPPORTED'))
+
+        # The temperature would never settle without a target
+        if not self.has_control('CONTROL_COOLER'):
+            raise RuntimeError('cooling not supported')
+
+        if self.telemetry is None or not self.telemetry.is_running():
+            self.start_telemetry(rate=1.0, nsamples=max(3600, \
+                                 int(2.0 * window) + 1))
+        return CoolerSettle(self.telemetry, tolerance, max_slope,
+                            pwm_tolerance, window, timeout, callback)
+
     def set_target_temperature(self, temp, wait=False):
         """Set the target temperature of the cooling system
         
@@ -996,6 +2178,10 @@ class qhyccd(object):
         ----------
         temp: float
               target temperature (in °C)
+        wait: boolean or float
+              block until the temperature has settled at the target
+              (see wait_for_cooler()); a number sets a timeout (in
+              seconds), after which RunTimeError is raised
         """
         if self.has_control('CONTROL_COOLER'):
             self.set_control('CONTROL_COOLER', temp)
@@ -1003,8 +2189,53 @@ class qhyccd(object):
             print("Error: cooling not supported")
             raise KeyError(error('QHYCCD_ERROR_UNSUPPORTED'))
 
+        if wait:
+            timeout = None if wait is True else float(wait)
+            if not self.wait_for_cooler(timeout=timeout).wait(timeout):
+                print("Error: temperature did not settle at the target")
+                raise RuntimeError(error('QHYCCD_ERROR'))
+
+        return self
+
     ############################## Readout modes ##############################
 
+    def query_read_modes(self):
+        """Query the available readout modes from the current camera
+
+        Raises RunTimeError in case of error.
+
+        Sets attributes
+        ---------------
+        _read_modes : list
+            [name, width, height] of every readout mode
+        """
+        number = ffi.new('uint32_t *')
+        check_status(
+            lib.GetQHYCCDNumberOfReadModes(self._cam_handle, number))
+        name = ffi.new('char[80]')
+        size = ffi.new('uint32_t[2]')
+        read_modes = []
+        for mode_number in range(number[0]):
+            check_status(lib.GetQHYCCDReadModeName(self._cam_handle,
+                         mode_number, name))
+            check_status(lib.GetQHYCCDReadModeResolution(self._cam_handle,
+                         mode_number, size, size + 1))
+            read_modes.append([ffi.string(name).decode(), size[0], size[1]])
+        self._read_modes = read_modes
+        return self
+
+    def get_read_modes(self):
+        """Return the available readout modes
+
+        Returns
+        ------
+        read_modes : list
+            [name, width, height] of every readout mode
+        """
+        if not hasattr(self, '_read_modes'):
+            self.query_read_modes()
+        return [list(mode) for mode in self._read_modes]
+
     def get_number_of_read_modes(self):
         """Get the number of available readout modes
         
@@ -1012,10 +2243,9 @@ class qhyccd(object):
         ------
         number: The number of available readout modes
         """
-        number = ffi.new('uint32_t *')
-        check_status(
-            lib.GetQHYCCDNumberOfReadModes(self._cam_handle, number))
-        return number[0]
+        if not hasattr(self, '_read_modes'):
+            self.query_read_modes()
+        return len(self._read_modes)
 
     def get_read_mode(self):
         """Get the selected readout mode
@@ -1027,7 +2257,8 @@ class qhyccd(object):
         mode_number = ffi.new('uint32_t *')
         check_status(
             lib.GetQHYCCDReadMode(self._cam_handle, mode_number))
-        return mode_number[0]
+        self._read_mode = mode_number[0]
+        return self._read_mode
 
     def set_read_mode(self, mode_number):
         """Select the readout mode
@@ -1036,9 +2267,154 @@ class qhyccd(object):
         ----------
         mode_number: The number corresponding to the desired readout mode
         """
-        check_status(
-            lib.SetQHYCCDReadMode(self._cam_handle, mode_number))
-        
+        if mode_number == getattr(self, '_read_mode', None):
+            return self
+        with self._lock:
+            check_status(
+                lib.SetQHYCCDReadMode(self._cam_handle, mode_number))
+        self._read_mode = mode_number
+        # Control parameters may depend on the readout mode
+        self.invalidate_controls()
+        return self
+
+    ############################## Configuration ##############################
+
+    def configure(self, gain=None, offset=None, exptime=None, usbtraffic=None,
+                  region=None, binsize=None, bitdepth=None, readmode=None):
+        """Apply several camera settings at once
+
+        Only the settings that differ from the current ones are sent to the
+        camera, in the following order: readout mode, region, binning, bit
+        depth, then control parameters. An exposure in progress is cancelled
+        only if the frame geometry actually changes, and the image buffer is
+        reallocated at most once, only if it is too small for the new frames.
+        Raises KeyError or RunTimeError in case of error.
+
+        Parameters
+        ----------
+        gain : float
+            detector gain (in cB)
+        offset : int
+            detector offset
+        exptime : float
+            exposure time (in seconds)
+        usbtraffic : int
+            USB speed factor between 0 (fastest) and 100 (slowest)
+        region : (int[2], int[2])
+            acquisition region ([startX, startY], [sizeX, sizeY]);
+            a null size selects the full raster
+        binsize : int[2]
+            pixel binsize [sizeX, sizeY]
+        bitdepth : int
+            bit depth in bits
+        readmode : int
+            readout mode number
+
+        All settings default to None, which leaves them unchanged.
+        """
+        if readmode is not None:
+            self.set_read_mode(readmode)
+
+        if region is not None:
+            start, size = region
+            if size[0]*size[1] == 0:
+                size = self.get_image_size()
+            if hasattr(self, '_region_set') \
+                    and list(start) == self._region_start \
+                    and list(size) == self._region_size:
+                region = None
+        if binsize is not None \
+                and list(binsize) == getattr(self, '_binsize', None):
+            binsize = None
+        if bitdepth is not None \
+                and bitdepth == getattr(self, '_bitdepth', None):
+            bitdepth = None
+
+        if region is not None or binsize is not None or bitdepth is not None:
+            with self._lock:
+                if hasattr(self, '_region_set'):
+                    check_status(lib.CancelQHYCCDExposingAndReadout( \
+                                 self._cam_handle))
+                if region is not None:
+                    check_status(lib.SetQHYCCDResolution(self._cam_handle, \
+                                 start[0], start[1], size[0], size[1]))
+                    self._region_start = list(start)
+                    self._region_size = list(size)
+                    self._region_set = True
+                if binsize is not None:
+                    self._set_bin_mode(binsize)
+                    self._binsize = list(binsize)
+                if bitdepth is not None:
+                    check_status(lib.SetQHYCCDBitsMode(self._cam_handle, \
+                                 int(bitdepth)))
+                    self._bitdepth = bitdepth
+            if hasattr(self, '_region_set'):
+                self._alloc_image()
+
+        if usbtraffic is not None:
+            self.set_usbtraffic(usbtraffic)
+        if gain is not None:
+            self.set_gain(gain)
+        if offset is not None:
+            self.set_offset(offset)
+        if exptime is not None:
+            self.set_exptime(exptime)
+
+        return self
+
+    def get_configuration(self):
+        """Return the current camera settings
+
+        The settings are those applied through this object; no SDK call
+        is made.
+
+        Returns
+        -------
+        configuration : dict
+            'gain', 'offset', 'exptime', 'region' (start, size), 'binsize',
+            'bitdepth' and 'readmode' (None if never set nor queried), as
+            accepted by configure()
+        """
+        start, size = self.get_region()
+        return {'gain': getattr(self, '_gain', None),
+                'offset': getattr(self, '_offset', None),
+                'exptime': getattr(self, '_exptime', None),
+                'region': (list(start), list(size)),
+                'binsize': self.get_binsize(),
+                'bitdepth': getattr(self, '_bitdepth', None),
+                'readmode': getattr(self, '_read_mode', None)}
+
+    def get_metadata(self, live=False):
+        """Return the metadata record of the current settings
+
+        The record combines the settings applied through this object (see
+        get_configuration()) with the latest telemetry sample, if telemetry
+        is running (see start_telemetry()); no SDK call is made. The same
+        record is returned as long as neither changes. Acquired frames carry
+        the record of their acquisition time as their metadata attribute.
+
+        Parameters
+        ----------
+        live : boolean
+            record of live frames (see FrameMetadata)
+
+        Returns
+        -------
+        metadata : FrameMetadata
+            metadata record, e.g. for cards=cam.get_metadata() in
+            FitsCubeWriter, or metadata.to_header(frame) for single frames
+        """
+        configuration = self.get_configuration()
+        telemetry = self.telemetry
+        count = 0 if telemetry is None else telemetry.get_count()
+        key = (configuration, count, live)
+        if self._metadata is None or key != self._metadata_key:
+            self._metadata = FrameMetadata(configuration,
+                getattr(self, '_cam_idstr', None),
+                None if count == 0 else telemetry.get_latest(), live)
+            self._metadata_key = key
+        return self._metadata
+
     ############################ Software versions ############################
     def query_sdk_version(self):
         """Query the version of the QHYCCD driver
@@ -1107,10 +2483,9 @@ class qhyccd(object):
         return self._firmware_version
         
     def __del__(self):
-        if hasattr(self, '_region_set'):
-            check_status(lib.CancelQHYCCDExposingAndReadout(self._cam_handle))
-        self.close_camera()
-        self.release_resource()
+        if lib is None:
+            return
+        self.close()
 
 if __name__=='__main__':
     a = qhyccd()
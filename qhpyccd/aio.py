@@ -0,0 +1,173 @@
+"""
+asyncio interface for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import asyncio
+import concurrent.futures
+import functools
+import threading
+
+class AsyncQhyccd(object):
+    """asyncio facade around a qhyccd camera object
+
+    All SDK calls run in a single worker thread dedicated to the camera,
+    which keeps them serialized while the event loop remains free during
+    long exposures and readouts. Cancelling a pending get_image() aborts the
+    exposure with CancelQHYCCDExposingAndReadout, or drops the acquisition
+    if it has not started yet.
+
+    Parameters
+    ----------
+    cam : qhyccd
+        camera object
+    """
+
+    def __init__(self, cam):
+        self.cam = cam
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='qhpyccd-sdk')
+        self._waiter = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='qhpyccd-wait')
+
+    @classmethod
+    async def create(cls, **kwargs):
+        """Open and configure a camera without blocking the event loop
+
+        Parameters
+        ----------
+        **kwargs
+            qhyccd constructor arguments
+
+        Returns
+        -------
+        acam : AsyncQhyccd
+            asyncio camera object
+        """
+        from . import qhyccd
+        loop = asyncio.get_running_loop()
+        cam = await loop.run_in_executor(None,
+                                         functools.partial(qhyccd, **kwargs))
+        return cls(cam)
+
+    async def call(self, method, *args, **kwargs):
+        """Call any qhyccd method in the camera worker thread
+
+        Parameters
+        ----------
+        method : string
+            qhyccd method name, e.g. 'set_gain'
+        *args, **kwargs
+            method arguments
+
+        Returns
+        -------
+        result
+            method result
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(
+            getattr(self.cam, method), *args, **kwargs))
+
+    def _get_image(self, cancelled):
+        """Acquire an image in the worker thread, unless cancelled first
+
+        Parameters
+        ----------
+        cancelled : threading.Event
+            set when the acquisition is cancelled
+        """
+        cam = self.cam
+        # cancel_exposure() takes the camera lock too: a cancellation either
+        # prevents the exposure or aborts it
+        with cam._lock:
+            if cancelled.is_set():
+                return self
+            cam.start_exposure()
+        cam.read_image()
+        return self
+
+    async def get_image(self):
+        """Acquire an image without blocking the event loop
+
+        Cancelling the coroutine cancels the exposure and readout, or
+        prevents them if they have not started yet.
+
+        Returns
+        -------
+        image : numpy.ndarray
+            acquired image (the camera image attribute)
+        """
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        cfuture = self._executor.submit(self._get_image, cancelled)
+        future = asyncio.wrap_future(cfuture)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Acquisitions still queued behind other calls are just dropped
+            if not cfuture.cancel():
+                cancelled.set()
+                await loop.run_in_executor(None, self.cam.cancel_exposure)
+                try:
+                    await future
+                except Exception:
+                    pass
+            raise
+        return self.cam.image
+
+    async def stream(self, nbuffers=8, queue_size=4, overflow='drop-oldest'):
+        """Asynchronously iterate over live frames
+
+        Start live streaming (see qhyccd.start_stream()) and yield frames
+        as they arrive, e.g. `async for frame in acam.stream(): ...`.
+        Every frame must be released by the consumer. The stream stops when
+        the generator is closed; wrap it in contextlib.aclosing() to stop it
+        as soon as the loop is exited with break.
+
+        Parameters
+        ----------
+        nbuffers : int
+            number of preallocated frame buffers in the live ring
+        queue_size : int
+            maximum number of frames waiting in the queue
+        overflow : string
+            queue overflow policy ('block', 'drop-oldest' or 'drop-newest')
+        """
+        loop = asyncio.get_running_loop()
+        stream = await loop.run_in_executor(self._executor, functools.partial(
+            self.cam.start_stream, nbuffers, queue_size, overflow))
+        try:
+            while True:
+                cfuture = self._waiter.submit(stream.get)
+                try:
+                    frame = await asyncio.wrap_future(cfuture)
+                except asyncio.CancelledError:
+                    # Do not leak a frame delivered after the cancellation
+                    cfuture.add_done_callback(_release_result)
+                    raise
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            await loop.run_in_executor(self._executor, stream.stop)
+
+    def close(self):
+        """Shut down the worker threads
+        """
+        self._executor.shutdown(wait=True)
+        self._waiter.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.close)
+
+
+def _release_result(cfuture):
+    """Release the frame returned by a completed future, if any
+    """
+    if not cfuture.cancelled() and cfuture.exception() is None \
+            and cfuture.result() is not None:
+        cfuture.result().release()
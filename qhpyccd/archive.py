@@ -0,0 +1,379 @@
+"""
+Compressed frame archives for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+
+Archives store frames split into tiles of rows, each tile byte-shuffled
+(the most significant bytes of all pixels are grouped before the least
+significant ones) and compressed losslessly with zlib or lzma. The file is
+made of a header, the compressed tiles, a JSON index and a footer:
+
+    magic (8 bytes) | tiles ... | index (JSON) | index offset (8 bytes,
+    little endian) | index size (8 bytes) | magic (8 bytes)
+
+The index lists, for every frame, its shape, pixel type, acquisition times
+and the offset and size of each tile, so that any tile of any frame can be
+read and decompressed independently.
+"""
+import concurrent.futures
+import json
+import lzma
+import os
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+
+ARCHIVE_MAGIC = b'QHPYARC1'
+ARCHIVE_CODECS = ('zlib', 'lzma', 'none')
+
+def shuffle_bytes(data):
+    """Group the bytes of an array by significance
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        array
+
+    Returns
+    -------
+    shuffled : bytes
+        bytes of rank 0 of all elements, then bytes of rank 1, etc.
+    """
+    itemsize = data.dtype.itemsize
+    if itemsize == 1:
+        return np.ascontiguousarray(data).tobytes()
+    return np.ascontiguousarray(data).view(np.uint8).reshape(-1, itemsize) \
+             .T.tobytes()
+
+
+def unshuffle_bytes(shuffled, out):
+    """Restore an array from shuffled bytes (see shuffle_bytes())
+
+    Parameters
+    ----------
+    shuffled : bytes
+        shuffled bytes
+    out : numpy.ndarray
+        C-contiguous output array
+    """
+    itemsize = out.dtype.itemsize
+    planes = np.frombuffer(shuffled, dtype=np.uint8)
+    if itemsize == 1:
+        out.reshape(-1)[:] = planes
+    else:
+        out.view(np.uint8).reshape(-1, itemsize)[:] = \
+            planes.reshape(itemsize, -1).T
+
+
+def compress_tile(data, codec, level):
+    """Byte-shuffle and compress a tile
+    """
+    shuffled = shuffle_bytes(data)
+    if codec == 'zlib':
+        return zlib.compress(shuffled, level)
+    elif codec == 'lzma':
+        return lzma.compress(shuffled, preset=level)
+    return shuffled
+
+
+def decompress_tile(compressed, codec, out):
+    """Decompress and unshuffle a tile into an array
+    """
+    if codec == 'zlib':
+        shuffled = zlib.decompress(compressed)
+    elif codec == 'lzma':
+        shuffled = lzma.decompress(compressed)
+    else:
+        shuffled = compressed
+    unshuffle_bytes(shuffled, out)
+
+
+class ArchiveWriter(object):
+    """Compress frames to an archive on a pool of threads
+
+    Tiles are compressed in parallel (zlib and lzma release the GIL) and
+    written in frame order by a dedicated thread. The amount of frame data
+    waiting for compression is bounded: write() blocks once max_inflight
+    bytes are pending. Frames are copied by write(), so that the caller may
+    recycle their buffers right away; Frame objects are released once
+    copied.
+
+    Parameters
+    ----------
+    filename : string
+        output file name
+    codec : string
+        'zlib' (default), 'lzma' or 'none'
+    level : int
+        compression level (zlib: 1-9, lzma: 0-9)
+    tile_rows : int
+        number of frame rows per tile
+    nthreads : int or None
+        number of compression threads (default: number of CPUs)
+    max_inflight : int
+        maximum number of bytes of frame data waiting for compression
+
+    Attributes
+    ----------
+    nwritten : int
+        number of frames written
+    nbytes_in, nbytes_out : int
+        total raw and compressed sizes of the written frames
+    error : Exception or None
+        error that stopped the writer thread, if any
+    """
+
+    def __init__(self, filename, codec='zlib', level=1, tile_rows=64,
+                 nthreads=None, max_inflight=256 << 20):
+        if codec not in ARCHIVE_CODECS:
+            raise ValueError(f'unknown codec: {codec}')
+        self.filename = filename
+        self.codec = codec
+        self.level = level
+        self.tile_rows = max(1, int(tile_rows))
+        self.max_inflight = int(max_inflight)
+        self.nwritten = 0
+        self.nbytes_in = self.nbytes_out = 0
+        self.error = None
+        self._index = []
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self._f = open(filename, 'wb')
+        self._f.write(ARCHIVE_MAGIC)
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=nthreads or os.cpu_count(),
+            thread_name_prefix='qhpyccd-compress')
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run,
+                                        name='qhpyccd-archive', daemon=True)
+        self._thread.start()
+
+    def write(self, frame, timeout=None):
+        """Queue a frame for compression
+
+        Blocks while too much frame data is waiting for compression.
+        Raises the error that stopped the writer thread, if any.
+
+        Parameters
+        ----------
+        frame : Frame or numpy.ndarray
+            frame to archive; Frame objects are released once copied
+        timeout : float or None
+            how long to wait for the in-flight data to drop below the limit
+            (in seconds); raises TimeoutError if it does not
+        """
+        if self.error is not None:
+            raise self.error
+        if self._thread is None:
+            raise ValueError('archive is closed')
+        data = frame if isinstance(frame, np.ndarray) else frame.data
+        nbytes = data.nbytes
+        with self._cond:
+            # A frame larger than the limit is accepted once nothing else
+            # is in flight
+            if not self._cond.wait_for(lambda: self.error is not None \
+                    or self._inflight == 0 \
+                    or self._inflight + nbytes <= self.max_inflight,
+                    timeout):
+                raise TimeoutError('archive compression is lagging')
+            if self.error is not None:
+                raise self.error
+            self._inflight += nbytes
+        # Compression tasks must not read buffers the caller may recycle
+        # (e.g. ring slots autoreleased by qhyccd.sequence())
+        data = np.array(data)
+        entry = {'shape': list(data.shape), 'dtype': data.dtype.str,
+                 'tile_rows': self.tile_rows, 'tiles': []}
+        if not isinstance(frame, np.ndarray):
+            entry['t_start'] = frame.t_start
+            entry['t_end'] = frame.t_end
+            frame.release()
+        tiles = [self._pool.submit(compress_tile,
+                                   data[i:i + self.tile_rows],
+                                   self.codec, self.level) \
+                 for i in range(0, max(len(data), 1), self.tile_rows)]
+        self._pending.put((entry, nbytes, tiles))
+        return self
+
+    def _run(self):
+        """Writer thread loop: store the compressed tiles in frame order
+        """
+        f = self._f
+        try:
+            while True:
+                item = self._pending.get()
+                if item is None:
+                    break
+                entry, nbytes, tiles = item
+                try:
+                    for tile in tiles:
+                        compressed = tile.result()
+                        entry['tiles'].append([f.tell(), len(compressed)])
+                        f.write(compressed)
+                        self.nbytes_out += len(compressed)
+                finally:
+                    with self._cond:
+                        self._inflight -= nbytes
+                        self._cond.notify_all()
+                self._index.append(entry)
+                self.nbytes_in += nbytes
+                self.nwritten += 1
+        except Exception as e:
+            with self._cond:
+                self.error = e
+                self._cond.notify_all()
+
+    def close(self):
+        """Compress the queued frames, write the index and close the file
+
+        Raises the error that stopped the writer thread, if any.
+        """
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join()
+            self._thread = None
+            self._pool.shutdown(wait=True)
+            f = self._f
+            if self.error is None:
+                index = json.dumps({'codec': self.codec,
+                                    'frames': self._index}).encode()
+                offset = f.tell()
+                f.write(index)
+                f.write(struct.pack('<QQ', offset, len(index)))
+                f.write(ARCHIVE_MAGIC)
+            f.close()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArchiveReader(object):
+    """Random access reader of frame archives
+
+    Parameters
+    ----------
+    filename : string
+        archive file name
+    nthreads : int or None
+        number of decompression threads (default: number of CPUs)
+    """
+
+    def __init__(self, filename, nthreads=None):
+        self.filename = filename
+        self._f = open(filename, 'rb')
+        self._lock = threading.Lock()
+        f = self._f
+        if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            raise ValueError(f'{filename} is not a frame archive')
+        f.seek(-16 - len(ARCHIVE_MAGIC), os.SEEK_END)
+        offset, size = struct.unpack('<QQ', f.read(16))
+        if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            raise ValueError(f'{filename} is truncated (no index)')
+        f.seek(offset)
+        index = json.loads(f.read(size))
+        self.codec = index['codec']
+        self.frames = index['frames']
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=nthreads or os.cpu_count(),
+            thread_name_prefix='qhpyccd-decompress')
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _read_bytes(self, offset, size):
+        """Read raw bytes from the archive
+        """
+        with self._lock:
+            self._f.seek(offset)
+            return self._f.read(size)
+
+    def get_ntiles(self, index):
+        """Return the number of tiles of a frame
+
+        Parameters
+        ----------
+        index : int
+            frame index
+
+        Returns
+        -------
+        ntiles : int
+            number of tiles
+        """
+        return len(self.frames[index]['tiles'])
+
+    def read_tile(self, index, tile, out=None):
+        """Read and decompress a single tile
+
+        Parameters
+        ----------
+        index : int
+            frame index
+        tile : int
+            tile index
+        out : numpy.ndarray or None
+            C-contiguous output array for the tile rows
+
+        Returns
+        -------
+        data : numpy.ndarray
+            tile rows of the frame
+        """
+        entry = self.frames[index]
+        shape = entry['shape']
+        rows = entry['tile_rows']
+        nrows = min(rows, shape[0] - tile * rows) if shape else 0
+        if out is None:
+            out = np.empty([nrows] + shape[1:], dtype=entry['dtype'])
+        offset, size = entry['tiles'][tile]
+        decompress_tile(self._read_bytes(offset, size), self.codec, out)
+        return out
+
+    def read(self, index, out=None):
+        """Read and decompress a frame, tiles in parallel
+
+        Parameters
+        ----------
+        index : int
+            frame index
+        out : numpy.ndarray or None
+            C-contiguous output array
+
+        Returns
+        -------
+        data : numpy.ndarray
+            frame
+        """
+        entry = self.frames[index]
+        if out is None:
+            out = np.empty(entry['shape'], dtype=entry['dtype'])
+        rows = entry['tile_rows']
+        futures = [self._pool.submit(self.read_tile, index, tile,
+                                     out[tile * rows:(tile + 1) * rows]) \
+                   for tile in range(len(entry['tiles']))]
+        for future in futures:
+            future.result()
+        return out
+
+    def __getitem__(self, index):
+        return self.read(index)
+
+    def close(self):
+        """Close the archive
+        """
+        self._pool.shutdown(wait=True)
+        self._f.close()
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
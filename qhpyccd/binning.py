@@ -0,0 +1,180 @@
+"""
+Software binning and decimation for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import numpy as np
+from .frames import Frame, FrameRing
+
+BINNING_MODES = ('sum', 'mean', 'decimate')
+
+class SoftwareBinning(object):
+    """Bin or decimate frames in software
+
+    Pixels are combined by adding strided row and column views into
+    preallocated work buffers, without reshaping copies nor per-frame
+    allocations. Edge pixels that do not fill a complete bin are cropped.
+    The camera applies software binning automatically to binning factors
+    not supported by the hardware (see qhyccd.set_binsize()); instances can
+    also be used directly, or as live stream stages for preview and
+    downstream pipelines.
+
+    Parameters
+    ----------
+    binsize : int[2]
+        binning factors [sizeX, sizeY]
+    mode : string
+        'sum' (default): sum of the pixels of each bin, clipped to the
+        output type range; 'mean': average (truncated for integer types);
+        'decimate': first pixel of each bin
+    dtype : numpy.dtype or None
+        output pixel type (default: same as the input frames, like hardware
+        binning)
+    nbuffers : int
+        number of output buffers in the ring used for stream stage frames
+    """
+
+    def __init__(self, binsize, mode='sum', dtype=None, nbuffers=8):
+        if mode not in BINNING_MODES:
+            raise ValueError(f'unknown binning mode: {mode}')
+        if binsize[0] < 1 or binsize[1] < 1:
+            raise ValueError(f'invalid binning factors: {binsize}')
+        self.binsize = [int(binsize[0]), int(binsize[1])]
+        self.mode = mode
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.nbuffers = nbuffers
+        self._work = {}
+        self._ring = None
+
+    def get_layout(self, shape, dtype):
+        """Return the layout of binned frames
+
+        Parameters
+        ----------
+        shape : tuple
+            input frame shape, (h, w) or (h, w, channels)
+        dtype : numpy.dtype
+            input pixel type
+
+        Returns
+        -------
+        shape : tuple
+            binned frame shape
+        dtype : numpy.dtype
+            binned pixel type
+        """
+        fx, fy = self.binsize
+        return (shape[0] // fy, shape[1] // fx) + tuple(shape[2:]), \
+               np.dtype(dtype) if self.dtype is None else self.dtype
+
+    def _get_work(self, name, shape, dtype):
+        """Return a work buffer, reallocated only if its layout changed
+        """
+        work = self._work.get(name)
+        if work is None or work.shape != shape or work.dtype != dtype:
+            work = self._work[name] = np.empty(shape, dtype=dtype)
+        return work
+
+    def bin(self, data, out=None):
+        """Bin a frame
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            input frame, of shape (h, w) or (h, w, channels)
+        out : numpy.ndarray or None
+            preallocated output array (see get_layout())
+
+        Returns
+        -------
+        binned : numpy.ndarray
+            binned frame (out if provided)
+        """
+        fx, fy = self.binsize
+        shape, dtype = self.get_layout(data.shape, data.dtype)
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        h, w = shape[:2]
+        view = data[:h * fy, :w * fx]
+        if self.mode == 'decimate' or fx * fy == 1:
+            np.copyto(out, view[::fy, ::fx], casting='unsafe')
+            return out
+        # Sums are accumulated as uint32 (integers) or float32 (floats)
+        work_dtype = np.dtype(np.float32 if data.dtype.kind == 'f' \
+                              or out.dtype.kind == 'f' else np.uint32)
+        # Add the fy rows of every bin...
+        rows = self._get_work('rows', (h, w * fx) + shape[2:], work_dtype)
+        np.copyto(rows, view[0::fy])
+        for i in range(1, fy):
+            np.add(rows, view[i::fy], out=rows)
+        # ...then the fx columns
+        cols = rows.reshape((h, w, fx) + shape[2:])
+        direct = self.mode == 'sum' and out.dtype == work_dtype
+        acc = out if direct \
+              else self._get_work('cols', shape, work_dtype)
+        np.copyto(acc, cols[:, :, 0])
+        for i in range(1, fx):
+            np.add(acc, cols[:, :, i], out=acc)
+        if not direct:
+            if self.mode == 'mean':
+                if work_dtype.kind == 'f':
+                    acc /= fx * fy
+                else:
+                    np.floor_divide(acc, fx * fy, out=acc)
+            elif out.dtype.kind in 'ui' \
+                    and np.iinfo(out.dtype).max < np.iinfo(work_dtype).max:
+                np.minimum(acc, np.iinfo(out.dtype).max, out=acc)
+            np.copyto(out, acc, casting='unsafe')
+        return out
+
+    def __call__(self, frame):
+        """Stream stage interface: bin a frame into a new frame
+
+        The input frame is released. The binned frame comes from a ring of
+        preallocated buffers, or is allocated if all of them are in use.
+
+        Parameters
+        ----------
+        frame : Frame
+            input frame
+
+        Returns
+        -------
+        binned : Frame
+            binned frame, to be released by the consumer
+        """
+        shape, dtype = self.get_layout(frame.data.shape, frame.data.dtype)
+        ring = self._ring
+        if ring is None or ring.shape != shape or ring.dtype != dtype:
+            ring = self._ring = FrameRing(self.nbuffers, shape, dtype)
+        slot = ring.acquire()
+        if slot is None:
+            binned = Frame(None, 0, self.bin(frame.data))
+        else:
+            binned = Frame(ring, slot, self.bin(frame.data, ring.view(slot)))
+        binned.copy_metadata(frame)
+        frame.release()
+        return binned
+
+
+def bin_frame(data, binsize, mode='sum', dtype=None, out=None):
+    """Bin or decimate a frame in software
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        input frame, of shape (h, w) or (h, w, channels)
+    binsize : int[2]
+        binning factors [sizeX, sizeY]
+    mode : string
+        'sum', 'mean' or 'decimate' (see SoftwareBinning)
+    dtype : numpy.dtype or None
+        output pixel type (default: same as the input)
+    out : numpy.ndarray or None
+        preallocated output array
+
+    Returns
+    -------
+    binned : numpy.ndarray
+        binned frame
+    """
+    return SoftwareBinning(binsize, mode, dtype).bin(data, out)
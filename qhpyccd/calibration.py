@@ -0,0 +1,296 @@
+"""
+Frame calibration for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import collections
+import threading
+import numpy as np
+from .frames import Frame, FrameRing
+
+def configuration_key(configuration):
+    """Return a hashable key for a camera configuration
+
+    Parameters
+    ----------
+    configuration : dict
+        camera configuration, as returned by qhyccd.get_configuration()
+
+    Returns
+    -------
+    key : tuple
+        sorted (name, value) pairs, with lists converted to tuples and
+        exposure times rounded to the microsecond
+    """
+    items = []
+    for name, value in sorted(configuration.items()):
+        if isinstance(value, (list, tuple)):
+            value = tuple(tuple(v) if isinstance(v, (list, tuple)) else v \
+                          for v in value)
+        elif name == 'exptime':
+            value = round(value, 6)
+        items.append((name, value))
+    return tuple(items)
+
+
+def load_master(source):
+    """Load a master calibration frame
+
+    Parameters
+    ----------
+    source : numpy.ndarray or string
+        array, or name of a .npy or FITS file (FITS requires astropy)
+
+    Returns
+    -------
+    master : numpy.ndarray
+        master frame
+    """
+    if not isinstance(source, str):
+        return np.asarray(source)
+    if source.endswith('.npy'):
+        return np.load(source)
+    from astropy.io import fits
+    return fits.getdata(source)
+
+
+class Calibration(object):
+    """Precomputed bias, dark and flat-field calibration
+
+    The bias and scaled dark frames are combined into a single float32
+    offset frame and the normalized flat field is inverted once, so that
+    calibrating a frame costs one subtraction and one multiplication into
+    a float32 buffer:
+
+        calibrated = (raw - bias - dark * exptime / dark_exptime) / flat
+
+    Calibrations can be used as live stream stages.
+
+    Parameters
+    ----------
+    bias : numpy.ndarray or None
+        master bias frame
+    dark : numpy.ndarray or None
+        master dark frame, bias-subtracted
+    flat : numpy.ndarray or None
+        master flat field, bias- and dark-subtracted; it is normalized to
+        its mean, and pixels with a null or negative flat are set to 0
+    exptime : float or None
+        exposure time of the frames to calibrate (in seconds)
+    dark_exptime : float or None
+        exposure time of the master dark (default: exptime)
+    nbuffers : int
+        number of output buffers in the ring used for stream stage frames
+    """
+
+    def __init__(self, bias=None, dark=None, flat=None, exptime=None,
+                 dark_exptime=None, nbuffers=8):
+        self.nbuffers = nbuffers
+        self._ring = None
+        offset = None
+        if bias is not None:
+            offset = np.array(bias, dtype=np.float32)
+        if dark is not None:
+            dark = np.array(dark, dtype=np.float32)
+            if exptime is not None and dark_exptime \
+                    and exptime != dark_exptime:
+                dark *= exptime / dark_exptime
+            offset = dark if offset is None else np.add(offset, dark,
+                                                        out=offset)
+        self.offset = offset
+        self.rflat = None
+        if flat is not None:
+            flat = np.array(flat, dtype=np.float32)
+            flat /= flat[flat > 0.0].mean(dtype=np.float64)
+            self.rflat = np.zeros_like(flat)
+            np.divide(1.0, flat, out=self.rflat, where=flat > 0.0)
+        shapes = set(m.shape for m in (self.offset, self.rflat) \
+                     if m is not None)
+        if len(shapes) > 1:
+            raise ValueError('master frames have different shapes')
+        self.shape = shapes.pop() if shapes else None
+
+    def apply(self, data, out=None):
+        """Calibrate a frame
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            raw frame; a float32 frame may be calibrated in place by
+            passing it as out
+        out : numpy.ndarray or None
+            float32 output array (default: a new array)
+
+        Returns
+        -------
+        calibrated : numpy.ndarray
+            float32 calibrated frame (out if provided)
+        """
+        if self.shape is not None and data.shape != self.shape:
+            raise ValueError(f'frame shape {data.shape} does not match ' \
+                             f'master shape {self.shape}')
+        if out is None:
+            out = np.empty(data.shape, dtype=np.float32)
+        if self.offset is not None:
+            np.subtract(data, self.offset, out=out)
+        elif out is not data:
+            np.copyto(out, data, casting='unsafe')
+        if self.rflat is not None:
+            np.multiply(out, self.rflat, out=out)
+        return out
+
+    def __call__(self, frame):
+        """Stream stage interface: calibrate a frame into a new frame
+
+        The input frame is released. The calibrated frame comes from a ring
+        of preallocated float32 buffers, or is allocated if all of them are
+        in use.
+
+        Parameters
+        ----------
+        frame : Frame
+            raw frame
+
+        Returns
+        -------
+        calibrated : Frame
+            calibrated frame, to be released by the consumer
+        """
+        ring = self._ring
+        if ring is None or ring.shape != frame.data.shape:
+            ring = self._ring = FrameRing(self.nbuffers, frame.data.shape,
+                                          np.float32)
+        slot = ring.acquire()
+        if slot is None:
+            calibrated = Frame(None, 0, self.apply(frame.data))
+        else:
+            calibrated = Frame(ring, slot,
+                               self.apply(frame.data, ring.view(slot)))
+        calibrated.copy_metadata(frame)
+        frame.release()
+        return calibrated
+
+
+class CalibrationLibrary(object):
+    """Master calibration frames for a set of camera configurations
+
+    Masters are registered per camera configuration (gain, offset,
+    exposure time, region, binning...) and loaded lazily. Master files are
+    read only once, even if shared by several configurations, and the
+    most recently used calibrations are kept ready, so that switching
+    between configurations does not reload nor recompute anything:
+
+        library = CalibrationLibrary()
+        library.add(cam.get_configuration(), bias='bias.fits',
+                    dark='dark_60s.fits', flat='flat_r.fits',
+                    dark_exptime=60.0)
+        calibration = library.for_camera(cam)
+
+    The library can be used as a live stream stage, calibrating every
+    frame with the masters of the camera configuration at its acquisition
+    (see Frame.metadata).
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of precomputed calibrations kept in memory
+    cam : qhyccd or None
+        camera whose current configuration selects the calibration of
+        frames without metadata when the library is used as a stream stage
+    """
+
+    def __init__(self, maxsize=8, cam=None):
+        self.maxsize = maxsize
+        self.cam = cam
+        self._sources = {}
+        self._masters = {}
+        self._calibrations = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, configuration, bias=None, dark=None, flat=None,
+            dark_exptime=None):
+        """Register the masters of a camera configuration
+
+        Parameters
+        ----------
+        configuration : dict
+            camera configuration (see qhyccd.get_configuration())
+        bias, dark, flat : numpy.ndarray, string or None
+            master frames or file names (see load_master())
+        dark_exptime : float or None
+            exposure time of the master dark (default: that of the
+            configuration)
+        """
+        key = configuration_key(configuration)
+        with self._lock:
+            self._sources[key] = (bias, dark, flat,
+                                  configuration.get('exptime'), dark_exptime)
+            self._calibrations.pop(key, None)
+        return self
+
+    def _load(self, source):
+        """Load a master frame, reading each file only once
+        """
+        if not isinstance(source, str):
+            return source
+        master = self._masters.get(source)
+        if master is None:
+            master = self._masters[source] = load_master(source)
+        return master
+
+    def get(self, configuration):
+        """Return the calibration of a camera configuration
+
+        Raises KeyError if no masters were registered for the
+        configuration.
+
+        Parameters
+        ----------
+        configuration : dict
+            camera configuration (see qhyccd.get_configuration())
+
+        Returns
+        -------
+        calibration : Calibration
+            precomputed calibration
+        """
+        key = configuration_key(configuration)
+        with self._lock:
+            calibration = self._calibrations.get(key)
+            if calibration is not None:
+                self._calibrations.move_to_end(key)
+                return calibration
+            bias, dark, flat, exptime, dark_exptime = self._sources[key]
+            calibration = Calibration(self._load(bias), self._load(dark),
+                                      self._load(flat), exptime,
+                                      dark_exptime)
+            self._calibrations[key] = calibration
+            while len(self._calibrations) > self.maxsize:
+                self._calibrations.popitem(last=False)
+        return calibration
+
+    def for_camera(self, cam):
+        """Return the calibration of the current configuration of a camera
+
+        Parameters
+        ----------
+        cam : qhyccd
+            camera
+
+        Returns
+        -------
+        calibration : Calibration
+            precomputed calibration
+        """
+        return self.get(cam.get_configuration())
+
+    def __call__(self, frame):
+        """Stream stage interface: calibrate a frame (see Calibration)
+
+        The calibration is selected by the configuration recorded in the
+        frame metadata, so that frames acquired before a configuration
+        change are not calibrated with the masters of the new one.
+        """
+        metadata = frame.metadata
+        if metadata is None:
+            return self.for_camera(self.cam)(frame)
+        return self.get(metadata.configuration)(frame)
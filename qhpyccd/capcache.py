@@ -0,0 +1,108 @@
+"""
+On-disk cache of static camera capabilities for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+
+Chip information, overscan and effective areas, readout modes and the
+control capability bitmap only depend on the camera model, its firmware and
+the SDK version. They are stored as one small JSON file per camera ID, so
+that the probing phase is skipped when the camera is opened again. Entries
+written by a different firmware or SDK version are ignored and overwritten.
+"""
+import json
+import os
+import re
+
+# Default cache directory
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') \
+                         or os.path.expanduser('~/.cache'), 'qhpyccd')
+
+# Version of the cache file format
+CACHE_FORMAT = 1
+
+def cache_path(cache_dir, cam_id):
+    """Return the cache file name of a camera
+
+    Parameters
+    ----------
+    cache_dir : string
+        cache directory
+    cam_id : string
+        camera ID
+
+    Returns
+    -------
+    path : string
+        cache file name
+    """
+    return os.path.join(cache_dir,
+                        re.sub(r'[^A-Za-z0-9_.-]', '_', cam_id) + '.json')
+
+
+def load_capabilities(cache_dir, cam_id, firmware_version, sdk_version):
+    """Load the cached capabilities of a camera
+
+    Parameters
+    ----------
+    cache_dir : string
+        cache directory
+    cam_id : string
+        camera ID
+    firmware_version : string
+        current camera firmware version
+    sdk_version : string
+        current SDK version
+
+    Returns
+    -------
+    capabilities : dict or None
+        cached capabilities, or None if the cache file is missing, unreadable
+        or was written for another firmware or SDK version
+    """
+    try:
+        with open(cache_path(cache_dir, cam_id)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) \
+            or entry.get('format') != CACHE_FORMAT \
+            or entry.get('camera') != cam_id \
+            or entry.get('firmware') != firmware_version \
+            or entry.get('sdk') != sdk_version:
+        return None
+    return entry.get('capabilities')
+
+
+def save_capabilities(cache_dir, cam_id, firmware_version, sdk_version,
+                      capabilities):
+    """Save the capabilities of a camera to the cache
+
+    The file is replaced atomically, so that concurrent processes never
+    read a partial entry.
+    Raises OSError in case of error.
+
+    Parameters
+    ----------
+    cache_dir : string
+        cache directory
+    cam_id : string
+        camera ID
+    firmware_version : string
+        camera firmware version
+    sdk_version : string
+        SDK version
+    capabilities : dict
+        JSON-serializable capabilities
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, cam_id)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    entry = {'format': CACHE_FORMAT, 'camera': cam_id,
+             'firmware': firmware_version, 'sdk': sdk_version,
+             'capabilities': capabilities}
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f, indent=1)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
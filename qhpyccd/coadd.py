@@ -0,0 +1,303 @@
+"""
+Frame co-adding for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import collections
+import functools
+import time
+import numpy as np
+
+COADD_MODES = ('sum', 'mean')
+
+class Stack(object):
+    """Co-added frames
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        sum (uint32 or float32) or mean (float32) of the frames
+    nframes : int
+        number of co-added frames
+    sumsq : numpy.ndarray or None
+        per-pixel sum of the squared frames, if requested
+    t_start : float
+        host acquisition start time of the first frame (in seconds since
+        the epoch, see Frame)
+    t_end : float
+        host acquisition end time of the last frame (in seconds since the
+        epoch)
+    is_mean : boolean
+        whether data is the mean instead of the sum of the frames
+    total : numpy.ndarray or None
+        exact (uint32) sum of the frames when data is their mean, kept for
+        computing variances
+    recycle : callable or None
+        function called without arguments to hand the buffers back for
+        reuse when the stack is released
+    """
+
+    def __init__(self, data, nframes, sumsq=None, t_start=None, t_end=None,
+                 is_mean=False, total=None, recycle=None):
+        self.data = data
+        self.nframes = nframes
+        self.sumsq = sumsq
+        self.t_start = t_start
+        self.t_end = t_end
+        self.is_mean = is_mean
+        self.total = total
+        self._recycle = recycle
+
+    def get_variance(self):
+        """Return the per-pixel variance of the co-added frames
+
+        The variance is computed as (n * sumsq - sum**2) / n**2, exactly
+        with 64-bit integers for integer sums when no overflow is possible,
+        otherwise in double precision, and only then converted to float32.
+
+        Returns
+        -------
+        variance : numpy.ndarray
+            float32 variance, or None if the sum of squares was not kept
+        """
+        if self.sumsq is None or self.nframes == 0:
+            return None
+        n = self.nframes
+        sums = self.data if self.total is None else self.total
+        is_mean = self.is_mean and self.total is None
+        if sums.dtype.kind == 'u' and self.sumsq.dtype.kind == 'u' \
+                and not is_mean and sums.size \
+                and int(sums.max()) ** 2 < 1 << 63 \
+                and n * int(self.sumsq.max()) < 1 << 63:
+            total = sums.astype(np.int64)
+            variance = self.sumsq.astype(np.int64)
+            variance *= n
+            total *= total
+            variance -= total
+            return np.divide(variance, n * n, dtype=np.float64) \
+                     .astype(np.float32)
+        total = sums.astype(np.float64)
+        if is_mean:
+            total *= n
+        variance = self.sumsq.astype(np.float64)
+        variance *= n
+        total *= total
+        variance -= total
+        variance /= n * n
+        np.maximum(variance, 0.0, out=variance)
+        return variance.astype(np.float32)
+
+    def release(self):
+        """Drop the stack data (for compatibility with Frame)
+
+        The buffers of stacks produced by a FrameAccumulator are handed back
+        to it for reuse. Releasing a stack more than once has no effect.
+        """
+        if self._recycle is not None:
+            self._recycle()
+            self._recycle = None
+        self.data = self.sumsq = self.total = None
+        return self
+
+
+class FrameAccumulator(object):
+    """Co-add frames into a preallocated accumulator
+
+    Frames are added in place into a uint32 or float32 accumulator, and
+    released as soon as they are added. A Stack is produced every nframes
+    frames and/or every interval seconds of frame acquisition times. Stacks
+    hand their buffers over to the accumulator when they are released, so
+    that no buffer is allocated in the steady state. An accumulator can be
+    used as a
+    live stream stage, so that frames are co-added in the reader thread and
+    only stacks are queued; the stream also completes stacks whose interval
+    has elapsed while no frame arrives, and the pending stack when it stops:
+
+        acc = FrameAccumulator(nframes=100)
+        stream = cam.start_stream(stages=[acc])
+        for stack in stream: ...
+
+    Parameters
+    ----------
+    nframes : int
+        number of frames per stack (0: no limit)
+    interval : float
+        maximum time span of a stack (in seconds; 0: no limit)
+    mode : string
+        'sum' (default) or 'mean' (float32 average)
+    dtype : numpy.dtype
+        accumulator type, uint32 (default) or float32; uint32 sums of
+        16-bit frames overflow beyond 65537 frames
+    sumsq : boolean
+        also accumulate the per-pixel sum of squares (uint64 or float32)
+    nbuffers : int
+        maximum number of buffer sets of released stacks kept for reuse
+    """
+
+    def __init__(self, nframes=0, interval=0.0, mode='sum', dtype=np.uint32,
+                 sumsq=False, nbuffers=2):
+        if mode not in COADD_MODES:
+            raise ValueError(f'unknown co-adding mode: {mode}')
+        if nframes <= 0 and interval <= 0.0:
+            raise ValueError('nframes or interval must be set')
+        self.nframes = int(nframes)
+        self.interval = float(interval)
+        self.mode = mode
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.uint32, np.float32):
+            raise ValueError(f'unsupported accumulator type: {self.dtype}')
+        self.sumsq_dtype = np.dtype(np.uint64 if self.dtype == np.uint32 \
+                                    else np.float32) if sumsq else None
+        self.nbuffers = int(nbuffers)
+        # Buffer sets (accumulator, sum of squares, mean) of released stacks
+        self._pool = collections.deque()
+        self._buffers = None
+        self._data = None
+        self._sumsq = None
+        self._square = None
+        self._count = 0
+        self._t_start = self._t_end = None
+
+    def _alloc(self, shape):
+        """Set up the accumulators, reusing the buffers of released stacks
+
+        Buffers are not cleared: the first frame of a stack is copied.
+        """
+        buffers = None
+        while buffers is None:
+            try:
+                buffers = self._pool.pop()
+            except IndexError:
+                break
+            if buffers[0].shape != shape:
+                buffers = None
+        if buffers is None:
+            buffers = (np.empty(shape, dtype=self.dtype),
+                       None if self.sumsq_dtype is None \
+                       else np.empty(shape, dtype=self.sumsq_dtype),
+                       np.empty(shape, dtype=np.float32) \
+                       if self.mode == 'mean' and self.dtype != np.float32 \
+                       else None)
+        self._buffers = buffers
+        self._data, self._sumsq = buffers[:2]
+        if self._sumsq is not None and (self._square is None \
+                                        or self._square.shape != shape):
+            self._square = np.empty(shape, dtype=self.sumsq_dtype)
+
+    def _recycle(self, buffers):
+        """Take back the buffers of a released stack
+        """
+        if len(self._pool) < self.nbuffers:
+            self._pool.append(buffers)
+
+    def add(self, frame):
+        """Add a frame to the accumulator
+
+        Frame objects are released once added. Stack times come from the
+        frame acquisition times, or from the current time for arrays and
+        frames without them.
+
+        Parameters
+        ----------
+        frame : Frame or numpy.ndarray
+            frame to add
+
+        Returns
+        -------
+        stacks : list of Stack
+            completed stacks, if any: the current stack is completed before
+            the frame is added if its interval has elapsed or if the frame
+            shape differs, and after the frame is added once it holds
+            nframes frames
+        """
+        if isinstance(frame, np.ndarray):
+            data = frame
+            t_start = t_end = time.time()
+        else:
+            data = frame.data
+            t_end = time.time() if frame.t_end is None else frame.t_end
+            t_start = t_end if frame.t_start is None else frame.t_start
+        stacks = self.poll(t_start)
+        if self._data is not None and self._data.shape != data.shape:
+            stack = self.flush()
+            if stack is not None:
+                stacks.append(stack)
+        if self._data is None:
+            self._alloc(data.shape)
+        if self._count == 0:
+            np.copyto(self._data, data, casting='unsafe')
+            if self._sumsq is not None:
+                np.multiply(data, data, out=self._sumsq,
+                            dtype=self.sumsq_dtype)
+            self._t_start = t_start
+        else:
+            np.add(self._data, data, out=self._data, casting='unsafe')
+            if self._sumsq is not None:
+                np.multiply(data, data, out=self._square,
+                            dtype=self.sumsq_dtype)
+                np.add(self._sumsq, self._square, out=self._sumsq)
+        if not isinstance(frame, np.ndarray):
+            frame.release()
+        self._t_end = t_end
+        self._count += 1
+        if self.nframes and self._count >= self.nframes:
+            stacks.append(self.flush())
+        return stacks
+
+    def poll(self, t=None):
+        """Complete the current stack if its interval has elapsed
+
+        Parameters
+        ----------
+        t : float or None
+            current time, or acquisition start time of the next frame (in
+            seconds since the epoch; default: now)
+
+        Returns
+        -------
+        stacks : list of Stack
+            the completed stack, if any
+        """
+        if self._count == 0 or not self.interval:
+            return []
+        if (time.time() if t is None else t) - self._t_start < self.interval:
+            return []
+        return [self.flush()]
+
+    def __call__(self, frame):
+        """Stream stage interface: see add()
+
+        Returns
+        -------
+        stacks : list of Stack or None
+            completed stacks, or None if there are none
+        """
+        return self.add(frame) or None
+
+    def flush(self):
+        """Complete the current stack and reset the accumulator
+
+        Returns
+        -------
+        stack : Stack or None
+            current stack, or None if no frame was added
+        """
+        if self._count == 0:
+            return None
+        data, sumsq, mean = self._buffers
+        total = None
+        if self.mode == 'mean':
+            if mean is None:
+                data /= self._count
+            else:
+                # Keep the exact sum for variances
+                total = data
+                data = np.divide(data, self._count, out=mean,
+                                 dtype=np.float32)
+        # The completed stack keeps the buffers until it is released
+        stack = Stack(data, self._count, sumsq,
+                      self._t_start, self._t_end, self.mode == 'mean',
+                      total if sumsq is not None else None,
+                      functools.partial(self._recycle, self._buffers))
+        self._buffers = self._data = self._sumsq = None
+        self._count = 0
+        return stack
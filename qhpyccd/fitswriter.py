@@ -0,0 +1,321 @@
+"""
+Streaming FITS data cube writer for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import os
+import queue
+import threading
+import numpy as np
+
+FITS_BLOCK = 2880
+FITS_CARD = 80
+
+def format_card(key, value=None, comment=''):
+    """Format a FITS header card
+
+    Parameters
+    ----------
+    key : string
+        keyword (up to 8 characters), or 'COMMENT'/'HISTORY'
+    value : bool, int, float or string
+        keyword value
+    comment : string
+        card comment
+
+    Returns
+    -------
+    card : bytes
+        80-character card
+    """
+    key = key.upper()
+    if key in ('COMMENT', 'HISTORY', '') or value is None:
+        card = f'{key:8s}{comment}'
+    else:
+        if isinstance(value, (bool, np.bool_)):
+            text = f"{'T' if value else 'F':>20s}"
+        elif isinstance(value, (int, np.integer)):
+            text = f'{int(value):>20d}'
+        elif isinstance(value, (float, np.floating)):
+            text = f'{float(value):.15G}'
+            if '.' not in text and 'E' not in text:
+                text += '.'
+            text = f'{text:>20s}'
+        else:
+            text = "'" + f"{str(value).replace(chr(39), chr(39) * 2):8s}" + "'"
+            text = f'{text:20s}'
+        card = f'{key:8s}= {text}'
+        if comment:
+            card += f' / {comment}'
+    return f'{card[:FITS_CARD]:{FITS_CARD}s}'.encode('ascii', 'replace')
+
+
+def fits_header(shape, dtype, nframes, cards=()):
+    """Build the primary header of a FITS data cube
+
+    Parameters
+    ----------
+    shape : tuple
+        frame shape, e.g. (h, w) or (h, w, channels)
+    dtype : numpy.dtype
+        frame pixel type (uint8 or uint16)
+    nframes : int
+        number of frames in the cube
+    cards : sequence
+        extra (key, value[, comment]) cards
+
+    Returns
+    -------
+    header : bytes
+        header padded to a multiple of the FITS block size
+    naxis_offset : int
+        byte offset of the card holding the number of frames
+    """
+    dtype = np.dtype(dtype)
+    header = [format_card('SIMPLE', True, 'conforms to FITS standard'),
+              format_card('BITPIX', 8 if dtype.itemsize == 1 else 16,
+                          'array data type'),
+              format_card('NAXIS', len(shape) + 1, 'number of array dimensions')]
+    for i, n in enumerate(reversed(shape)):
+        header.append(format_card(f'NAXIS{i + 1}', n))
+    naxis_offset = len(header) * FITS_CARD
+    header.append(format_card(f'NAXIS{len(shape) + 1}', nframes,
+                              'number of frames'))
+    header.append(format_card('EXTEND', True))
+    if dtype.itemsize == 2:
+        header.append(format_card('BZERO', 32768, 'offset for unsigned data'))
+        header.append(format_card('BSCALE', 1))
+    for card in cards:
+        header.append(format_card(*card))
+    header.append(format_card('END'))
+    header = b''.join(header)
+    header += b' ' * (-len(header) % FITS_BLOCK)
+    return header, naxis_offset
+
+
+class FitsCubeWriter(object):
+    """Append frames to FITS data cubes from a dedicated I/O thread
+
+    Frames are converted to FITS byte order by write() into a small pool of
+    preallocated batch buffers. A background thread writes each full batch
+    with a single large sequential write after a preallocated header, fsyncs
+    every few batches and recycles the buffers. The number of frames in the
+    header is updated when each file is closed. Frames may be Frame objects
+    (e.g. from a live stream or sequence), which are released as soon as
+    they are converted, or arrays; the writer never keeps references to
+    their data.
+
+    Parameters
+    ----------
+    filename : string
+        output file name; with frames_per_file > 0, a format string with an
+        {index} field for the file number, e.g. 'night_{index:04d}.fits'
+    frames_per_file : int
+        number of frames per file for rolling output (0: a single cube)
+    cards : sequence or metadata.FrameMetadata
+        extra (key, value[, comment]) cards for the primary headers, or a
+        metadata record (e.g. cam.get_metadata())
+    queue_size : int
+        maximum number of frames waiting to be written (rounded up to whole
+        batches, with at least two batch buffers)
+    batch_bytes : int
+        approximate size of the sequential writes in bytes
+    fsync_frames : int
+        number of frames between two fsyncs (0: only when closing files)
+    """
+
+    def __init__(self, filename, frames_per_file=0, cards=(), queue_size=16,
+                 batch_bytes=8 << 20, fsync_frames=64):
+        self.filename = filename
+        self.frames_per_file = int(frames_per_file)
+        self.cards = cards.to_cards() if hasattr(cards, 'to_cards') \
+                     else list(cards)
+        self.queue_size = int(queue_size)
+        self.batch_bytes = int(batch_bytes)
+        self.fsync_frames = int(fsync_frames)
+        self.files = []
+        self.nwritten = 0
+        self.error = None
+        self._shape = None
+        self._dtype = None
+        # Free batch buffers, allocated with the first frame
+        self._free = queue.Queue()
+        self._batch = None
+        self._nbatch = 0
+        self._nfile = 0
+        # Full batches: (buffer, number of frames, end of file flag)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run,
+                                        name='qhpyccd-fits', daemon=True)
+        self._thread.start()
+
+    def _alloc_batches(self, data):
+        """Allocate the batch buffers for frames like data
+        """
+        nbatch = max(1, self.batch_bytes // data.nbytes)
+        if self.frames_per_file:
+            nbatch = min(nbatch, self.frames_per_file)
+        # FITS stores big-endian data, with unsigned 16-bit integers offset
+        # by BZERO=32768
+        dtype = 'u1' if data.dtype.itemsize == 1 else '>i2'
+        for i in range(max(2, -(-self.queue_size // nbatch))):
+            self._free.put(np.empty((nbatch,) + data.shape, dtype=dtype))
+
+    def _get_batch(self, timeout):
+        """Return a free batch buffer, waiting for the I/O thread if needed
+        """
+        # Wait in short steps so that a failing writer thread is noticed
+        step = 0.1 if timeout is None else min(0.1, timeout)
+        waited = 0.0
+        while True:
+            try:
+                return self._free.get(timeout=step)
+            except queue.Empty:
+                waited += step
+                if self.error is not None:
+                    raise self.error
+                if timeout is not None and waited >= timeout:
+                    raise queue.Full from None
+
+    def _queue_batch(self):
+        """Hand the current batch over to the I/O thread
+        """
+        file_end = self.frames_per_file > 0 \
+                   and self._nfile == self.frames_per_file
+        self._queue.put((self._batch, self._nbatch, file_end))
+        self._batch = None
+        self._nbatch = 0
+        if file_end:
+            self._nfile = 0
+
+    def write(self, frame, timeout=None):
+        """Queue a frame for writing
+
+        Blocks while all the batch buffers are waiting to be written. Raises
+        the error that stopped the writer thread, if any, ValueError if the
+        frame layout differs from that of the first frame, or queue.Full if
+        no batch buffer was freed within timeout.
+
+        Parameters
+        ----------
+        frame : Frame or numpy.ndarray
+            frame to write; Frame objects are released once converted
+        timeout : float or None
+            how long to wait for a free batch buffer (in seconds)
+        """
+        if self.error is not None:
+            raise self.error
+        if self._thread is None:
+            raise ValueError('writer is closed')
+        data = frame if isinstance(frame, np.ndarray) else frame.data
+        if self._shape is None:
+            if data.dtype not in (np.uint8, np.uint16):
+                raise ValueError(f'unsupported pixel type: {data.dtype}')
+            self._alloc_batches(data)
+            self._shape, self._dtype = data.shape, data.dtype
+        elif data.shape != self._shape or data.dtype != self._dtype:
+            raise ValueError('frame layout differs from the first frame')
+        if self._batch is None:
+            self._batch = self._get_batch(timeout)
+        # Converting here makes the writer independent of the frame buffer,
+        # which the caller may recycle right away
+        converted = self._batch[self._nbatch]
+        if data.dtype.itemsize == 1:
+            np.copyto(converted, data)
+        else:
+            np.subtract(data, 32768, out=converted, casting='unsafe')
+        if not isinstance(frame, np.ndarray):
+            frame.release()
+        self._nbatch += 1
+        self._nfile += 1
+        if self._nbatch == len(self._batch) \
+                or self._nfile == self.frames_per_file:
+            self._queue_batch()
+        return self
+
+    def _run(self):
+        """Writer thread loop
+        """
+        f = None
+        nfile = nsync = 0
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch, n, file_end = item
+                try:
+                    if f is None:
+                        f, naxis_offset = self._open(len(self.files))
+                    f.write(memoryview(batch[:n]).cast('B'))
+                finally:
+                    self._free.put(batch)
+                self.nwritten += n
+                nfile += n
+                nsync += n
+                if file_end:
+                    self._close(f, naxis_offset, nfile)
+                    f = None
+                    nfile = nsync = 0
+                elif self.fsync_frames and nsync >= self.fsync_frames:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    nsync = 0
+        except Exception as e:
+            self.error = e
+        finally:
+            if f is not None:
+                self._close(f, naxis_offset, nfile)
+            # Drop batches left behind after an error
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    self._free.put(item[0])
+
+    def _open(self, index):
+        """Open a new output file and write its header
+        """
+        filename = self.filename.format(index=index) if self.frames_per_file \
+                   else self.filename
+        header, naxis_offset = fits_header(self._shape, self._dtype,
+                                           self.frames_per_file, self.cards)
+        f = open(filename, 'wb')
+        f.write(header)
+        self.files.append(filename)
+        return f, naxis_offset
+
+    def _close(self, f, naxis_offset, nframes):
+        """Pad the data unit, update the frame count and close a file
+        """
+        itemsize = self._dtype.itemsize
+        nbytes = nframes * int(np.prod(self._shape)) * itemsize
+        f.write(b'\0' * (-nbytes % FITS_BLOCK))
+        f.seek(naxis_offset)
+        f.write(format_card(f'NAXIS{len(self._shape) + 1}', nframes,
+                            'number of frames'))
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+    def close(self):
+        """Write the queued frames, close the files and stop the I/O thread
+
+        Raises the error that stopped the writer thread, if any.
+        """
+        if self._thread is not None:
+            if self._nbatch:
+                self._queue_batch()
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,213 @@
+"""
+Frame buffers for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import collections
+import threading
+import numpy as np
+
+class FrameRing(object):
+    """Ring of preallocated, reusable frame buffers
+
+    The ring holds nslots raw byte buffers of identical size, allocated once.
+    Slots are handed out with acquire() and returned with release(), so that
+    frames can be kept around without copying while the camera keeps
+    writing into the other slots.
+
+    Parameters
+    ----------
+    nslots : int
+        number of buffers in the ring
+    shape : int[]
+        default frame shape
+    dtype : numpy.dtype
+        default frame pixel type
+    nbytes : int
+        size of each buffer in bytes (default: enough for shape and dtype)
+    """
+
+    def __init__(self, nslots, shape, dtype, nbytes=0):
+        if nslots < 1:
+            raise ValueError('at least one buffer slot is required')
+        self.nslots = int(nslots)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.nbytes = max(int(nbytes),
+                          int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.buffers = np.zeros([self.nslots, self.nbytes], dtype=np.uint8)
+        self._free = collections.deque(range(self.nslots))
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=0.0):
+        """Get a free slot from the ring
+
+        Parameters
+        ----------
+        timeout : float or None
+            how long to wait for a slot to be released (in seconds);
+            0 (default) returns immediately, None waits forever
+
+        Returns
+        -------
+        slot : int or None
+            index of the acquired slot, or None if no slot is free
+        """
+        with self._cond:
+            if not self._free and timeout != 0.0:
+                self._cond.wait_for(lambda: self._free, timeout)
+            if not self._free:
+                return None
+            return self._free.popleft()
+
+    def release(self, slot):
+        """Return a slot to the ring
+
+        Parameters
+        ----------
+        slot : int
+            index of the slot to release
+        """
+        with self._cond:
+            self._free.append(slot)
+            self._cond.notify()
+
+    def get_nfree(self):
+        """Return the number of free slots
+
+        Returns
+        -------
+        nfree : int
+            number of slots currently available
+        """
+        return len(self._free)
+
+    def view(self, slot, shape=None, dtype=None):
+        """Return a zero-copy array view of a slot
+
+        Parameters
+        ----------
+        slot : int
+            slot index
+        shape : int[]
+            array shape (default: ring default shape)
+        dtype : numpy.dtype
+            pixel type (default: ring default type)
+
+        Returns
+        -------
+        data : numpy.ndarray
+            view of the slot buffer
+        """
+        shape = self.shape if shape is None else tuple(shape)
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        return self.buffers[slot, :nbytes].view(dtype).reshape(shape)
+
+
+class Frame(object):
+    """Frame acquired into a ring buffer slot
+
+    The pixel array is a zero-copy view of the slot; it remains valid until
+    the frame is released, after which the camera may overwrite it.
+    Frames can be used as context managers to release them automatically.
+
+    Parameters
+    ----------
+    ring : FrameRing or None
+        ring owning the buffer (None for buffers not managed by a ring)
+    slot : int
+        ring slot index
+    data : numpy.ndarray
+        frame pixels
+    t_start : float
+        host time just before the SDK call starting the exposure (single
+        frames) or reading the frame (live frames), in seconds since the
+        epoch
+    t_end : float
+        host time just after the SDK call reading the frame (in seconds since
+        the epoch)
+    seqno : int
+        camera frame sequence number
+    sdk_layout : (int, int, int, int)
+        frame width, height, bits per pixel and number of channels, as
+        returned by the SDK
+
+    Attributes
+    ----------
+    data : numpy.ndarray
+        frame pixels (None once released)
+    slot : int
+        ring slot index
+    t_start, t_end : float or None
+        host acquisition times, if known
+    seqno : int or None
+        camera frame sequence number, if known: frames read from a camera
+        are numbered consecutively, starting from 0 when it is opened
+    sdk_layout : (int, int, int, int) or None
+        frame layout returned by the SDK, if known (before software
+        binning, if any)
+    metadata : metadata.FrameMetadata or None
+        camera settings and telemetry at acquisition time, if known
+    stats : dict or None
+        frame statistics, if computed (see stats.FrameStatistics)
+    """
+
+    def __init__(self, ring, slot, data, t_start=None, t_end=None,
+                 seqno=None, sdk_layout=None):
+        self._ring = ring
+        self._released = False
+        self.slot = slot
+        self.data = data
+        self.t_start = t_start
+        self.t_end = t_end
+        self.seqno = seqno
+        self.sdk_layout = sdk_layout
+        self.metadata = None
+        self.stats = None
+
+    def copy_metadata(self, frame):
+        """Copy the acquisition metadata of another frame
+
+        Used by processing stages producing a new frame from an acquired
+        one.
+
+        Parameters
+        ----------
+        frame : Frame
+            frame to copy the acquisition times, sequence number, SDK
+            layout and metadata record from
+        """
+        self.t_start = frame.t_start
+        self.t_end = frame.t_end
+        self.seqno = frame.seqno
+        self.sdk_layout = frame.sdk_layout
+        self.metadata = frame.metadata
+        return self
+
+    def release(self):
+        """Release the frame buffer slot back to its ring
+
+        Releasing a frame more than once has no effect.
+        """
+        if not self._released:
+            self._released = True
+            self.data = None
+            if self._ring is not None:
+                self._ring.release(self.slot)
+        return self
+
+    def is_released(self):
+        """Tell whether the frame has been released
+
+        Returns
+        -------
+        flag : boolean
+            True if the frame buffer was returned to the ring
+        """
+        return self._released
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
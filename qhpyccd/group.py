@@ -0,0 +1,148 @@
+"""
+Multi-camera operation for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import concurrent.futures
+import threading
+from .frames import Frame
+
+class CameraGroup(object):
+    """Set of QHYCCD cameras operated in parallel
+
+    The SDK resource is initialized and the cameras are scanned only once;
+    all the requested cameras are then opened and configured in parallel,
+    one worker thread per camera. Exposures are triggered on all the cameras
+    simultaneously from their worker threads, released together by a
+    barrier to minimize the start-time skew.
+
+    Parameters
+    ----------
+    cam_nos : int[] or None
+        indices of the cameras to open (default: all connected cameras)
+    **kwargs
+        qhyccd constructor arguments, applied to every camera
+
+    Attributes
+    ----------
+    cameras : list of qhyccd
+        camera objects, in cam_nos order
+    """
+
+    def __init__(self, cam_nos=None, **kwargs):
+        from . import qhyccd, init_sdk_resource, release_sdk_resource, \
+                      scan_cameras, error
+        init_sdk_resource()
+        try:
+            ncam = scan_cameras()
+            if cam_nos is None:
+                cam_nos = list(range(ncam))
+            if not cam_nos:
+                raise RuntimeError(error('QHYCCD_ERROR_NO_DEVICE'))
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(cam_nos), thread_name_prefix='qhpyccd-group')
+            futures = [self._executor.submit(qhyccd, cam_no=cam_no,
+                                             rescan=False, **kwargs) \
+                       for cam_no in cam_nos]
+            concurrent.futures.wait(futures)
+            try:
+                self.cameras = [future.result() for future in futures]
+            except BaseException:
+                # Close the cameras that did open
+                for future in futures:
+                    if future.exception() is None:
+                        future.result().close()
+                self._executor.shutdown(wait=True)
+                raise
+        finally:
+            # Opened cameras hold their own reference to the SDK resource
+            release_sdk_resource()
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __iter__(self):
+        return iter(self.cameras)
+
+    def __getitem__(self, index):
+        return self.cameras[index]
+
+    def call(self, method, *args, **kwargs):
+        """Call a qhyccd method on all the cameras in parallel
+
+        Parameters
+        ----------
+        method : string
+            qhyccd method name, e.g. 'set_gain'
+        *args, **kwargs
+            method arguments
+
+        Returns
+        -------
+        results : list
+            per-camera results
+        """
+        return list(self._executor.map(
+            lambda cam: getattr(cam, method)(*args, **kwargs), self.cameras))
+
+    def get_images(self):
+        """Acquire an image with all the cameras simultaneously
+
+        Every worker thread starts its exposure as soon as all of them are
+        ready, then reads its frame out.
+        Raises RunTimeError if any acquisition fails.
+
+        Returns
+        -------
+        frames : list of Frame
+            per-camera frames, with t_start the host time just before the
+            exposure was triggered and t_end the host time at the end of the
+            readout. Frame data is the image array of the camera, valid
+            until its next acquisition.
+        """
+        barrier = threading.Barrier(len(self.cameras))
+
+        def expose(index):
+            cam = self.cameras[index]
+            barrier.wait()
+            cam.start_exposure()
+            cam.read_image()
+            return Frame(None, index, cam.image).copy_metadata(cam.frame)
+
+        return list(self._executor.map(expose, range(len(self.cameras))))
+
+    def get_skew(self, frames):
+        """Return the start-time skew of a set of frames
+
+        Parameters
+        ----------
+        frames : list of Frame
+            frames returned by get_images()
+
+        Returns
+        -------
+        skew : float
+            difference between the latest and earliest exposure start times
+            (in seconds)
+        """
+        t_starts = [frame.t_start for frame in frames]
+        return max(t_starts) - min(t_starts)
+
+    def close(self):
+        """Close all the cameras and stop the worker threads
+
+        Exposures in progress are cancelled. Closing a group more than once
+        has no effect.
+        Raises RunTimeError if any camera fails to close.
+        """
+        cameras, self.cameras = self.cameras, []
+        try:
+            list(self._executor.map(lambda cam: cam.close(), cameras))
+        finally:
+            self._executor.shutdown(wait=True)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
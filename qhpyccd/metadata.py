@@ -0,0 +1,140 @@
+"""
+Frame metadata records for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import time
+from .fitswriter import format_card
+
+class FrameMetadata(object):
+    """Camera settings and telemetry attached to frames
+
+    Records are built by qhyccd.get_metadata() from the settings cached by
+    the camera object and the latest telemetry sample, without any SDK call.
+    Frames acquired with the same settings and telemetry sample share the
+    same record. The FITS cards of the settings are formatted once, when the
+    record is built, so that only the per-frame cards (acquisition time and
+    sequence number) are formatted for every frame header.
+
+    Parameters
+    ----------
+    configuration : dict
+        camera settings (see qhyccd.get_configuration())
+    camera : string or None
+        camera name
+    telemetry : dict or None
+        telemetry sample (see telemetry.TelemetrySampler.get_latest())
+    live : boolean
+        record of live frames, whose host acquisition time is that of the
+        frame read rather than of the exposure start
+
+    Attributes
+    ----------
+    cards : list of tuples
+        (key, value, comment) FITS cards of the settings and telemetry
+    """
+
+    def __init__(self, configuration, camera=None, telemetry=None,
+                 live=False):
+        self.configuration = configuration
+        self.camera = camera
+        self.telemetry = telemetry
+        self.live = live
+        cards = []
+        if camera is not None:
+            cards.append(('INSTRUME', camera, 'camera name'))
+        exptime = configuration.get('exptime')
+        if exptime is not None:
+            cards.append(('EXPTIME', exptime, '[s] exposure time'))
+        for key, name, comment in (('GAIN', 'gain', 'detector gain setting'),
+                                   ('OFFSET', 'offset',
+                                    'detector offset setting'),
+                                   ('READMODE', 'readmode', 'readout mode'),
+                                   ('BITDEPTH', 'bitdepth',
+                                    'digitization depth')):
+            value = configuration.get(name)
+            if value is not None:
+                cards.append((key, value, comment))
+        binsize = configuration.get('binsize')
+        if binsize is not None:
+            cards.append(('XBINNING', binsize[0], 'binning factor along X'))
+            cards.append(('YBINNING', binsize[1], 'binning factor along Y'))
+        region = configuration.get('region')
+        if region is not None:
+            cards.append(('XORGSUBF', region[0][0],
+                          'subframe origin along X'))
+            cards.append(('YORGSUBF', region[0][1],
+                          'subframe origin along Y'))
+        if telemetry is not None:
+            for key, name, comment in (
+                    ('CCD-TEMP', 'temperature', '[C] detector temperature'),
+                    ('SET-TEMP', 'target', '[C] target temperature'),
+                    ('COOLPWM', 'pwm', 'cooling power (0-255)')):
+                value = telemetry.get(name)
+                # NaN if the control is not available
+                if value is not None and value == value:
+                    cards.append((key, value, comment))
+        self.cards = cards
+        self._header = b''.join(format_card(*card) for card in cards)
+
+    def get_frame_cards(self, frame):
+        """Return the per-frame FITS cards
+
+        Parameters
+        ----------
+        frame : Frame
+            frame
+
+        Returns
+        -------
+        cards : list of tuples
+            (key, value, comment) cards of the frame acquisition time and
+            sequence number, if known; the SDK does not tell when live frames
+            were exposed, so their DATE-OBS is the host time at frame read
+        """
+        cards = []
+        if frame.t_start is not None:
+            t = frame.t_start
+            cards.append(('DATE-OBS', time.strftime('%Y-%m-%dT%H:%M:%S',
+                                                    time.gmtime(t)) \
+                          + f'.{int((t % 1.0) * 1e6):06d}',
+                          'UTC host time at frame read' if self.live \
+                          else 'UTC host time at exposure start'))
+        if frame.seqno is not None:
+            cards.append(('FRAMENO', frame.seqno, 'frame sequence number'))
+        return cards
+
+    def to_cards(self, frame=None):
+        """Return the FITS cards of the record
+
+        Parameters
+        ----------
+        frame : Frame or None
+            frame whose acquisition time and sequence number are added
+
+        Returns
+        -------
+        cards : list of tuples
+            (key, value, comment) cards, e.g. for the cards argument of
+            FitsCubeWriter
+        """
+        if frame is None:
+            return list(self.cards)
+        return self.cards + self.get_frame_cards(frame)
+
+    def to_header(self, frame=None):
+        """Return the formatted FITS header cards of the record
+
+        Parameters
+        ----------
+        frame : Frame or None
+            frame whose acquisition time and sequence number are added
+
+        Returns
+        -------
+        header : bytes
+            80-character cards, without END card nor padding
+        """
+        if frame is None:
+            return self._header
+        return self._header + b''.join(format_card(*card) \
+                                       for card in self.get_frame_cards(frame))
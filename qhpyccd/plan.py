@@ -0,0 +1,310 @@
+"""
+Exposure plans for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import time
+
+# Settings of an exposure specification, as accepted by qhyccd.configure()
+PLAN_SETTINGS = ('readmode', 'region', 'binsize', 'bitdepth', 'usbtraffic',
+                 'gain', 'offset', 'exptime')
+# Settings whose change cancels any exposure and may reallocate the buffers
+GEOMETRY_SETTINGS = ('region', 'binsize', 'bitdepth')
+# Rough duration of setting changes (in seconds): readout mode change,
+# geometry change (whatever the number of geometry settings changed), and
+# change of every control parameter
+TRANSITION_TIMES = {'readmode': 1.0, 'geometry': 0.2, 'control': 0.005}
+
+def _normalize(value):
+    """Convert lists to tuples, recursively, for setting comparisons
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    return value
+
+
+def _normalize_settings(settings, image_size=None):
+    """Normalize settings the way qhyccd.configure() interprets them
+
+    Lists are converted to tuples, and regions with a null size are given
+    the full raster size, if known.
+    """
+    settings = {name: _normalize(value) for name, value in settings.items() \
+                if value is not None}
+    region = settings.get('region')
+    if region is not None and image_size is not None \
+            and region[1][0] * region[1][1] == 0:
+        settings['region'] = (region[0], _normalize(list(image_size)))
+    return settings
+
+
+class ExposureSpec(object):
+    """Specification of a set of identical exposures
+
+    Parameters
+    ----------
+    nframes : int
+        number of frames
+    name : string or None
+        label, e.g. 'dark' or 'flat_r'
+    barrier : boolean
+        keep all the specifications listed before this one before it, and
+        all those listed after it after it, when the plan is reordered
+    **settings
+        camera settings (see PLAN_SETTINGS and qhyccd.configure()); missing
+        settings are left as they are when the exposures start
+    """
+
+    def __init__(self, nframes=1, name=None, barrier=False, **settings):
+        unknown = set(settings) - set(PLAN_SETTINGS)
+        if unknown:
+            raise ValueError(f'unknown settings: {", ".join(sorted(unknown))}')
+        if nframes < 1:
+            raise ValueError('at least one frame is required')
+        self.nframes = int(nframes)
+        self.name = name
+        self.barrier = barrier
+        self.settings = {name: _normalize(value) \
+                         for name, value in settings.items() \
+                         if value is not None}
+
+    def __repr__(self):
+        settings = ', '.join(f'{k}={v!r}' for k, v in self.settings.items())
+        return f'ExposureSpec({self.nframes}, name={self.name!r}, {settings})'
+
+
+class ExposurePlan(object):
+    """Plan of exposures, ordered to minimize camera reconfigurations
+
+    Specifications are reordered so that the costliest transitions (readout
+    mode, then frame geometry, then control parameters) are as rare as
+    possible: starting from the current camera settings, the specification
+    that is cheapest to switch to is run next, ties being broken by the
+    listed order. Reordering only happens between barriers (see
+    ExposureSpec). The plan is then run with pipelined exposures: successive
+    specifications with identical settings share a single qhyccd.sequence()
+    and are configured only once.
+
+        plan = ExposurePlan([ExposureSpec(10, 'dark', exptime=60.0),
+                             ExposureSpec(5, 'flat', exptime=2.0,
+                                          binsize=[2, 2]),
+                             ExposureSpec(20, 'science', exptime=60.0)])
+        for spec, frame in plan.run(cam):
+            ...
+        print(plan.report())
+
+    Parameters
+    ----------
+    specs : sequence of ExposureSpec or dict
+        exposure specifications (dictionaries are ExposureSpec arguments)
+    reorder : boolean
+        reorder the specifications (default); otherwise they are run in the
+        listed order
+    frame_overhead : float
+        estimated readout and transfer time of a frame (in seconds)
+    transition_times : dict or None
+        estimated durations of setting changes (default: TRANSITION_TIMES)
+
+    Attributes
+    ----------
+    steps : list of ExposureSpec
+        scheduled specifications, in execution order
+    timeline : list of dict
+        estimated and actual timing of every step (see get_timeline())
+    """
+
+    def __init__(self, specs, reorder=True, frame_overhead=0.1,
+                 transition_times=None):
+        self.specs = [spec if isinstance(spec, ExposureSpec) \
+                      else ExposureSpec(**spec) for spec in specs]
+        self.reorder = reorder
+        self.frame_overhead = frame_overhead
+        self.transition_times = dict(TRANSITION_TIMES)
+        if transition_times is not None:
+            self.transition_times.update(transition_times)
+        self.steps = []
+        self.timeline = []
+
+    def get_transition_time(self, state, settings, image_size=None):
+        """Return the estimated time needed to apply settings
+
+        Parameters
+        ----------
+        state : dict
+            current camera settings
+        settings : dict
+            settings to apply
+        image_size : int[2] or None
+            full raster size of the camera (see qhyccd.get_image_size()),
+            selected by regions with a null size
+
+        Returns
+        -------
+        duration : float
+            estimated duration (in seconds)
+        """
+        state = _normalize_settings(state, image_size)
+        changed = [name for name, value in \
+                   _normalize_settings(settings, image_size).items() \
+                   if value != state.get(name)]
+        times = self.transition_times
+        duration = 0.0
+        if 'readmode' in changed:
+            duration += times['readmode']
+        if any(name in GEOMETRY_SETTINGS for name in changed):
+            duration += times['geometry']
+        duration += times['control'] * sum(name not in GEOMETRY_SETTINGS \
+                                           and name != 'readmode' \
+                                           for name in changed)
+        return duration
+
+    def schedule(self, configuration=None, image_size=None):
+        """Order the specifications and estimate the timeline
+
+        Parameters
+        ----------
+        configuration : dict or None
+            initial camera settings (see qhyccd.get_configuration())
+        image_size : int[2] or None
+            full raster size of the camera (see qhyccd.get_image_size()),
+            selected by regions with a null size
+
+        Returns
+        -------
+        steps : list of ExposureSpec
+            specifications in execution order
+        """
+        state = _normalize_settings(configuration or {}, image_size)
+        settings = {id(spec): _normalize_settings(spec.settings, image_size) \
+                    for spec in self.specs}
+        # Split the plan into segments delimited by barriers
+        segments = [[]]
+        for spec in self.specs:
+            if spec.barrier and segments[-1]:
+                segments.append([])
+            segments[-1].append(spec)
+        steps = []
+        timeline = []
+        t = 0.0
+        for segment in segments:
+            remaining = list(segment)
+            while remaining:
+                if self.reorder:
+                    spec = min(remaining, key=lambda s: \
+                               self.get_transition_time(state,
+                                                        settings[id(s)]))
+                else:
+                    spec = remaining[0]
+                remaining.remove(spec)
+                transition = self.get_transition_time(state,
+                                                      settings[id(spec)])
+                state.update(settings[id(spec)])
+                duration = spec.nframes * (state.get('exptime', 0.0) \
+                                           + self.frame_overhead)
+                timeline.append({'name': spec.name, 'nframes': spec.nframes,
+                                 'settings': dict(state),
+                                 'estimated_start': t + transition,
+                                 'estimated_duration': duration,
+                                 'configure_time': None,
+                                 'actual_start': None,
+                                 'actual_duration': None})
+                t += transition + duration
+                steps.append(spec)
+        self.steps = steps
+        self.timeline = timeline
+        return steps
+
+    def run(self, cam, nbuffers=2, autorelease=True):
+        """Run the plan with a camera
+
+        Generator that schedules the plan from the current camera settings,
+        then configures the camera for each step and acquires its frames
+        with pipelined exposures (see qhyccd.sequence()). Closing the
+        generator early cancels the pending exposure.
+
+        Parameters
+        ----------
+        cam : qhyccd
+            camera
+        nbuffers : int
+            number of preallocated frame buffers
+        autorelease : boolean
+            release each frame automatically when the next one is requested
+            (default); otherwise frames must be released by the caller
+
+        Yields
+        ------
+        spec : ExposureSpec
+            specification of the frame
+        frame : Frame
+            acquired frame
+        """
+        self.schedule(cam.get_configuration(), cam.get_image_size())
+        t0 = time.time()
+        i = 0
+        while i < len(self.steps):
+            # Merge the following steps with identical settings
+            j = i + 1
+            while j < len(self.steps) and self.timeline[j]['settings'] \
+                    == self.timeline[i]['settings']:
+                j += 1
+            t = time.time()
+            cam.configure(**self.steps[i].settings)
+            self.timeline[i]['configure_time'] = time.time() - t
+            for k in range(i + 1, j):
+                self.timeline[k]['configure_time'] = 0.0
+            counts = [(k, self.steps[k].nframes) for k in range(i, j)]
+            sequence = cam.sequence(sum(n for k, n in counts), nbuffers,
+                                    autorelease=False)
+            try:
+                for k, n in counts:
+                    entry = self.timeline[k]
+                    for f in range(n):
+                        frame = next(sequence)
+                        if f == 0:
+                            entry['actual_start'] = frame.t_start - t0
+                        entry['actual_duration'] = frame.t_end - t0 \
+                                                   - entry['actual_start']
+                        yield self.steps[k], frame
+                        if autorelease:
+                            frame.release()
+            finally:
+                sequence.close()
+            i = j
+
+    def get_timeline(self):
+        """Return the estimated and actual timeline of the plan
+
+        Returns
+        -------
+        timeline : list of dict
+            for every step: 'name', 'nframes', 'settings' (camera settings
+            during the step), 'estimated_start' and 'estimated_duration'
+            (in seconds from the plan start, from schedule()),
+            'configure_time', 'actual_start' and 'actual_duration' (measured
+            by run(), from the exposure start of the first frame to the end
+            of the readout of the last one; None if not run)
+        """
+        return [dict(entry) for entry in self.timeline]
+
+    def report(self):
+        """Return a table of the estimated and actual timeline
+
+        Returns
+        -------
+        report : string
+            one line per step
+        """
+        lines = [f"{'Step':16s} {'Frames':>6s} {'Est. start':>11s} " \
+                 f"{'Start':>11s} {'Est. dur.':>11s} {'Duration':>11s} " \
+                 f"{'Config.':>9s}"]
+        fmt = lambda value, width, digits: f'{"-":>{width}s}' \
+              if value is None else f'{value:{width}.{digits}f}'
+        for entry in self.timeline:
+            lines.append(f"{str(entry['name']):16.16s} " \
+                         f"{entry['nframes']:6d} " \
+                         f"{fmt(entry['estimated_start'], 11, 3)} " \
+                         f"{fmt(entry['actual_start'], 11, 3)} " \
+                         f"{fmt(entry['estimated_duration'], 11, 3)} " \
+                         f"{fmt(entry['actual_duration'], 11, 3)} " \
+                         f"{fmt(entry['configure_time'], 9, 4)}")
+        return '\n'.join(lines)
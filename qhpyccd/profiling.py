@@ -0,0 +1,125 @@
+"""
+SDK call profiling for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import threading
+import time
+
+# Latency histogram bins: bin i counts calls lasting between 2**(i-1) and
+# 2**i nanoseconds
+HISTOGRAM_NBINS = 48
+
+class CallProfile(object):
+    """Timing statistics of SDK calls
+
+    Profiles are filled by an InstrumentedSDK, see
+    qhpyccd.enable_profiling() and qhpyccd.profile_sdk().
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, ns):
+        """Record the duration of a call
+
+        Parameters
+        ----------
+        name : string
+            SDK function name
+        ns : int
+            call duration (in nanoseconds)
+        """
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = [0, 0, 0, [0] * HISTOGRAM_NBINS]
+            stats[0] += 1
+            stats[1] += ns
+            if ns > stats[2]:
+                stats[2] = ns
+            stats[3][min(ns.bit_length(), HISTOGRAM_NBINS - 1)] += 1
+
+    def reset(self):
+        """Clear all statistics
+        """
+        with self._lock:
+            self._stats = {}
+        return self
+
+    def snapshot(self):
+        """Return a copy of the current statistics
+
+        Returns
+        -------
+        stats : dict
+            for every SDK function called, a dictionary with the number of
+            calls ('count'), the total, mean and maximum durations ('total',
+            'mean', 'max', in seconds) and the latency histogram
+            ('histogram': bin i counts calls lasting between 2**(i-1) and
+            2**i nanoseconds)
+        """
+        with self._lock:
+            items = [(name, s[0], s[1], s[2], list(s[3])) \
+                     for name, s in self._stats.items()]
+        return {name: {'count': count, 'total': total * 1e-9,
+                       'mean': total * 1e-9 / count, 'max': nsmax * 1e-9,
+                       'histogram': histogram} \
+                for name, count, total, nsmax, histogram in items}
+
+    def report(self):
+        """Return a table of the statistics, slowest functions first
+
+        Returns
+        -------
+        report : string
+            one line per SDK function
+        """
+        stats = sorted(self.snapshot().items(),
+                       key=lambda item: item[1]['total'], reverse=True)
+        lines = [f"{'Function':32s} {'Calls':>8s} {'Total (s)':>11s} " \
+                 f"{'Mean (ms)':>11s} {'Max (ms)':>11s}"]
+        for name, s in stats:
+            lines.append(f"{name:32s} {s['count']:8d} {s['total']:11.6f} " \
+                         f"{s['mean'] * 1e3:11.4f} {s['max'] * 1e3:11.4f}")
+        return '\n'.join(lines)
+
+
+class InstrumentedSDK(object):
+    """Timing proxy of the SDK backend
+
+    Every function of the wrapped backend is replaced with a wrapper that
+    times calls with time.perf_counter_ns() and records them into the
+    attached profiles. Wrappers are built on first access and cached.
+
+    Parameters
+    ----------
+    sdk : object
+        SDK backend (compiled QHYCCD SDK module or simulated SDK)
+    profiles : tuple of CallProfile
+        profiles to fill; the tuple is replaced, not modified, when
+        profiles are attached or detached
+    """
+
+    def __init__(self, sdk, profiles=()):
+        self.sdk = sdk
+        self.profiles = tuple(profiles)
+
+    def __getattr__(self, name):
+        attr = getattr(self.sdk, name)
+        if not callable(attr):
+            return attr
+        perf_counter_ns = time.perf_counter_ns
+
+        def wrapper(*args):
+            t = perf_counter_ns()
+            try:
+                return attr(*args)
+            finally:
+                ns = perf_counter_ns() - t
+                for profile in self.profiles:
+                    profile.record(name, ns)
+
+        wrapper.__name__ = name
+        setattr(self, name, wrapper)
+        return wrapper
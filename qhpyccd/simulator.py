@@ -0,0 +1,654 @@
+"""
+Simulated QHYCCD SDK for hardware-free testing and benchmarking.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+
+The simulator exposes the same ffi/lib pair as the compiled _qhpyccd_cffi
+module: ffi is built from qhpyccd.h in ABI mode (no library is loaded), and
+lib implements every function declared in qhpyccd.h in Python.
+
+It is selected by setting the QHPYCCD_BACKEND environment variable to 'sim'
+before importing qhpyccd, or at run time with qhpyccd.use_simulator().
+Its parameters may be set from the following environment variables:
+
+QHPYCCD_SIM_NCAM          number of simulated cameras (default: 1)
+QHPYCCD_SIM_SIZE          sensor size in pixels, e.g. 1024x768
+QHPYCCD_SIM_CHANNELS      number of image channels (default: 1)
+QHPYCCD_SIM_READOUT_RATE  readout rate in pixels/s (default: 1e8)
+QHPYCCD_SIM_LATENCY       fixed readout latency in s (default: 0)
+QHPYCCD_SIM_NOISE         pixel noise rms in ADUs (default: 10)
+QHPYCCD_SIM_ERROR_RATE    probability of a failed frame readout (default: 0)
+QHPYCCD_SIM_SEED          random seed
+"""
+import math
+import os
+import threading
+import time
+from cffi import FFI
+import numpy as np
+
+ffi = FFI()
+ffi.cdef(open(os.path.join(os.path.dirname(__file__), 'qhpyccd.h')).read())
+
+QHYCCD_SUCCESS = 0x00000000
+QHYCCD_ERROR = 0xFFFFFFFF
+QHYCCD_ERROR_UNSUPPORTED = 0xFFFFFFFD
+QHYCCD_ERROR_SETPARAMS = 0xFFFFFFFC
+QHYCCD_ERROR_EXPOSING = 0xFFFFFFFA
+QHYCCD_ERROR_GETTINGFAILED = 0xFFFFFFF7
+QHYCCD_ERROR_NO_MATCH = 0xFFFFFFF3
+QHYCCD_ERROR_SETRESOLUTION = 0xFFFFFFF0
+
+# Control codes (see CONTROL_CODES in qhpyccd)
+CONTROL_GAIN = 6
+CONTROL_OFFSET = 7
+CONTROL_EXPOSURE = 8
+CONTROL_SPEED = 9
+CONTROL_TRANSFERBIT = 10
+CONTROL_CHANNELS = 11
+CONTROL_USBTRAFFIC = 12
+CONTROL_CURTEMP = 14
+CONTROL_CURPWM = 15
+CONTROL_MANULPWM = 16
+CONTROL_COOLER = 18
+CAM_COLOR = 20
+CAM_BIN1X1MODE = 21
+CAM_BIN2X2MODE = 22
+CAM_BIN3X3MODE = 23
+CAM_BIN4X4MODE = 24
+CAM_8BITS = 34
+CAM_16BITS = 35
+CAM_SINGLEFRAMEMODE = 57
+CAM_LIVEVIDEOMODE = 58
+
+DEFAULT_CONTROLS = (CONTROL_GAIN, CONTROL_OFFSET, CONTROL_EXPOSURE,
+                    CONTROL_SPEED, CONTROL_TRANSFERBIT, CONTROL_USBTRAFFIC,
+                    CONTROL_CURTEMP, CONTROL_CURPWM, CONTROL_MANULPWM,
+                    CONTROL_COOLER, CAM_BIN1X1MODE, CAM_BIN2X2MODE,
+                    CAM_BIN4X4MODE, CAM_8BITS, CAM_16BITS,
+                    CAM_SINGLEFRAMEMODE, CAM_LIVEVIDEOMODE)
+
+READ_MODES = ('STANDARD MODE', 'HIGH GAIN MODE')
+
+AMBIENT_TEMPERATURE = 20.0
+
+
+class SimulatedCamera(object):
+    """State of a simulated camera
+
+    Parameters
+    ----------
+    index : int
+        camera index
+    size : int[2]
+        sensor size (W,H in pixels)
+    channels : int
+        number of image channels
+    controls : int[]
+        available control codes
+    """
+
+    def __init__(self, index, size, channels, controls):
+        self.index = index
+        self.idstr = f'QHYSIM-{index:04d}'
+        self.size = list(size)
+        self.channels = channels
+        self.controls = set(controls)
+        if channels > 1:
+            self.controls.update((CAM_COLOR, CONTROL_CHANNELS))
+        self.params = {
+            CONTROL_GAIN: 0.0,
+            CONTROL_OFFSET: 0.0,
+            CONTROL_EXPOSURE: 1000.0,
+            CONTROL_SPEED: 0.0,
+            CONTROL_TRANSFERBIT: 16.0,
+            CONTROL_CHANNELS: float(channels),
+            CONTROL_USBTRAFFIC: 30.0,
+            CONTROL_MANULPWM: 0.0,
+            CONTROL_COOLER: AMBIENT_TEMPERATURE
+        }
+        self.is_open = False
+        self.initialized = False
+        self.region = [0, 0] + self.size
+        self.binning = [1, 1]
+        self.bits = 16
+        self.stream_mode = 0
+        self.read_mode = 0
+        self.exp_start = None
+        # Set when an exposure is cancelled, to interrupt the readout wait
+        self.exp_cancelled = threading.Event()
+        self.live_start = None
+        self.live_count = 0
+        self.temperature = AMBIENT_TEMPERATURE
+        self.cooler_on = False
+        self.temp_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def get_geometry(self):
+        """Return the output frame geometry
+
+        Returns
+        -------
+        w, h, bpp, channels : int
+            frame width, height, bit depth and number of channels
+        """
+        return self.region[2] // self.binning[0], \
+               self.region[3] // self.binning[1], \
+               self.bits, self.channels
+
+    def update_temperature(self, tau):
+        """Relax the sensor temperature towards the cooler set point
+        """
+        now = time.monotonic()
+        target = self.params[CONTROL_COOLER] if self.cooler_on \
+                 else AMBIENT_TEMPERATURE
+        self.temperature = target + (self.temperature - target) \
+                           * math.exp(-(now - self.temp_time) / tau)
+        self.temp_time = now
+
+
+class SimulatedSDK(object):
+    """Simulated libqhyccd
+
+    Implements in Python every function declared in qhpyccd.h, with
+    synthetic frames produced at a configurable readout rate, latency and
+    noise level, and optional error injection.
+
+    Parameters
+    ----------
+    ncam : int
+        number of simulated cameras
+    size : int[2]
+        sensor size (W,H in pixels)
+    channels : int
+        number of image channels
+    readout_rate : float
+        readout rate in pixels per second
+    latency : float
+        fixed latency added to every frame readout (in seconds)
+    noise : float
+        rms of the pixel noise (in ADUs)
+    error_rate : float
+        probability for a frame readout to fail
+    cooler_tau : float
+        time constant of the simulated cooling system (in seconds)
+    seed : int
+        random generator seed
+    controls : int[]
+        available control codes (default: DEFAULT_CONTROLS)
+    """
+
+    def __init__(self, ncam=1, size=[1024, 768], channels=1,
+                 readout_rate=1.0e8, latency=0.0, noise=10.0,
+                 error_rate=0.0, cooler_tau=30.0, seed=None,
+                 controls=DEFAULT_CONTROLS):
+        self.readout_rate = float(readout_rate)
+        self.latency = float(latency)
+        self.noise = float(noise)
+        self.error_rate = float(error_rate)
+        self.cooler_tau = float(cooler_tau)
+        self.cameras = [SimulatedCamera(i, size, channels, controls) \
+                        for i in range(ncam)]
+        self.ncalls = {}
+        self._injected = {}
+        self._rng = np.random.default_rng(seed)
+        self._frames = {}
+        self._resource = False
+        self._scanned = False
+        self._log_level = 0
+
+    @classmethod
+    def from_environ(cls, environ=os.environ):
+        """Create a simulated SDK configured from environment variables
+
+        Parameters
+        ----------
+        environ : dict
+            environment (default: os.environ)
+
+        Returns
+        -------
+        sdk : SimulatedSDK
+            simulated SDK
+        """
+        kwargs = {}
+        if 'QHPYCCD_SIM_NCAM' in environ:
+            kwargs['ncam'] = int(environ['QHPYCCD_SIM_NCAM'])
+        if 'QHPYCCD_SIM_SIZE' in environ:
+            kwargs['size'] = [int(s) for s in \
+                              environ['QHPYCCD_SIM_SIZE'].lower().split('x')]
+        if 'QHPYCCD_SIM_CHANNELS' in environ:
+            kwargs['channels'] = int(environ['QHPYCCD_SIM_CHANNELS'])
+        for key, name in (('readout_rate', 'QHPYCCD_SIM_READOUT_RATE'),
+                          ('latency', 'QHPYCCD_SIM_LATENCY'),
+                          ('noise', 'QHPYCCD_SIM_NOISE'),
+                          ('error_rate', 'QHPYCCD_SIM_ERROR_RATE')):
+            if name in environ:
+                kwargs[key] = float(environ[name])
+        if 'QHPYCCD_SIM_SEED' in environ:
+            kwargs['seed'] = int(environ['QHPYCCD_SIM_SEED'])
+        return cls(**kwargs)
+
+    ############################# Error injection #############################
+
+    def inject_error(self, function, status=QHYCCD_ERROR, count=1):
+        """Make the next calls of an SDK function fail
+
+        Parameters
+        ----------
+        function : string
+            SDK function name, e.g. 'GetQHYCCDSingleFrame'
+        status : int
+            status code to return
+        count : int
+            number of calls that will fail
+        """
+        self._injected[function] = [status, count]
+        return self
+
+    def _fail(self, function):
+        """Count a call and return the injected status code, if any
+        """
+        self.ncalls[function] = self.ncalls.get(function, 0) + 1
+        injected = self._injected.get(function)
+        if injected is None:
+            return None
+        injected[1] -= 1
+        if injected[1] <= 0:
+            del self._injected[function]
+        return injected[0]
+
+    def _camera(self, handle):
+        """Return the simulated camera associated with a handle
+        """
+        index = int(ffi.cast('uintptr_t', handle)) - 1
+        if index < 0 or index >= len(self.cameras) \
+                or not self.cameras[index].is_open:
+            return None
+        return self.cameras[index]
+
+    def _frame(self, cam, w, h, bpp, channels):
+        """Return a synthetic frame with the requested geometry
+        """
+        key = (w, h, bpp, channels)
+        pool = self._frames.get(key)
+        if pool is None:
+            dtype = np.uint8 if bpp <= 8 else np.uint16
+            shape = [h, w, channels] if channels > 1 else [h, w]
+            maxval = np.iinfo(dtype).max
+            pool = []
+            for i in range(4):
+                frame = self._rng.normal(0.0, self.noise, size=shape)
+                frame += 1000.0 if bpp > 8 else 10.0
+                pool.append(np.clip(frame, 0, maxval).astype(dtype))
+            self._frames[key] = pool
+        base = pool[cam.live_count % len(pool)]
+        offset = int(cam.params[CONTROL_OFFSET])
+        if offset:
+            return base + np.array(offset).astype(base.dtype)
+        return base
+
+    def _readout(self, cam, w, h, bpp, channels, imgdata):
+        """Simulate the readout of a frame into the user buffer
+        """
+        time.sleep(self.latency + w * h * channels / self.readout_rate)
+        frame = self._frame(cam, w, h, bpp, channels)
+        ffi.memmove(imgdata, frame, frame.nbytes)
+
+    ############################### Resources #################################
+
+    def SetQHYCCDLogLevel(self, logLevel):
+        self._log_level = logLevel
+        return QHYCCD_SUCCESS
+
+    def InitQHYCCDResource(self):
+        status = self._fail('InitQHYCCDResource')
+        if status is not None:
+            return status
+        self._resource = True
+        return QHYCCD_SUCCESS
+
+    def ReleaseQHYCCDResource(self):
+        status = self._fail('ReleaseQHYCCDResource')
+        if status is not None:
+            return status
+        self._resource = False
+        return QHYCCD_SUCCESS
+
+    ################################# Cameras #################################
+
+    def ScanQHYCCD(self):
+        status = self._fail('ScanQHYCCD')
+        if status is not None:
+            return status
+        self._scanned = True
+        return len(self.cameras)
+
+    def GetQHYCCDId(self, index, id):
+        status = self._fail('GetQHYCCDId')
+        if status is not None:
+            return status
+        if not self._scanned or index >= len(self.cameras):
+            return QHYCCD_ERROR_NO_MATCH
+        idstr = self.cameras[index].idstr.encode()
+        ffi.memmove(id, idstr + b'\0', len(idstr) + 1)
+        return QHYCCD_SUCCESS
+
+    def OpenQHYCCD(self, id):
+        if self._fail('OpenQHYCCD') is not None:
+            return ffi.NULL
+        idstr = ffi.string(id).decode()
+        for cam in self.cameras:
+            if cam.idstr == idstr:
+                cam.is_open = True
+                return ffi.cast('qhyccd_handle *', cam.index + 1)
+        return ffi.NULL
+
+    def CloseQHYCCD(self, handle):
+        status = self._fail('CloseQHYCCD')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        cam.is_open = False
+        cam.initialized = False
+        return QHYCCD_SUCCESS
+
+    def InitQHYCCD(self, handle):
+        status = self._fail('InitQHYCCD')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        cam.initialized = True
+        return QHYCCD_SUCCESS
+
+    ################################ Controls #################################
+
+    def IsQHYCCDControlAvailable(self, handle, controlId):
+        status = self._fail('IsQHYCCDControlAvailable')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        return QHYCCD_SUCCESS if controlId in cam.controls \
+               else QHYCCD_ERROR_UNSUPPORTED
+
+    def SetQHYCCDParam(self, handle, controlId, value):
+        status = self._fail('SetQHYCCDParam')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        if controlId not in cam.controls \
+                or controlId in (CONTROL_CURTEMP, CONTROL_CURPWM):
+            return QHYCCD_ERROR_SETPARAMS
+        with cam.lock:
+            if controlId == CONTROL_COOLER:
+                cam.update_temperature(self.cooler_tau)
+                cam.cooler_on = True
+            elif controlId == CONTROL_TRANSFERBIT:
+                cam.bits = 8 if value <= 8 else 16
+            cam.params[controlId] = float(value)
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDParam(self, handle, controlId):
+        if self._fail('GetQHYCCDParam') is not None:
+            return float(QHYCCD_ERROR)
+        cam = self._camera(handle)
+        if cam is None or controlId not in cam.controls:
+            return float(QHYCCD_ERROR)
+        with cam.lock:
+            if controlId == CONTROL_CURTEMP:
+                cam.update_temperature(self.cooler_tau)
+                return round(cam.temperature, 1)
+            elif controlId == CONTROL_CURPWM:
+                cam.update_temperature(self.cooler_tau)
+                if not cam.cooler_on:
+                    return 0.0
+                return float(min(255, max(0, round(
+                    (AMBIENT_TEMPERATURE - cam.temperature) * 5.0))))
+            return cam.params.get(controlId, 0.0)
+
+    ################################ Geometry #################################
+
+    def SetQHYCCDResolution(self, handle, x, y, xsize, ysize):
+        status = self._fail('SetQHYCCDResolution')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        if xsize == 0 or ysize == 0 or x + xsize > cam.size[0] \
+                or y + ysize > cam.size[1]:
+            return QHYCCD_ERROR_SETRESOLUTION
+        cam.region = [x, y, xsize, ysize]
+        return QHYCCD_SUCCESS
+
+    def SetQHYCCDBinMode(self, handle, wbin, hbin):
+        status = self._fail('SetQHYCCDBinMode')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        mode = {1: CAM_BIN1X1MODE, 2: CAM_BIN2X2MODE,
+                3: CAM_BIN3X3MODE, 4: CAM_BIN4X4MODE}.get(wbin)
+        if wbin != hbin or mode not in cam.controls:
+            return QHYCCD_ERROR_UNSUPPORTED
+        cam.binning = [wbin, hbin]
+        return QHYCCD_SUCCESS
+
+    def SetQHYCCDBitsMode(self, handle, bits):
+        status = self._fail('SetQHYCCDBitsMode')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None or bits not in (8, 16):
+            return QHYCCD_ERROR
+        cam.bits = bits
+        cam.params[CONTROL_TRANSFERBIT] = float(bits)
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDChipInfo(self, h, chipw, chiph, imagew, imageh, \
+                          pixelw, pixelh, bpp):
+        status = self._fail('GetQHYCCDChipInfo')
+        if status is not None:
+            return status
+        cam = self._camera(h)
+        if cam is None:
+            return QHYCCD_ERROR
+        pixelw[0] = pixelh[0] = 3.76
+        imagew[0], imageh[0] = cam.size
+        chipw[0] = cam.size[0] * 3.76e-3
+        chiph[0] = cam.size[1] * 3.76e-3
+        bpp[0] = 16
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDOverScanArea(self, h, startX, startY, sizeX, sizeY):
+        status = self._fail('GetQHYCCDOverScanArea')
+        if status is not None:
+            return status
+        cam = self._camera(h)
+        if cam is None:
+            return QHYCCD_ERROR
+        startX[0], startY[0], sizeX[0], sizeY[0] = 0, 0, 0, 0
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDEffectiveArea(self, h, startX, startY, sizeX, sizeY):
+        status = self._fail('GetQHYCCDEffectiveArea')
+        if status is not None:
+            return status
+        cam = self._camera(h)
+        if cam is None:
+            return QHYCCD_ERROR
+        startX[0], startY[0] = 0, 0
+        sizeX[0], sizeY[0] = cam.size
+        return QHYCCD_SUCCESS
+
+    ############################### Versions ##################################
+
+    def GetQHYCCDSDKVersion(self, year, month, day, subday):
+        year[0], month[0], day[0], subday[0] = 21, 4, 15, 16
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDFWVersion(self, h, buf):
+        status = self._fail('GetQHYCCDFWVersion')
+        if status is not None:
+            return status
+        if self._camera(h) is None:
+            return QHYCCD_ERROR
+        buf[0] = 0x43
+        buf[1] = 15
+        return QHYCCD_SUCCESS
+
+    ################################ Readout ##################################
+
+    def GetQHYCCDNumberOfReadModes(self, h, numModes):
+        if self._camera(h) is None:
+            return QHYCCD_ERROR
+        numModes[0] = len(READ_MODES)
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDReadModeResolution(self, h, modeNumber, width, height):
+        cam = self._camera(h)
+        if cam is None or modeNumber >= len(READ_MODES):
+            return QHYCCD_ERROR
+        width[0], height[0] = cam.size
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDReadModeName(self, h, modeNumber, name):
+        if self._camera(h) is None or modeNumber >= len(READ_MODES):
+            return QHYCCD_ERROR
+        namestr = READ_MODES[modeNumber].encode()
+        ffi.memmove(name, namestr + b'\0', len(namestr) + 1)
+        return QHYCCD_SUCCESS
+
+    def SetQHYCCDReadMode(self, h, modeNumber):
+        status = self._fail('SetQHYCCDReadMode')
+        if status is not None:
+            return status
+        cam = self._camera(h)
+        if cam is None or modeNumber >= len(READ_MODES):
+            return QHYCCD_ERROR
+        cam.read_mode = modeNumber
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDReadMode(self, h, modeNumber):
+        cam = self._camera(h)
+        if cam is None:
+            return QHYCCD_ERROR
+        modeNumber[0] = cam.read_mode
+        return QHYCCD_SUCCESS
+
+    def SetQHYCCDStreamMode(self, handle, mode):
+        status = self._fail('SetQHYCCDStreamMode')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None or mode not in (0, 1):
+            return QHYCCD_ERROR
+        cam.stream_mode = mode
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDMemLength(self, handle):
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        return cam.size[0] * cam.size[1] * 2 * cam.channels
+
+    def ExpQHYCCDSingleFrame(self, handle):
+        status = self._fail('ExpQHYCCDSingleFrame')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None or cam.stream_mode != 0:
+            return QHYCCD_ERROR
+        if cam.exp_start is not None:
+            return QHYCCD_ERROR_EXPOSING
+        cam.exp_cancelled.clear()
+        cam.exp_start = time.monotonic()
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDSingleFrame(self, handle, w, h, bpp, channels, imgdata):
+        status = self._fail('GetQHYCCDSingleFrame')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None or cam.exp_start is None:
+            return QHYCCD_ERROR
+        wait = cam.exp_start + cam.params[CONTROL_EXPOSURE] * 1.0e-6 \
+               - time.monotonic()
+        if wait > 0.0:
+            cam.exp_cancelled.wait(wait)
+        if cam.exp_start is None or cam.exp_cancelled.is_set():
+            # Exposure cancelled meanwhile
+            return QHYCCD_ERROR
+        cam.exp_start = None
+        if self.error_rate > 0.0 and self._rng.random() < self.error_rate:
+            return QHYCCD_ERROR_GETTINGFAILED
+        w[0], h[0], bpp[0], channels[0] = cam.get_geometry()
+        self._readout(cam, w[0], h[0], bpp[0], channels[0], imgdata)
+        cam.live_count += 1
+        return QHYCCD_SUCCESS
+
+    def CancelQHYCCDExposingAndReadout(self, handle):
+        status = self._fail('CancelQHYCCDExposingAndReadout')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        cam.exp_start = None
+        cam.exp_cancelled.set()
+        return QHYCCD_SUCCESS
+
+    def BeginQHYCCDLive(self, handle):
+        status = self._fail('BeginQHYCCDLive')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None or cam.stream_mode != 1:
+            return QHYCCD_ERROR
+        cam.live_start = time.monotonic()
+        cam.live_count = 0
+        return QHYCCD_SUCCESS
+
+    def GetQHYCCDLiveFrame(self, handle, w, h, bpp, channels, imgdata):
+        status = self._fail('GetQHYCCDLiveFrame')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None or cam.live_start is None:
+            return QHYCCD_ERROR
+        gw, gh, gbpp, gchannels = cam.get_geometry()
+        period = max(cam.params[CONTROL_EXPOSURE] * 1.0e-6,
+                     gw * gh * gchannels / self.readout_rate)
+        # Frames not collected in time are lost, as with the real camera
+        count = int((time.monotonic() - cam.live_start) / period)
+        if count <= cam.live_count:
+            return QHYCCD_ERROR
+        cam.live_count = count
+        if self.error_rate > 0.0 and self._rng.random() < self.error_rate:
+            return QHYCCD_ERROR_GETTINGFAILED
+        w[0], h[0], bpp[0], channels[0] = gw, gh, gbpp, gchannels
+        time.sleep(self.latency)
+        frame = self._frame(cam, gw, gh, gbpp, gchannels)
+        ffi.memmove(imgdata, frame, frame.nbytes)
+        return QHYCCD_SUCCESS
+
+    def StopQHYCCDLive(self, handle):
+        status = self._fail('StopQHYCCDLive')
+        if status is not None:
+            return status
+        cam = self._camera(handle)
+        if cam is None:
+            return QHYCCD_ERROR
+        cam.live_start = None
+        return QHYCCD_SUCCESS
+
+
+lib = SimulatedSDK.from_environ()
@@ -0,0 +1,150 @@
+"""
+Fast frame statistics for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import numpy as np
+
+# Number of pixels histogrammed at once, small enough to stay in cache
+CHUNK_PIXELS = 1 << 20
+
+def frame_histogram(data, stride=1, roi=None):
+    """Compute the full histogram of an integer frame in a single pass
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        uint8 or uint16 frame, of shape (h, w) or (h, w, channels)
+    stride : int
+        pixel subsampling step along both axes
+    roi : (int[2], int[2]) or None
+        region of interest ([startX, startY], [sizeX, sizeY]) in frame
+        pixels (default: full frame)
+
+    Returns
+    -------
+    histogram : numpy.ndarray
+        int64 number of pixels for every value (256 or 65536 bins)
+    """
+    if data.dtype not in (np.uint8, np.uint16):
+        raise ValueError(f'unsupported pixel type: {data.dtype}')
+    if roi is not None:
+        (x, y), (w, h) = roi
+        data = data[y:y + h, x:x + w]
+    if stride > 1:
+        data = data[::stride, ::stride]
+    nvalues = 1 << (8 * data.dtype.itemsize)
+    histogram = np.zeros(nvalues, dtype=np.int64)
+    if data.size == 0:
+        return histogram
+    # Process blocks of rows so that bincount() temporaries stay small
+    row_pixels = data[0].size
+    nrows = max(1, CHUNK_PIXELS // row_pixels)
+    for i in range(0, len(data), nrows):
+        histogram += np.bincount(data[i:i + nrows].ravel(),
+                                 minlength=nvalues)
+    return histogram
+
+
+def histogram_stats(histogram, saturation=None, nbins=256):
+    """Derive pixel statistics from a full histogram
+
+    Sums are computed exactly with integers, so that no precision is lost
+    for large frames.
+
+    Parameters
+    ----------
+    histogram : numpy.ndarray
+        number of pixels for every value (see frame_histogram())
+    saturation : int or None
+        lowest saturated pixel value (default: largest possible value)
+    nbins : int or None
+        number of bins of the returned histogram, a power of 2 (None: one
+        bin per value)
+
+    Returns
+    -------
+    stats : dict
+        'npix', 'mean', 'std', 'min', 'max', 'nsaturated' and 'histogram'
+    """
+    nvalues = len(histogram)
+    npix = int(histogram.sum())
+    if saturation is None:
+        saturation = nvalues - 1
+    if nbins is None or nbins >= nvalues:
+        rebinned = histogram
+    else:
+        rebinned = histogram.reshape(nbins, -1).sum(axis=1)
+    stats = {'npix': npix, 'nsaturated': int(histogram[saturation:].sum()),
+             'histogram': rebinned}
+    if npix == 0:
+        stats.update(dict.fromkeys(('mean', 'std', 'min', 'max'), np.nan))
+        return stats
+    values = np.arange(nvalues, dtype=np.int64)
+    s1 = int(histogram @ values)
+    s2 = int(histogram @ (values * values))
+    nonzero = np.flatnonzero(histogram)
+    stats['mean'] = s1 / npix
+    stats['std'] = float(np.sqrt(max(s2 * npix - s1 * s1, 0))) / npix
+    stats['min'] = int(nonzero[0])
+    stats['max'] = int(nonzero[-1])
+    return stats
+
+
+def frame_stats(data, stride=1, roi=None, saturation=None, nbins=256):
+    """Compute the statistics of an integer frame in a single pass
+
+    The frame is read once to build its full histogram, from which the
+    mean, standard deviation, extrema and number of saturated pixels are
+    derived. No frame-sized floating point temporaries are created.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        uint8 or uint16 frame
+    stride : int
+        pixel subsampling step along both axes
+    roi : (int[2], int[2]) or None
+        region of interest ([startX, startY], [sizeX, sizeY])
+    saturation : int or None
+        lowest saturated pixel value (default: largest possible value)
+    nbins : int or None
+        number of histogram bins, a power of 2 (None: one bin per value)
+
+    Returns
+    -------
+    stats : dict
+        see histogram_stats()
+    """
+    return histogram_stats(frame_histogram(data, stride, roi),
+                           saturation, nbins)
+
+
+class FrameStatistics(object):
+    """Stream stage attaching statistics to every frame
+
+    Use as a live stream stage, e.g.
+    cam.start_stream(stages=[FrameStatistics(stride=4)]); the statistics
+    are then available as frame.stats.
+
+    Parameters
+    ----------
+    stride : int
+        pixel subsampling step along both axes
+    roi : (int[2], int[2]) or None
+        region of interest ([startX, startY], [sizeX, sizeY])
+    saturation : int or None
+        lowest saturated pixel value (default: largest possible value)
+    nbins : int or None
+        number of histogram bins, a power of 2 (None: one bin per value)
+    """
+
+    def __init__(self, stride=1, roi=None, saturation=None, nbins=256):
+        self.stride = stride
+        self.roi = roi
+        self.saturation = saturation
+        self.nbins = nbins
+
+    def __call__(self, frame):
+        frame.stats = frame_stats(frame.data, self.stride, self.roi,
+                                  self.saturation, self.nbins)
+        return frame
@@ -0,0 +1,407 @@
+"""
+Background live frame streaming for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import collections
+import queue
+import threading
+
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+# A frame interval longer than GAP_FACTOR frame periods reveals dropped frames
+GAP_FACTOR = 1.5
+# Number of recent frame intervals the frame period is estimated from
+PERIOD_WINDOW = 15
+
+class LiveCounters(object):
+    """Running counters of live frames
+
+    The SDK does not number live frames: frames it dropped (e.g. because no
+    ring buffer was free) are inferred from the gaps between frame arrival
+    times. The frame period is estimated as the median of the last
+    PERIOD_WINDOW frame intervals, which is insensitive to both gaps and
+    bursts of frames buffered by the SDK. An interval longer than GAP_FACTOR
+    periods counts as round(interval / period) - 1 dropped frames.
+    """
+
+    def __init__(self):
+        self.ndelivered = 0
+        self.ndropped = 0
+        self.period = None
+        self.t_first = self.t_last = None
+        self._intervals = collections.deque(maxlen=PERIOD_WINDOW)
+        self._lock = threading.Lock()
+
+    def update(self, t):
+        """Account for a new frame
+
+        Parameters
+        ----------
+        t : float
+            host arrival time of the frame (in seconds)
+        """
+        with self._lock:
+            if self.t_last is None:
+                self.t_first = t
+            else:
+                dt = t - self.t_last
+                period = self.period
+                # Wait for a few intervals before trusting the period
+                if len(self._intervals) >= 3 and period > 0.0 \
+                        and dt > GAP_FACTOR * period:
+                    self.ndropped += max(int(round(dt / period)) - 1, 1)
+                self._intervals.append(dt)
+                intervals = sorted(self._intervals)
+                self.period = intervals[len(intervals) // 2]
+            self.t_last = t
+            self.ndelivered += 1
+        return self
+
+    def get_counters(self):
+        """Return the current counters
+
+        Returns
+        -------
+        counters : dict
+            'ndelivered': number of frames delivered by the SDK,
+            'ndropped': number of frames dropped by the SDK (inferred),
+            'fps': achieved frame rate since the first frame,
+            'period': running estimate of the camera frame period (in
+            seconds, None before the second frame)
+        """
+        with self._lock:
+            n = self.ndelivered
+            span = self.t_last - self.t_first if n > 1 else 0.0
+            return {'ndelivered': n, 'ndropped': self.ndropped,
+                    'fps': (n - 1) / span if span > 0.0 else 0.0,
+                    'period': self.period}
+
+
+class FrameQueue(object):
+    """Bounded queue of frames with a configurable overflow policy
+
+    Frames dropped because of an overflow are released back to their ring.
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of queued frames
+    overflow : string
+        'block', 'drop-oldest' or 'drop-newest' (see OVERFLOW_POLICIES)
+    """
+
+    def __init__(self, maxsize, overflow='block'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'unknown overflow policy: {overflow}')
+        if maxsize < 1:
+            raise ValueError('queue size must be at least 1')
+        self.maxsize = int(maxsize)
+        self.overflow = overflow
+        self.ndropped = 0
+        self._frames = collections.deque()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, frame, timeout=None):
+        """Append a frame to the queue
+
+        Parameters
+        ----------
+        frame : Frame
+            frame to append
+        timeout : float or None
+            how long to wait for room in 'block' mode (in seconds);
+            None waits forever
+
+        Returns
+        -------
+        flag : boolean
+            False if the frame could not be queued before the timeout
+            (in which case it is still owned by the caller)
+        """
+        with self._cond:
+            if len(self._frames) >= self.maxsize:
+                if self.overflow == 'block':
+                    if not self._cond.wait_for(
+                        lambda: len(self._frames) < self.maxsize \
+                                or self._closed, timeout) or self._closed:
+                        return False
+                elif self.overflow == 'drop-oldest':
+                    self._frames.popleft().release()
+                    self.ndropped += 1
+                else:
+                    frame.release()
+                    self.ndropped += 1
+                    return True
+            self._frames.append(frame)
+            self._cond.notify_all()
+        return True
+
+    def append(self, frame):
+        """Append a frame to the queue, even if full or closed
+
+        Parameters
+        ----------
+        frame : Frame
+            frame to append
+        """
+        with self._cond:
+            self._frames.append(frame)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Remove and return the oldest frame from the queue
+
+        Parameters
+        ----------
+        timeout : float or None
+            how long to wait for a frame (in seconds); None waits forever
+
+        Returns
+        -------
+        frame : Frame or None
+            oldest frame, or None if the queue is closed and empty.
+            Raises queue.Empty if no frame arrived before the timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self._frames or self._closed, timeout):
+                raise queue.Empty
+            if not self._frames:
+                return None
+            frame = self._frames.popleft()
+            self._cond.notify_all()
+            return frame
+
+    def qsize(self):
+        """Return the number of queued frames
+        """
+        return len(self._frames)
+
+    def close(self):
+        """Close the queue, waking up all waiting producers and consumers
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def clear(self):
+        """Release all the queued frames
+        """
+        with self._cond:
+            while self._frames:
+                self._frames.popleft().release()
+            self._cond.notify_all()
+
+
+class LiveStream(object):
+    """Live frame stream fed by a background acquisition thread
+
+    The reader thread owns the live frame loop of the camera: it reads frames
+    into free slots of the camera live ring (with the GIL released during the
+    SDK calls) and pushes them into a bounded FrameQueue. Consumers iterate
+    over the stream, and must release every frame they get.
+    Streams are normally created with qhyccd.start_stream().
+
+    Parameters
+    ----------
+    cam : qhyccd
+        camera, already in live mode with a live ring
+    queue_size : int
+        maximum number of queued frames
+    overflow : string
+        queue overflow policy (see OVERFLOW_POLICIES)
+    poll_interval : float
+        delay between two attempts to read a frame that is not ready yet
+        (in seconds)
+    restore_mode : string or None
+        camera stream mode to restore when the stream stops
+    stages : sequence of callables
+        processing stages run by the reader thread on every frame, in
+        order. A stage returns the object passed to the next stage (e.g.
+        the frame itself, or a new frame, releasing the original), a list of
+        objects, each passed to the next stage, or None if it consumed the
+        frame, in which case nothing is queued. Stages holding partial
+        results (e.g. FrameAccumulator) may also have a poll() method, called
+        while no frame arrives, and a flush() method, called when the stream
+        stops; both return the list of completed results, or a single one
+        (or None) for flush(). Queued objects must have a release() method.
+    """
+
+    def __init__(self, cam, queue_size=4, overflow='block',
+                 poll_interval=0.0005, restore_mode=None, stages=()):
+        self.cam = cam
+        self.counters = cam.live_counters
+        self.restore_mode = restore_mode
+        self.stages = list(stages)
+        self.queue = FrameQueue(queue_size, overflow)
+        self.poll_interval = poll_interval
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._flushed = False
+
+    def start(self):
+        """Start the reader thread
+        """
+        self._stop.clear()
+        self._flushed = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='qhpyccd-live', daemon=True)
+        self._thread.start()
+        return self
+
+    def _process(self, objects, start=0):
+        """Run objects through the stages, starting from stage start
+
+        Returns
+        -------
+        results : list
+            objects output by the last stage
+        """
+        for stage in self.stages[start:]:
+            results = []
+            for obj in objects:
+                obj = stage(obj)
+                if isinstance(obj, list):
+                    results.extend(obj)
+                elif obj is not None:
+                    results.append(obj)
+            objects = results
+        return objects
+
+    def _collect(self, method):
+        """Collect the results of a poll() or flush() method of the stages
+
+        Returns
+        -------
+        results : list
+            objects output by the last stage
+        """
+        results = []
+        for i, stage in enumerate(self.stages):
+            collect = getattr(stage, method, None)
+            if collect is None:
+                continue
+            objects = collect()
+            if objects is None:
+                continue
+            if not isinstance(objects, list):
+                objects = [objects]
+            results.extend(self._process(objects, i + 1))
+        return results
+
+    def _run(self):
+        """Reader thread loop
+        """
+        cam = self.cam
+        stop = self._stop
+        try:
+            while not stop.is_set():
+                frame = cam.poll_live_frame(timeout=self.poll_interval)
+                if frame is None:
+                    results = self._collect('poll')
+                    if not results:
+                        stop.wait(self.poll_interval)
+                        continue
+                else:
+                    results = self._process([frame])
+                for i, obj in enumerate(results):
+                    while not self.queue.put(obj, timeout=0.1):
+                        if stop.is_set():
+                            for pending in results[i:]:
+                                pending.release()
+                            return
+        except Exception as e:
+            self.error = e
+        finally:
+            self.queue.close()
+
+    def stop(self):
+        """Stop the reader thread and live acquisition
+
+        Frames still in the queue are released; frames already handed to
+        the consumer remain valid until released. The camera is set back
+        to restore_mode, if any. The stages are then flushed (e.g. the
+        pending stack of a FrameAccumulator is completed): their results
+        can still be read from the stream.
+        """
+        self._stop.set()
+        self.queue.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.cam.stop_live()
+            if self.restore_mode is not None \
+                    and self.restore_mode != self.cam.get_stream_mode():
+                self.cam.set_stream_mode(self.restore_mode)
+        self.queue.clear()
+        if not self._flushed:
+            self._flushed = True
+            for obj in self._collect('flush'):
+                self.queue.append(obj)
+        return self
+
+    def is_running(self):
+        """Tell whether the reader thread is running
+
+        Returns
+        -------
+        flag : boolean
+            True if the reader thread is alive
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def get(self, timeout=None):
+        """Return the next frame from the stream
+
+        Raises queue.Empty if no frame arrived before the timeout, and
+        re-raises any error that stopped the reader thread.
+
+        Parameters
+        ----------
+        timeout : float or None
+            how long to wait for a frame (in seconds); None waits forever
+
+        Returns
+        -------
+        frame : Frame or None
+            next frame, or None once the stream has stopped
+        """
+        frame = self.queue.get(timeout)
+        if frame is None and self.error is not None:
+            raise self.error
+        return frame
+
+    def get_ndropped(self):
+        """Return the number of frames dropped by queue overflows
+        """
+        return self.queue.ndropped
+
+    def get_counters(self):
+        """Return the live frame counters of the stream
+
+        Returns
+        -------
+        counters : dict
+            counters of the camera live mode (see LiveCounters), with
+            'ndropped' including the frames dropped by queue overflows,
+            which are also reported separately as 'noverflow'
+        """
+        counters = self.counters.get_counters()
+        counters['noverflow'] = self.queue.ndropped
+        counters['ndropped'] += counters['noverflow']
+        return counters
+
+    def __iter__(self):
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
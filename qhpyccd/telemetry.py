@@ -0,0 +1,429 @@
+"""
+Background telemetry sampling for the QHYCCD Python wrapper.
+(c) 2021 E.Bertin IAP/CNRS/SorbonneU
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sampled quantities: column name and control parameter
+TELEMETRY_CONTROLS = (
+('temperature', 'CONTROL_CURTEMP'),
+('target', 'CONTROL_COOLER'),
+('pwm', 'CONTROL_CURPWM')
+)
+
+class TelemetrySampler(object):
+    """Sample the camera temperature and cooling from a background thread
+
+    The sensor temperature, cooler target temperature and cooling power are
+    recorded at a fixed rate into a preallocated ring of samples. SDK calls
+    are serialized with the other SDK calls through the camera lock, which
+    acquisitions do not hold while waiting for exposures, and which the
+    sampler never waits for long: a sample is skipped if the camera is busy,
+    e.g. during frame readouts, so that frames are never delayed.
+    Reads do not take any lock; the sampler thread is the only writer.
+    Quantities not supported by the camera are recorded as NaN.
+
+    Parameters
+    ----------
+    cam : qhyccd
+        camera object
+    rate : float
+        sampling rate (in Hz)
+    nsamples : int
+        number of samples kept in the ring
+
+    Attributes
+    ----------
+    nskipped : int
+        number of samples skipped because the camera was busy
+    error : Exception or None
+        error that stopped the sampler thread, if any
+    stopped : boolean
+        True unless the sampler thread is running
+    """
+
+    def __init__(self, cam, rate=1.0, nsamples=3600):
+        if rate <= 0.0:
+            raise ValueError('sampling rate must be positive')
+        if nsamples < 2:
+            raise ValueError('at least two samples are required')
+        # A weak reference lets the camera object be deleted while sampling
+        self._cam = weakref.ref(cam)
+        self.period = 1.0 / rate
+        self.nsamples = int(nsamples)
+        self.names = ('time',) + tuple(name for name, control \
+                                       in TELEMETRY_CONTROLS)
+        self._samples = np.full((self.nsamples, len(self.names)), np.nan)
+        self._count = 0
+        self.nskipped = 0
+        self.error = None
+        self.stopped = True
+        self._controls = [control if cam.has_control(control) else None \
+                          for name, control in TELEMETRY_CONTROLS]
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the sampler thread
+        """
+        self._stop.clear()
+        self.stopped = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='qhpyccd-telemetry', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        """Sampler thread loop
+        """
+        stop = self._stop
+        sample = np.empty(len(self.names))
+        t_next = time.monotonic()
+        try:
+            while not stop.is_set():
+                cam = self._cam()
+                if cam is None:
+                    break
+                if cam._lock.acquire(timeout=min(0.1, self.period / 2.0)):
+                    try:
+                        sample[0] = time.time()
+                        for i, control in enumerate(self._controls):
+                            sample[i + 1] = np.nan if control is None \
+                                            else cam.query_control(control)
+                    finally:
+                        cam._lock.release()
+                    # Fill the row before publishing it through the count
+                    self._samples[self._count % self.nsamples] = sample
+                    self._count += 1
+                else:
+                    self.nskipped += 1
+                del cam
+                self._notify()
+                t_next += self.period
+                delay = t_next - time.monotonic()
+                if delay < 0.0:
+                    # Late: resynchronize instead of catching up
+                    t_next = time.monotonic()
+                    delay = 0.0
+                stop.wait(delay)
+        except Exception as e:
+            self.error = e
+        finally:
+            # Listeners waiting for samples must learn that none will come
+            self.stopped = True
+            self._notify()
+
+    def _notify(self):
+        """Call the listeners
+        """
+        for listener in list(self._listeners):
+            try:
+                listener(self)
+            except Exception:
+                logger.exception('telemetry listener failed')
+
+    def stop(self):
+        """Stop the sampler thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+        return self
+
+    def add_listener(self, listener):
+        """Register a function called by the sampler thread after each sample
+
+        Parameters
+        ----------
+        listener : callable
+            function called with the sampler as argument, also when a
+            sample was skipped, and once more when the sampler thread stops
+            (with stopped set); it must return quickly
+        """
+        self._listeners.append(listener)
+        return self
+
+    def remove_listener(self, listener):
+        """Unregister a listener function
+
+        Parameters
+        ----------
+        listener : callable
+            function registered with add_listener()
+        """
+        try:
+            self._listeners.remove(listener)
+        except ValueError:
+            pass
+        return self
+
+    def is_running(self):
+        """Tell whether the sampler thread is running
+
+        Returns
+        -------
+        flag : boolean
+            True if the sampler thread is alive
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_count(self):
+        """Return the number of samples recorded so far
+
+        Returns
+        -------
+        count : int
+            number of samples, including those overwritten in the ring
+        """
+        return self._count
+
+    def get_latest(self):
+        """Return the latest sample
+
+        Returns
+        -------
+        sample : dict or None
+            time (in seconds since the epoch), temperature and target
+            temperature (in °C) and cooling power (0-255), or None if no
+            sample was recorded yet
+        """
+        count = self._count
+        if count == 0:
+            return None
+        sample = self._samples[(count - 1) % self.nsamples].copy()
+        return dict(zip(self.names, sample.tolist()))
+
+    def get_samples(self, duration=None):
+        """Return the most recent samples
+
+        Parameters
+        ----------
+        duration : float or None
+            time window ending with the latest sample (in seconds);
+            None returns all the samples in the ring
+
+        Returns
+        -------
+        samples : numpy.ndarray
+            [nsamples, 4] array of time, temperature, target temperature
+            and cooling power, in chronological order
+        """
+        count = self._count
+        n = min(count, self.nsamples)
+        index = np.arange(count - n, count) % self.nsamples
+        samples = self._samples[index]
+        # Drop the rows overwritten by the sampler thread while copying
+        noverwritten = self._count - self.nsamples - (count - n)
+        if noverwritten > 0:
+            samples = samples[min(noverwritten, n):]
+        if duration is not None and len(samples):
+            samples = samples[samples[:, 0] >= samples[-1, 0] - duration]
+        return samples
+
+    def get_stats(self, duration=None):
+        """Return statistics of the most recent samples
+
+        Parameters
+        ----------
+        duration : float or None
+            time window ending with the latest sample (in seconds);
+            None uses all the samples in the ring
+
+        Returns
+        -------
+        stats : dict
+            for each of 'temperature', 'target' and 'pwm', a dictionary
+            with the mean, std, min and max values, and the slope of a
+            linear fit with time (per second); NaN if undefined. 'nsamples'
+            and 'duration' give the number of samples and time span used.
+        """
+        samples = self.get_samples(duration)
+        n = len(samples)
+        stats = {'nsamples': n,
+                 'duration': float(samples[-1, 0] - samples[0, 0]) \
+                             if n else 0.0}
+        t = samples[:, 0] - samples[-1, 0] if n else samples[:, 0]
+        for i, name in enumerate(self.names[1:], 1):
+            values = samples[:, i]
+            if n == 0 or np.isnan(values).any():
+                stats[name] = dict.fromkeys(
+                    ('mean', 'std', 'min', 'max', 'slope'), np.nan)
+                continue
+            dt = t - t.mean()
+            var = float((dt * dt).sum())
+            stats[name] = {
+                'mean': float(values.mean()),
+                'std': float(values.std()),
+                'min': float(values.min()),
+                'max': float(values.max()),
+                'slope': float((dt * (values - values.mean())).sum() / var) \
+                         if var > 0.0 else np.nan
+            }
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class CoolerSettle(object):
+    """Detect when the sensor temperature has settled at the cooler target
+
+    The samples of a telemetry sampler are checked as they arrive. The
+    temperature is considered settled when, over the last window seconds,
+    it stayed within tolerance of the target temperature, its slope is
+    below max_slope and the cooling power is stable and not saturated.
+    Once settled (or timed out, or if the sampler stops), the callback is
+    called from the sampler thread, the event is set and the awaitables
+    complete, e.g.:
+
+        settle = cam.wait_for_cooler(callback=start_sequence)
+        settle.wait(600.0)      # or: await settle
+
+    Raises ValueError if the sampler does not keep window seconds of
+    samples, and RuntimeError if the camera does not report its temperature
+    or cooler target, as the temperature could then never settle.
+
+    Parameters
+    ----------
+    sampler : TelemetrySampler
+        running telemetry sampler; it must keep at least window seconds of
+        samples
+    tolerance : float
+        maximum deviation of the temperature from the target (in °C)
+    max_slope : float
+        maximum absolute temperature slope (in °C/s)
+    pwm_tolerance : float
+        maximum standard deviation of the cooling power (0-255 scale)
+    window : float
+        time span over which the criteria must be met (in seconds)
+    timeout : float or None
+        give up after this time (in seconds); None waits forever
+    callback : callable or None
+        function called with the settled flag once done
+
+    Attributes
+    ----------
+    event : threading.Event
+        set once settled, timed out or cancelled
+    settled : boolean or None
+        True if settled, False if timed out, cancelled or if the sampler
+        stopped, None while waiting
+    """
+
+    def __init__(self, sampler, tolerance=0.5, max_slope=0.002,
+                 pwm_tolerance=5.0, window=30.0, timeout=None, callback=None):
+        if window > (sampler.nsamples - 1) * sampler.period:
+            raise ValueError(f'window of {window} s longer than the ' \
+                             f'{(sampler.nsamples - 1) * sampler.period} s ' \
+                             'kept by the sampler')
+        controls = dict(zip(sampler.names[1:], sampler._controls))
+        for name in ('temperature', 'target'):
+            if controls[name] is None:
+                raise RuntimeError(f'cooler {name} not available')
+        self.sampler = sampler
+        self.tolerance = tolerance
+        self.max_slope = max_slope
+        self.pwm_tolerance = pwm_tolerance
+        self.window = window
+        self.timeout = timeout
+        self.callback = callback
+        self.event = threading.Event()
+        self.settled = None
+        self._t_start = time.monotonic()
+        self._futures = []
+        self._lock = threading.Lock()
+        sampler.add_listener(self._check)
+        if sampler.stopped:
+            self._finish(False)
+
+    def _check(self, sampler):
+        """Sampler listener: test the settling criteria
+        """
+        if self.settled is not None:
+            return
+        if sampler.stopped:
+            self._finish(False)
+            return
+        samples = sampler.get_samples(self.window)
+        if len(samples) >= 3 \
+                and samples[-1, 0] - samples[0, 0] >= 0.9 * self.window:
+            time_, temp, target, pwm = samples.T
+            stats = sampler.get_stats(self.window)
+            if np.abs(temp - target).max() <= self.tolerance \
+                    and abs(stats['temperature']['slope']) <= self.max_slope \
+                    and (np.isnan(pwm).all() \
+                         or (pwm.std() <= self.pwm_tolerance \
+                             and pwm.max() < 255.0)):
+                self._finish(True)
+                return
+        if self.timeout is not None \
+                and time.monotonic() - self._t_start > self.timeout:
+            self._finish(False)
+
+    def _finish(self, settled):
+        """Record the outcome and notify the waiters
+        """
+        with self._lock:
+            if self.settled is not None:
+                return
+            self.settled = settled
+            futures, self._futures = self._futures, []
+        self.sampler.remove_listener(self._check)
+        self.event.set()
+        for loop, future in futures:
+            loop.call_soon_threadsafe(self._set_future, future, settled)
+        if self.callback is not None:
+            self.callback(settled)
+
+    @staticmethod
+    def _set_future(future, settled):
+        if not future.done():
+            future.set_result(settled)
+
+    def cancel(self):
+        """Stop monitoring; waiters are released with settled set to False
+        """
+        self._finish(False)
+        return self
+
+    def wait(self, timeout=None):
+        """Block until the temperature settles
+
+        Parameters
+        ----------
+        timeout : float or None
+            how long to wait (in seconds); None waits until settled or
+            until the monitor timeout
+
+        Returns
+        -------
+        settled : boolean
+            True if the temperature has settled
+        """
+        self.event.wait(timeout)
+        return self.settled is True
+
+    async def _wait_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.settled is not None:
+                return self.settled
+            future = loop.create_future()
+            self._futures.append((loop, future))
+        return await future
+
+    def __await__(self):
+        return self._wait_async().__await__()
@@ -11,5 +11,6 @@ setup(name='qhpyccd',
       install_requires=["cffi>=1.0.0"],
       cffi_modules=["qhpyccd/qhpyccd.py:ffibuilder"],
       packages=['qhpyccd'],
+      package_data={'qhpyccd': ['qhpyccd.h']},
       )
 
@@ -0,0 +1,26 @@
+"""
+Test configuration: all tests run on the simulated QHYCCD SDK.
+"""
+import gc
+import os
+
+os.environ['QHPYCCD_BACKEND'] = 'sim'
+
+import pytest
+import qhpyccd
+
+@pytest.fixture
+def sdk():
+    """Fresh simulated SDK
+    """
+    # Delete the cameras of previous tests while their SDK is still active
+    gc.collect()
+    return qhpyccd.use_simulator(size=[256, 192])
+
+@pytest.fixture
+def cam(sdk):
+    """Camera on a fresh simulated SDK, with short exposures
+    """
+    camera = qhpyccd.qhyccd(exptime=0.01, cache_dir=None)
+    yield camera
+    camera.stop_telemetry()
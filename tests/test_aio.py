@@ -0,0 +1,66 @@
+"""
+Tests of the asyncio interface.
+"""
+import asyncio
+import threading
+import time
+import pytest
+from qhpyccd import AsyncQhyccd
+
+def test_cancel_get_image(cam):
+    """Cancelling get_image() aborts the exposure without waiting for it
+    """
+    cam.set_exptime(5.0)
+    acam = AsyncQhyccd(cam)
+
+    async def cancel():
+        task = asyncio.ensure_future(acam.get_image())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    t = time.monotonic()
+    asyncio.run(cancel())
+    assert time.monotonic() - t < 2.0
+    # The camera remains usable
+    cam.set_exptime(0.01)
+    cam.get_image()
+
+
+def test_cancel_queued_get_image(cam):
+    """Cancelling a queued get_image() neither exposes nor aborts others
+    """
+    cam.set_exptime(0.5)
+    acam = AsyncQhyccd(cam)
+
+    async def cancel():
+        first = asyncio.ensure_future(acam.get_image())
+        await asyncio.sleep(0.1)
+        second = asyncio.ensure_future(acam.get_image())
+        await asyncio.sleep(0.1)
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        await first
+
+    seqno = cam._seqno
+    t = time.monotonic()
+    asyncio.run(cancel())
+    assert time.monotonic() - t < 0.9
+    # Only the first image was acquired
+    assert cam._seqno == seqno + 1
+    acam.close()
+    cam.set_exptime(0.01)
+
+
+def test_cancel_before_exposure(cam):
+    """A cancellation noticed before the exposure prevents it
+    """
+    acam = AsyncQhyccd(cam)
+    cancelled = threading.Event()
+    cancelled.set()
+    seqno = cam._seqno
+    acam._get_image(cancelled)
+    assert cam._seqno == seqno
+    acam.close()
@@ -0,0 +1,25 @@
+"""
+Tests of the compressed frame archives.
+"""
+import numpy as np
+from qhpyccd import ArchiveWriter, ArchiveReader
+
+def test_sequence_round_trip(cam, tmp_path):
+    """Frames autoreleased by sequence() are archived intact
+    """
+    filename = str(tmp_path / 'frames.qha')
+    expected = []
+    # Slow compression, so that ring slots are reused before it ends
+    with ArchiveWriter(filename, codec='lzma', level=6, tile_rows=16,
+                       nthreads=1) as writer:
+        for frame in cam.sequence(12, nbuffers=2):
+            expected.append(frame.data.copy())
+            writer.write(frame)
+    assert writer.nwritten == 12
+    with ArchiveReader(filename) as reader:
+        assert len(reader) == 12
+        # Random access, in any order
+        for index in (7, 0, 11, 3):
+            np.testing.assert_array_equal(reader[index], expected[index])
+        np.testing.assert_array_equal(reader.read_tile(5, 2),
+                                      expected[5][32:48])
@@ -0,0 +1,104 @@
+"""
+Tests of software binning.
+"""
+import numpy as np
+import pytest
+from qhpyccd import Frame, FrameRing, SoftwareBinning, bin_frame
+
+
+def reference(data, binsize, mode='sum', dtype=None):
+    """Bin a frame with numpy reshapes
+    """
+    fx, fy = binsize
+    h, w = data.shape[0] // fy, data.shape[1] // fx
+    dtype = data.dtype if dtype is None else np.dtype(dtype)
+    blocks = data[:h * fy, :w * fx].reshape((h, fy, w, fx) + data.shape[2:])
+    if mode == 'decimate':
+        return blocks[:, 0, :, 0].astype(dtype)
+    if dtype.kind == 'f' or data.dtype.kind == 'f':
+        sums = blocks.astype(np.float64).sum(axis=(1, 3))
+        return (sums / (fx * fy) if mode == 'mean' else sums).astype(dtype)
+    sums = blocks.astype(np.int64).sum(axis=(1, 3))
+    if mode == 'mean':
+        return (sums // (fx * fy)).astype(dtype)
+    return np.minimum(sums, np.iinfo(dtype).max).astype(dtype)
+
+
+@pytest.mark.parametrize('mode', ['sum', 'mean', 'decimate'])
+def test_numpy_reference(mode):
+    """Binned frames match a numpy reference, edges being cropped
+    """
+    rng = np.random.default_rng(7)
+    for shape in ((61, 83), (61, 83, 3)):
+        for dtype in (np.uint8, np.uint16):
+            data = rng.integers(0, np.iinfo(dtype).max, shape, dtype=dtype)
+            for binsize in ([1, 1], [2, 2], [3, 2], [1, 4], [5, 7]):
+                binning = SoftwareBinning(binsize, mode)
+                binned = binning.bin(data)
+                expected = reference(data, binsize, mode)
+                assert binned.shape == expected.shape
+                assert binned.dtype == data.dtype
+                assert (binned == expected).all()
+                # Work buffers are reused
+                out = np.empty_like(binned)
+                assert binning.bin(data, out) is out
+                assert (out == expected).all()
+
+
+def test_output_types():
+    """Sums are clipped to integer types, not to wider ones
+    """
+    data = np.full((8, 8), 60000, np.uint16)
+    assert (bin_frame(data, [2, 2]) == 65535).all()
+    assert (bin_frame(data, [2, 2], dtype=np.uint32) == 240000).all()
+    assert (bin_frame(data, [2, 2], dtype=np.float32) == 240000.0).all()
+    assert (bin_frame(data, [2, 2], 'mean', np.float32) == 60000.0).all()
+    rng = np.random.default_rng(8)
+    data = rng.random((20, 30), dtype=np.float32)
+    np.testing.assert_allclose(bin_frame(data, [3, 2], 'mean'),
+                               reference(data, [3, 2], 'mean'), rtol=1e-6)
+    with pytest.raises(ValueError):
+        SoftwareBinning([0, 2])
+    with pytest.raises(ValueError):
+        SoftwareBinning([2, 2], mode='median')
+
+
+def test_stream_stage():
+    """The stage releases input frames and recycles its output buffers
+    """
+    ring = FrameRing(1, (16, 12), np.uint16)
+    binning = SoftwareBinning([2, 2], nbuffers=2)
+    binned = []
+    for i in range(3):
+        slot = ring.acquire()
+        ring.view(slot)[...] = i
+        frame = Frame(ring, slot, ring.view(slot), seqno=i)
+        binned.append(binning(frame))
+        assert frame.is_released()
+        assert binned[-1].seqno == i
+        assert (binned[-1].data == 4 * i).all()
+    # The third frame did not fit in the ring
+    assert binned[2]._ring is None
+    binned[0].release()
+    frame = Frame(None, 0, np.ones((16, 12), np.uint16))
+    assert binning(frame).slot == binned[0].slot
+
+
+def test_camera_software_binning(cam):
+    """Binning factors the camera lacks are applied in software
+    """
+    cam.set_binsize([3, 3])
+    shape, dtype = cam.get_frame_layout()
+    assert shape == (64, 85)
+    cam.get_image()
+    assert cam.image.shape == shape and cam.image.dtype == dtype
+    # The full resolution frame is read into the image buffer
+    raw = cam._image_buffer[:256 * 192 * 2].view(np.uint16).reshape(192, 256)
+    assert (cam.image == reference(raw, [3, 3])).all()
+    assert cam.frame.sdk_layout == (256, 192, 16, 1)
+    for frame in cam.sequence(2):
+        assert frame.data.shape == shape
+        assert frame.sdk_layout == (256, 192, 16, 1)
+    cam.set_binsize([2, 2])
+    cam.get_image()
+    assert cam.image.shape == (96, 128)
@@ -0,0 +1,23 @@
+"""
+Tests of acquisitions into caller-supplied buffers.
+"""
+import numpy as np
+import pytest
+
+def test_bad_out_buffer_starts_no_exposure(cam, capsys):
+    """An unsuitable buffer is rejected before the exposure is started
+    """
+    shape, dtype = cam.get_frame_layout()
+    cube = np.zeros((2,) + tuple(shape), dtype)
+    big = np.zeros(2 * cube[0].size, dtype)
+    with pytest.raises(TypeError):
+        cam.get_image(out=big[::2])
+    with pytest.raises(ValueError):
+        cam.get_image(out=cube[0].reshape(-1)[:-1])
+    with pytest.raises(TypeError):
+        cam.get_image(out=bytes(cube[0].nbytes))
+    assert capsys.readouterr().out == ''
+    # No exposure was left running
+    cam.get_image(out=cube[1])
+    assert np.shares_memory(cam.image, cube[1])
+    assert cam.frame.data is cam.image
@@ -0,0 +1,29 @@
+"""
+Tests of frame calibration.
+"""
+import numpy as np
+from qhpyccd import CalibrationLibrary
+
+def test_library_uses_frame_configuration(cam):
+    """Frames are calibrated with the masters of their acquisition settings
+    """
+    library = CalibrationLibrary(cam=cam)
+    cam.get_image()
+    shape = cam.image.shape
+    library.add(cam.get_configuration(), bias=np.full(shape, 100.0))
+    library.add(dict(cam.get_configuration(), exptime=0.02),
+                bias=np.full(shape, 1000.0))
+    frame = cam.get_image().frame
+    raw = np.array(frame.data, dtype=np.float32)
+    # The configuration changes before the frame is processed
+    cam.configure(exptime=0.02)
+    calibrated = library(frame)
+    np.testing.assert_array_equal(calibrated.data, raw - 100.0)
+    calibrated.release()
+    # Frames without metadata fall back to the current camera settings
+    frame = cam.get_image().frame
+    raw = np.array(frame.data, dtype=np.float32)
+    frame.metadata = None
+    calibrated = library(frame)
+    np.testing.assert_array_equal(calibrated.data, raw - 1000.0)
+    calibrated.release()
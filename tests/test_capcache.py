@@ -0,0 +1,125 @@
+"""
+Tests of the on-disk camera capability cache.
+"""
+import gc
+import json
+import logging
+
+import qhpyccd
+from qhpyccd import CONTROL_CODES, capcache
+
+
+def new_sdk():
+    """Return a fresh simulated SDK, with the same camera
+    """
+    gc.collect()
+    return qhpyccd.use_simulator(size=[256, 192])
+
+
+def open_camera(sdk, cache_dir):
+    """Open a camera and return it with the number of probing calls
+    """
+    cam = qhpyccd.qhyccd(exptime=0.01, cache_dir=str(cache_dir))
+    nprobes = sdk.ncalls.get('IsQHYCCDControlAvailable', 0) \
+              + sdk.ncalls.get('GetQHYCCDChipInfo', 0)
+    return cam, nprobes
+
+
+def set_sdk_version(sdk, monkeypatch, year):
+    """Make the simulated SDK report another version
+    """
+    def get_sdk_version(y, m, d, s):
+        y[0], m[0], d[0], s[0] = year, 1, 1, 0
+        return 0
+    monkeypatch.setattr(sdk, 'GetQHYCCDSDKVersion', get_sdk_version)
+
+
+def set_firmware_version(sdk, monkeypatch, version):
+    """Make the simulated camera report another firmware version
+    """
+    def get_firmware_version(h, buf):
+        buf[0], buf[1] = version
+        return 0
+    monkeypatch.setattr(sdk, 'GetQHYCCDFWVersion', get_firmware_version)
+
+
+def test_warm_open_skips_probing(tmp_path):
+    """Capabilities are probed once and then loaded from the cache
+    """
+    sdk = new_sdk()
+    cam, nprobes = open_camera(sdk, tmp_path)
+    assert nprobes == len(CONTROL_CODES) + 1
+    chip_size, layout = cam.get_chip_size(), cam.get_frame_layout()
+    modes = cam.get_read_modes()
+    cam.close()
+    with open(capcache.cache_path(str(tmp_path), 'QHYSIM-0000')) as f:
+        entry = json.load(f)
+    assert entry['camera'] == 'QHYSIM-0000'
+    sdk = new_sdk()
+    cam, nprobes = open_camera(sdk, tmp_path)
+    assert nprobes == 0
+    assert cam.has_control('CAM_BIN2X2MODE')
+    assert not cam.has_control('CAM_BIN3X3MODE')
+    assert cam.get_chip_size() == chip_size
+    assert cam.get_frame_layout() == layout
+    assert cam.get_read_modes() == modes
+    cam.get_image()
+    cam.close()
+
+
+def test_firmware_change_invalidates(tmp_path, monkeypatch):
+    """Capabilities cached with another firmware are probed again
+    """
+    sdk = new_sdk()
+    open_camera(sdk, tmp_path)[0].close()
+    sdk = new_sdk()
+    set_firmware_version(sdk, monkeypatch, (0x44, 1))
+    cam, nprobes = open_camera(sdk, tmp_path)
+    assert nprobes == len(CONTROL_CODES) + 1
+    firmware = cam.get_firmware_version()
+    cam.close()
+    # The cache was updated for the new firmware
+    sdk = new_sdk()
+    set_firmware_version(sdk, monkeypatch, (0x44, 1))
+    cam, nprobes = open_camera(sdk, tmp_path)
+    assert nprobes == 0
+    assert cam.get_firmware_version() == firmware
+    cam.close()
+
+
+def test_sdk_change_invalidates(tmp_path, monkeypatch):
+    """Capabilities cached with another SDK version are probed again
+    """
+    sdk = new_sdk()
+    open_camera(sdk, tmp_path)[0].close()
+    sdk = new_sdk()
+    set_sdk_version(sdk, monkeypatch, 24)
+    cam, nprobes = open_camera(sdk, tmp_path)
+    assert nprobes == len(CONTROL_CODES) + 1
+    cam.close()
+    assert capcache.load_capabilities(str(tmp_path), 'QHYSIM-0000',
+                                      cam.get_firmware_version(),
+                                      '20240101_0') is not None
+
+
+def test_bad_cache(tmp_path, caplog):
+    """Unreadable or unwritable caches only cost probing
+    """
+    path = capcache.cache_path(str(tmp_path), 'QHYSIM-0000')
+    with open(path, 'w') as f:
+        f.write('{"format": ')
+    sdk = new_sdk()
+    cam, nprobes = open_camera(sdk, tmp_path)
+    assert nprobes == len(CONTROL_CODES) + 1
+    cam.close()
+    # A cache directory that cannot be created
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    sdk = new_sdk()
+    with caplog.at_level(logging.WARNING, logger='qhpyccd'):
+        cam, nprobes = open_camera(sdk, blocker / 'cache')
+    assert nprobes == len(CONTROL_CODES) + 1
+    assert any('capability cache' in record.getMessage() \
+               for record in caplog.records)
+    cam.get_image()
+    cam.close()
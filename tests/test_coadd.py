@@ -0,0 +1,125 @@
+"""
+Tests of frame co-adding.
+"""
+import time
+import numpy as np
+from qhpyccd import Frame, FrameAccumulator
+
+def test_variance_precision():
+    """Variances of bright pixels do not suffer from cancellation
+    """
+    rng = np.random.default_rng(1)
+    frames = rng.normal(30000.0, 10.0, (100, 32, 32)).astype(np.uint16)
+    acc = FrameAccumulator(nframes=100, sumsq=True)
+    for frame in frames[:-1]:
+        assert acc.add(frame) == []
+    stack, = acc.add(frames[-1])
+    expected = frames.astype(np.float64).var(axis=0)
+    np.testing.assert_allclose(stack.get_variance(), expected, rtol=1e-5)
+
+
+def test_mean_variance_precision():
+    """Variances of averaged stacks use the exact sums
+    """
+    rng = np.random.default_rng(2)
+    frames = rng.normal(30000.0, 10.0, (50, 16, 16)).astype(np.uint16)
+    acc = FrameAccumulator(nframes=50, mode='mean', sumsq=True)
+    for frame in frames:
+        stacks = acc.add(frame)
+    expected = frames.astype(np.float64).var(axis=0)
+    np.testing.assert_allclose(stacks[0].get_variance(), expected,
+                               rtol=1e-5)
+
+
+def test_shape_change_returns_all_stacks():
+    """A shape change completes the current stack without losing any
+    """
+    acc = FrameAccumulator(nframes=1)
+    stacks = acc.add(np.ones((4, 4), dtype=np.uint16))
+    stacks += acc.add(np.ones((2, 2), dtype=np.uint16))
+    assert [(s.data.shape, s.nframes) for s in stacks] \
+           == [((4, 4), 1), ((2, 2), 1)]
+    acc = FrameAccumulator(nframes=3)
+    acc.add(np.ones((4, 4), dtype=np.uint16))
+    stacks = acc.add(np.ones((2, 2), dtype=np.uint16))
+    assert [s.data.shape for s in stacks] == [(4, 4)]
+    acc2 = FrameAccumulator(nframes=2)
+    acc2.add(np.ones((4, 4), dtype=np.uint16))
+    stacks = acc2.add(np.full((2, 2), 2, dtype=np.uint16))
+    stacks += acc2.add(np.full((2, 2), 2, dtype=np.uint16))
+    assert [(s.data.shape, s.nframes) for s in stacks] \
+           == [((4, 4), 1), ((2, 2), 2)]
+
+
+def test_interval_poll():
+    """Stacks are completed once their interval has elapsed
+    """
+    acc = FrameAccumulator(interval=0.05)
+    assert acc.add(np.ones((4, 4), dtype=np.uint16)) == []
+    assert acc.poll() == []
+    time.sleep(0.06)
+    stack, = acc.poll()
+    assert stack.nframes == 1
+    assert acc.poll() == []
+
+
+def test_stream_flush_on_stop(cam):
+    """The pending stack is available once the stream stops
+    """
+    acc = FrameAccumulator(nframes=1000)
+    stream = cam.start_stream(stages=[acc])
+    deadline = time.time() + 5.0
+    while acc._count < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    stream.stop()
+    stack = stream.get(timeout=1.0)
+    assert stack.nframes >= 3
+    assert stream.get(timeout=1.0) is None
+
+
+def test_stream_interval(cam):
+    """Time-based stacks are queued even if frames stop arriving
+    """
+    acc = FrameAccumulator(interval=0.1)
+    with cam.start_stream(stages=[acc]) as stream:
+        stack = stream.get(timeout=5.0)
+        assert stack.t_end - stack.t_start < 0.2
+        stack.release()
+
+
+def test_stack_times_from_frames():
+    """Stacks span the acquisition times of their frames
+    """
+    acc = FrameAccumulator(interval=10.0)
+    stacks = []
+    for i in range(5):
+        frame = Frame(None, 0, np.full((4, 4), i, dtype=np.uint16),
+                      t_start=1000.0 + 4.0 * i, t_end=1003.0 + 4.0 * i)
+        stacks += acc.add(frame)
+    stacks.append(acc.flush())
+    # Frames starting 10 s or more after the stack start go to the next one
+    assert [(s.nframes, s.t_start, s.t_end) for s in stacks] \
+           == [(3, 1000.0, 1011.0), (2, 1012.0, 1019.0)]
+    assert stacks[0].data.max() == 3
+
+
+def test_released_stack_buffers_are_reused():
+    """Accumulators reuse the buffers of released stacks
+    """
+    acc = FrameAccumulator(nframes=2, mode='mean', sumsq=True)
+    frame = np.full((4, 4), 10, dtype=np.uint16)
+    acc.add(frame)
+    stack, = acc.add(frame + 2)
+    buffers = (stack.data, stack.sumsq, stack.total)
+    np.testing.assert_array_equal(stack.data, 11.0)
+    stack.release()
+    acc.add(frame)
+    stack, = acc.add(frame)
+    assert all(a is b for a, b in
+               zip((stack.data, stack.sumsq, stack.total), buffers))
+    np.testing.assert_array_equal(stack.data, 10.0)
+    np.testing.assert_array_equal(stack.get_variance(), 0.0)
+    # Stacks still held keep their own buffers
+    acc.add(frame)
+    other, = acc.add(frame)
+    assert other.data is not stack.data
@@ -0,0 +1,82 @@
+"""
+Tests of batched camera configuration.
+"""
+import qhpyccd
+
+
+def sdk_calls(profile):
+    """Return the number of calls of every SDK function in a profile
+    """
+    return {name: s['count'] for name, s in profile.snapshot().items()}
+
+
+def test_unchanged_configuration(cam):
+    """Applying the current configuration makes no SDK call
+    """
+    configuration = cam.get_configuration()
+    with qhpyccd.profile_sdk() as profile:
+        cam.configure(**configuration)
+        cam.configure(region=([0, 0], [0, 0]))
+    assert sdk_calls(profile) == {}
+    assert cam.get_configuration() == configuration
+
+
+def test_readmode_change(cam):
+    """Controls are sent again once after a readout mode change
+    """
+    configuration = cam.get_configuration()
+    with qhpyccd.profile_sdk() as profile:
+        cam.configure(readmode=1)
+        cam.configure(**configuration)
+    assert sdk_calls(profile) == {'SetQHYCCDReadMode': 1,
+                                  'SetQHYCCDParam': 3}
+    configuration = cam.get_configuration()
+    assert configuration['readmode'] == 1
+    with qhpyccd.profile_sdk() as profile:
+        cam.configure(**configuration)
+    assert sdk_calls(profile) == {}
+
+
+def test_exptime_only(cam):
+    """Changing controls does not touch the frame geometry
+    """
+    image = cam.image
+    with qhpyccd.profile_sdk() as profile:
+        cam.configure(exptime=0.02, region=cam.get_region())
+    assert sdk_calls(profile) == {'SetQHYCCDParam': 1}
+    assert cam.image is image
+    with qhpyccd.profile_sdk() as profile:
+        cam.configure(gain=10, offset=20, exptime=0.02)
+    assert sdk_calls(profile) == {'SetQHYCCDParam': 2}
+
+
+def test_geometry_change(cam):
+    """A geometry change cancels the exposure once and keeps the buffer
+    """
+    buffer = cam._image_buffer
+    with qhpyccd.profile_sdk() as profile:
+        cam.configure(region=([8, 8], [128, 96]), binsize=[2, 2],
+                      bitdepth=8, gain=30)
+    assert sdk_calls(profile) == {'CancelQHYCCDExposingAndReadout': 1,
+                                  'SetQHYCCDResolution': 1,
+                                  'SetQHYCCDBinMode': 1,
+                                  'SetQHYCCDBitsMode': 1,
+                                  'SetQHYCCDParam': 1}
+    assert cam._image_buffer is buffer
+    assert cam.get_frame_layout() == ((48, 64), cam.image.dtype)
+    assert cam.image.shape == (48, 64) and cam.image.itemsize == 1
+    cam.get_image()
+    assert cam.image.shape == (48, 64)
+    assert cam.get_configuration()['region'] == ([8, 8], [128, 96])
+
+
+def test_software_binning_mode(cam):
+    """Software binning leaves the hardware binning unchanged
+    """
+    with qhpyccd.profile_sdk() as profile:
+        cam.configure(binsize=[3, 3])
+    calls = sdk_calls(profile)
+    assert 'SetQHYCCDBinMode' not in calls
+    assert calls['CancelQHYCCDExposingAndReadout'] == 1
+    cam.get_image()
+    assert cam.image.shape == (64, 85)
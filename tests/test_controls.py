@@ -0,0 +1,79 @@
+"""
+Tests of the capability bitmap and control parameter cache.
+"""
+import pytest
+from qhpyccd import CONTROL_CODES, CONTROL_CODE_DICT
+
+
+def ncalls(sdk, function):
+    """Return the number of calls of an SDK function
+    """
+    return sdk.ncalls.get(function, 0)
+
+
+def test_capability_bitmap(cam, sdk):
+    """has_control() answers from the bitmap, probed once per control
+    """
+    n = ncalls(sdk, 'IsQHYCCDControlAvailable')
+    for name, code, desc in CONTROL_CODES:
+        assert cam.has_control(name) == \
+               (code in sdk.cameras[0].controls)
+    assert ncalls(sdk, 'IsQHYCCDControlAvailable') == n
+    assert cam.has_control('CAM_BIN2X2MODE')
+    assert not cam.has_control('CAM_BIN3X3MODE')
+    assert cam.has_control('CAM_BIN2X2MODE', refresh=True)
+    assert ncalls(sdk, 'IsQHYCCDControlAvailable') == n + 1
+    # Probing again checks every control once more
+    cam.probe_controls()
+    assert ncalls(sdk, 'IsQHYCCDControlAvailable') \
+           == n + 1 + len(CONTROL_CODES)
+
+
+def test_control_cache(cam, sdk):
+    """Settable controls are written through a cache
+    """
+    nset = ncalls(sdk, 'SetQHYCCDParam')
+    nget = ncalls(sdk, 'GetQHYCCDParam')
+    cam.set_control('CONTROL_GAIN', 30)
+    assert ncalls(sdk, 'SetQHYCCDParam') == nset + 1
+    cam.set_control('CONTROL_GAIN', 30)
+    assert ncalls(sdk, 'SetQHYCCDParam') == nset + 1
+    cam.set_control('CONTROL_GAIN', 30, refresh=True)
+    assert ncalls(sdk, 'SetQHYCCDParam') == nset + 2
+    assert cam.query_control('CONTROL_GAIN') == 30.0
+    assert ncalls(sdk, 'GetQHYCCDParam') == nget
+    assert cam.query_control('CONTROL_GAIN', refresh=True) == 30.0
+    assert ncalls(sdk, 'GetQHYCCDParam') == nget + 1
+
+
+def test_volatile_controls(cam, sdk):
+    """Volatile controls are always queried
+    """
+    nget = ncalls(sdk, 'GetQHYCCDParam')
+    for i in range(3):
+        cam.query_control('CONTROL_CURTEMP')
+    assert ncalls(sdk, 'GetQHYCCDParam') == nget + 3
+
+
+def test_invalidate_controls(cam, sdk):
+    """Invalidated values are read back from the camera
+    """
+    cam.set_control('CONTROL_GAIN', 30)
+    cam.set_control('CONTROL_OFFSET', 40)
+    # Changed behind the back of the cache
+    sdk.cameras[0].params[CONTROL_CODE_DICT['CONTROL_GAIN']] = 50.0
+    assert cam.query_control('CONTROL_GAIN') == 30.0
+    cam.invalidate_controls(['CONTROL_GAIN'])
+    nget = ncalls(sdk, 'GetQHYCCDParam')
+    assert cam.query_control('CONTROL_GAIN') == 50.0
+    assert cam.query_control('CONTROL_OFFSET') == 40.0
+    assert ncalls(sdk, 'GetQHYCCDParam') == nget + 1
+    cam.invalidate_controls()
+    assert cam.query_control('CONTROL_OFFSET') == 40.0
+    assert ncalls(sdk, 'GetQHYCCDParam') == nget + 2
+    # A failed write leaves no stale value behind
+    sdk.inject_error('SetQHYCCDParam')
+    with pytest.raises(RuntimeError):
+        cam.set_control('CONTROL_GAIN', 60)
+    assert cam.query_control('CONTROL_GAIN') == 50.0
+
@@ -0,0 +1,112 @@
+"""
+Tests of frame numbering, timestamps and live frame counters.
+"""
+import time
+
+from qhpyccd import LiveCounters
+
+
+def next_frame(cam, timeout=2.0):
+    """Poll the live ring until a frame is ready
+    """
+    t = time.time()
+    while time.time() - t < timeout:
+        frame = cam.poll_live_frame()
+        if frame is not None:
+            return frame
+        time.sleep(0.0005)
+    return None
+
+
+def test_live_counters():
+    """Dropped frames are inferred from gaps in the arrival times
+    """
+    counters = LiveCounters()
+    assert counters.get_counters() == {'ndelivered': 0, 'ndropped': 0,
+                                       'fps': 0.0, 'period': None}
+    # An early gap is not trusted
+    for t in (0.0, 0.1, 0.5, 0.6, 0.7, 0.8, 0.9):
+        counters.update(t)
+    assert counters.ndropped == 0
+    assert abs(counters.period - 0.1) < 1e-9
+    # A gap of 5 periods, and a burst of frames buffered by the SDK
+    for t in (1.4, 1.5, 1.5, 1.5, 1.6):
+        counters.update(t)
+    result = counters.get_counters()
+    assert result['ndelivered'] == 12
+    assert result['ndropped'] == 4
+    assert abs(result['period'] - 0.1) < 1e-9
+    assert abs(result['fps'] - 11 / 1.6) < 1e-9
+
+
+def test_single_frames(cam):
+    """Single and sequence frames are numbered and timestamped
+    """
+    seqno = cam._seqno
+    cam.get_image()
+    frame = cam.frame
+    assert frame.seqno == seqno
+    assert frame.t_end - frame.t_start >= cam.get_exptime()
+    assert frame.sdk_layout == (256, 192, 16, 1)
+    for frame in cam.sequence(2):
+        seqno += 1
+        assert frame.seqno == seqno
+    cam.get_image()
+    assert cam.frame.seqno == seqno + 1
+    assert cam.frame.t_start >= frame.t_end
+
+
+def test_live_frames(cam):
+    """Live frames are numbered, timestamped and counted
+    """
+    cam.set_stream_mode('live')
+    cam.begin_live()
+    try:
+        seqno = cam._seqno
+        t_end = 0.0
+        for i in range(5):
+            # Without a ring, the frame is read into the image array
+            while True:
+                try:
+                    assert cam.get_live_frame() is cam
+                    break
+                except RuntimeError:
+                    time.sleep(0.0005)
+            frame = cam.frame
+            assert frame.seqno == seqno + i
+            assert t_end <= frame.t_start <= frame.t_end
+            assert frame.sdk_layout == (256, 192, 16, 1)
+            assert frame.data is cam.image
+            t_end = frame.t_end
+        assert cam.live_counters.get_counters()['ndelivered'] == 5
+    finally:
+        cam.stop_live()
+        cam.set_stream_mode('single')
+
+
+def test_dropped_live_frames(cam):
+    """Frames missed by a late consumer are counted as dropped
+    """
+    cam.set_stream_mode('live')
+    cam.begin_live(nbuffers=2)
+    try:
+        for i in range(10):
+            next_frame(cam).release()
+        ndropped = cam.live_counters.get_counters()['ndropped']
+        # About 10 frame periods of 10 ms
+        time.sleep(0.1)
+        for i in range(3):
+            next_frame(cam).release()
+        counters = cam.live_counters.get_counters()
+        assert counters['ndelivered'] == 13
+        assert 5 <= counters['ndropped'] - ndropped <= 12
+        assert abs(counters['period'] - 0.01) < 0.005
+    finally:
+        cam.stop_live()
+        cam.set_stream_mode('single')
+    # A new live session starts new counters
+    cam.set_stream_mode('live')
+    cam.begin_live(nbuffers=2)
+    assert cam.live_counters.get_counters()['ndelivered'] == 0
+    cam.stop_live()
+    cam.set_stream_mode('single')
@@ -0,0 +1,56 @@
+"""
+Tests of the streaming FITS data cube writer.
+"""
+import numpy as np
+import pytest
+from qhpyccd import FitsCubeWriter
+
+def test_sequence_to_cube(cam, tmp_path):
+    """Frames autoreleased by sequence() are written intact
+    """
+    fits = pytest.importorskip('astropy.io.fits')
+    filename = str(tmp_path / 'cube.fits')
+    expected = []
+    with FitsCubeWriter(filename) as writer:
+        for frame in cam.sequence(6, nbuffers=2):
+            expected.append(frame.data.copy())
+            writer.write(frame)
+    assert writer.nwritten == 6
+    np.testing.assert_array_equal(fits.getdata(filename), np.array(expected))
+
+
+def test_arrays_to_cube(tmp_path):
+    """Arrays modified after write() are written as they were
+    """
+    fits = pytest.importorskip('astropy.io.fits')
+    filename = str(tmp_path / 'cube.fits')
+    data = np.arange(12, dtype=np.uint16).reshape(3, 4) * 5000
+    with FitsCubeWriter(filename) as writer:
+        writer.write(data)
+        data[:] = 0
+        writer.write(data)
+    cube = fits.getdata(filename)
+    assert cube[0].max() == 55000
+    assert cube[1].max() == 0
+
+
+def test_rolling_cubes_recycle_batches(tmp_path):
+    """Batches split at file boundaries and their buffers are reused
+    """
+    fits = pytest.importorskip('astropy.io.fits')
+    filename = str(tmp_path / 'cube_{index:02d}.fits')
+    frames = np.arange(12 * 6, dtype=np.uint16).reshape(12, 2, 3) * 900
+    with FitsCubeWriter(filename, frames_per_file=5, queue_size=4,
+                        batch_bytes=3 * frames[0].nbytes) as writer:
+        batches = set()
+        for frame in frames:
+            writer.write(frame)
+            batches.add(id(writer._batch))
+    assert writer.nwritten == 12
+    # Two batch buffers of three frames, allocated once
+    batches.discard(id(None))
+    assert len(batches) == 2 and writer._free.qsize() == 2
+    assert len(writer.files) == 3
+    cubes = [fits.getdata(name) for name in writer.files]
+    assert [len(cube) for cube in cubes] == [5, 5, 2]
+    np.testing.assert_array_equal(np.concatenate(cubes), frames)
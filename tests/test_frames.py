@@ -0,0 +1,92 @@
+"""
+Tests of frame buffer rings and zero-copy live frames.
+"""
+import time
+
+import numpy as np
+import pytest
+from qhpyccd import Frame, FrameRing
+
+
+def poll_frame(cam, timeout=2.0):
+    """Poll the live ring until a frame is ready
+    """
+    t = time.time()
+    while time.time() - t < timeout:
+        frame = cam.poll_live_frame(0.01)
+        if frame is not None:
+            return frame
+    return None
+
+
+def test_ring_exhaustion_and_release():
+    """Slots are handed out until the ring is exhausted, then recycled
+    """
+    ring = FrameRing(2, (4, 3), np.uint16)
+    assert ring.nbytes == 4 * 3 * 2
+    slots = [ring.acquire(), ring.acquire()]
+    assert sorted(slots) == [0, 1]
+    assert ring.get_nfree() == 0
+    assert ring.acquire() is None
+    t = time.time()
+    assert ring.acquire(timeout=0.05) is None
+    assert time.time() - t >= 0.04
+    ring.release(slots[0])
+    assert ring.get_nfree() == 1
+    assert ring.acquire() == slots[0]
+    with pytest.raises(ValueError):
+        FrameRing(0, (4, 3), np.uint16)
+
+
+def test_ring_views_are_zero_copy():
+    """Slot views share the ring memory and do not overlap
+    """
+    ring = FrameRing(2, (4, 3), np.uint16)
+    a, b = ring.view(0), ring.view(1)
+    assert a.shape == (4, 3) and a.dtype == np.uint16
+    assert np.shares_memory(a, ring.buffers)
+    assert not np.shares_memory(a, b)
+    a[...] = 7
+    assert not b.any()
+    assert ring.view(0, (2, 3), np.uint8).shape == (2, 3)
+
+
+def test_frame_release_is_idempotent():
+    """Releasing a frame twice returns its slot only once
+    """
+    ring = FrameRing(2, (4, 3), np.uint16)
+    slot = ring.acquire()
+    with Frame(ring, slot, ring.view(slot)) as frame:
+        assert frame.data is not None
+    assert frame.is_released() and frame.data is None
+    assert ring.get_nfree() == 2
+    frame.release()
+    assert ring.get_nfree() == 2
+
+
+def test_live_ring_frames(cam):
+    """Live frames are ring views held until released
+    """
+    cam.set_stream_mode('live')
+    cam.begin_live(nbuffers=2)
+    try:
+        ring = cam._ring
+        frames = [poll_frame(cam), poll_frame(cam)]
+        assert None not in frames
+        assert frames[0].slot != frames[1].slot
+        for frame in frames:
+            assert np.shares_memory(frame.data, ring.buffers)
+            assert frame.data.shape == cam.image.shape
+        # The ring is exhausted: nothing can be read until a release
+        assert cam.poll_live_frame() is None
+        with pytest.raises(RuntimeError):
+            cam.get_live_frame()
+        frames[0].release()
+        frame = poll_frame(cam)
+        assert frame is not None and frame.slot == frames[0].slot
+        frame.release()
+        frames[1].release()
+        assert ring.get_nfree() == 2
+    finally:
+        cam.stop_live()
+        cam.set_stream_mode('single')
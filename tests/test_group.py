@@ -0,0 +1,70 @@
+"""
+Tests of multi-camera groups.
+"""
+import gc
+
+import pytest
+import qhpyccd
+from qhpyccd import CameraGroup
+
+def test_close_closes_cameras():
+    """close() closes every camera, even while references to them remain
+    """
+    sdk = qhpyccd.use_simulator(ncam=3, size=[64, 48])
+    group = CameraGroup(exptime=0.01, cache_dir=None)
+    cameras = list(group)
+    assert all(cam.is_open for cam in sdk.cameras)
+    group.close()
+    assert not any(cam.is_open for cam in sdk.cameras)
+    assert all(not hasattr(cam, '_cam_handle') for cam in cameras)
+    group.close()
+
+
+def test_failed_construction_closes_cameras():
+    """Cameras opened before a failure are closed
+    """
+    sdk = qhpyccd.use_simulator(ncam=3, size=[64, 48])
+    sdk.inject_error('InitQHYCCD')
+    with pytest.raises(RuntimeError):
+        CameraGroup(exptime=0.01, cache_dir=None)
+    # Only the camera that failed to initialize may still be open
+    assert sum(cam.is_open and cam.initialized for cam in sdk.cameras) == 0
+    assert sum(cam.is_open for cam in sdk.cameras) <= 1
+    # and it is closed when deleted
+    gc.collect()
+    assert not any(cam.is_open for cam in sdk.cameras)
+
+
+def test_synchronized_images():
+    """All the cameras expose at nearly the same time
+    """
+    sdk = qhpyccd.use_simulator(ncam=3, size=[64, 48])
+    with CameraGroup(exptime=0.05, cache_dir=None) as group:
+        assert len(group) == 3
+        assert group.call('set_gain', 20) == list(group)
+        assert [cam.get_gain() for cam in group] == [20] * 3
+        for i in range(3):
+            frames = group.get_images()
+            assert [frame.slot for frame in frames] == [0, 1, 2]
+            for cam, frame in zip(group, frames):
+                assert frame.data is cam.image
+                assert frame.t_start <= cam.frame.t_start < frame.t_end
+            # Exposures overlap for most of their duration
+            skew = group.get_skew(frames)
+            assert skew == max(frame.t_start for frame in frames) \
+                           - min(frame.t_start for frame in frames)
+            assert skew < 0.025
+            assert min(frame.t_end for frame in frames) \
+                   > max(frame.t_start for frame in frames) + 0.05
+        assert sdk.ncalls['ExpQHYCCDSingleFrame'] == 9
+
+
+def test_failed_acquisition():
+    """A failed exposure on any camera is reported
+    """
+    sdk = qhpyccd.use_simulator(ncam=2, size=[64, 48])
+    with CameraGroup(exptime=0.01, cache_dir=None) as group:
+        sdk.inject_error('ExpQHYCCDSingleFrame')
+        with pytest.raises(RuntimeError):
+            group.get_images()
+        assert len(group.get_images()) == 2
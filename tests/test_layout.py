@@ -0,0 +1,89 @@
+"""
+Tests of frame array layouts.
+"""
+import gc
+import time
+
+import numpy as np
+import pytest
+import qhpyccd
+
+
+def check_layout(cam):
+    """Check single, caller buffer, sequence and live frames layouts
+    """
+    shape, dtype = cam.get_frame_layout()
+    assert cam.image.shape == shape and cam.image.dtype == dtype
+    cam.get_image()
+    assert cam.image.shape == shape and cam.image.dtype == dtype
+    assert cam.image.any()
+    out = np.zeros(shape, dtype)
+    cam.get_image(out=out)
+    assert out.any()
+    for frame in cam.sequence(1):
+        assert frame.data.shape == shape and frame.data.dtype == dtype
+    cam.set_stream_mode('live')
+    cam.begin_live(nbuffers=2)
+    try:
+        frame = None
+        t = time.time()
+        while frame is None and time.time() - t < 2.0:
+            frame = cam.poll_live_frame(0.01)
+        assert frame.data.shape == shape and frame.data.dtype == dtype
+        frame.release()
+    finally:
+        cam.stop_live()
+        cam.set_stream_mode('single')
+
+
+def test_16bit_layout(cam):
+    """Default frames are 16-bit (h, w) arrays
+    """
+    assert cam.get_frame_layout() == ((192, 256), np.dtype(np.uint16))
+    check_layout(cam)
+
+
+def test_8bit_layout(cam):
+    """8-bit frames have one byte per pixel
+    """
+    cam.set_bitdepth(8)
+    assert cam.get_frame_layout() == ((192, 256), np.dtype(np.uint8))
+    check_layout(cam)
+    # Buffers sized for 8-bit frames are too small for 16-bit ones
+    out = np.zeros((192, 256), np.uint8)
+    cam.set_bitdepth(16)
+    with pytest.raises(ValueError):
+        cam.get_image(out=out)
+
+
+def test_binned_layout(cam):
+    """Binned frames are smaller by the binning factors
+    """
+    cam.set_binsize([2, 2])
+    assert cam.get_frame_layout() == ((96, 128), np.dtype(np.uint16))
+    check_layout(cam)
+
+
+def test_region_layout(cam):
+    """Frames match the acquisition region
+    """
+    cam.set_region([10, 20], [100, 60])
+    assert cam.get_frame_layout()[0] == (60, 100)
+    check_layout(cam)
+
+
+def test_multichannel_layout():
+    """Multi-channel frames are (h, w, channels) arrays
+    """
+    gc.collect()
+    qhpyccd.use_simulator(size=[64, 48], channels=3)
+    cam = qhpyccd.qhyccd(exptime=0.01, cache_dir=None)
+    try:
+        assert cam.get_channels() == 3
+        assert cam.get_frame_layout() == ((48, 64, 3), np.dtype(np.uint16))
+        check_layout(cam)
+        cam.set_bitdepth(8)
+        assert cam.get_frame_layout() == ((48, 64, 3), np.dtype(np.uint8))
+        check_layout(cam)
+    finally:
+        cam.close()
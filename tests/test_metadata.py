@@ -0,0 +1,38 @@
+"""
+Tests of frame metadata records.
+"""
+import time
+
+
+def get_date_obs(frame):
+    """Return the DATE-OBS value and comment of a frame
+    """
+    for key, value, comment in frame.metadata.get_frame_cards(frame):
+        if key == 'DATE-OBS':
+            return value, comment
+
+
+def test_date_obs_comment(cam):
+    """DATE-OBS of live frames is not labelled as the exposure start
+    """
+    cam.get_image()
+    assert get_date_obs(cam.frame)[1] == 'UTC host time at exposure start'
+    cam.set_stream_mode('live')
+    cam.begin_live(nbuffers=2)
+    try:
+        frame = None
+        t = time.time()
+        while frame is None and time.time() - t < 2.0:
+            frame = cam.poll_live_frame(0.01)
+        assert frame is not None
+        value, comment = get_date_obs(frame)
+        assert comment == 'UTC host time at frame read'
+        assert value.startswith(time.strftime('%Y-%m-%dT%H:%M',
+                                              time.gmtime(frame.t_start)))
+        frame.release()
+    finally:
+        cam.stop_live()
+        cam.set_stream_mode('single')
+    # Single frame records are not confused with live ones
+    cam.get_image()
+    assert get_date_obs(cam.frame)[1] == 'UTC host time at exposure start'
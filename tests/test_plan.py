@@ -0,0 +1,37 @@
+"""
+Tests of exposure plans.
+"""
+from qhpyccd import ExposurePlan, ExposureSpec
+
+def test_transition_from_camera_configuration(cam):
+    """Settings equivalent to the current ones cost nothing
+    """
+    cam.configure(region=[[0, 0], [0, 0]], binsize=[1, 1])
+    plan = ExposurePlan([])
+    configuration = cam.get_configuration()
+    image_size = cam.get_image_size()
+    assert plan.get_transition_time(configuration,
+                                    {'region': ([0, 0], [0, 0]),
+                                     'binsize': (1, 1),
+                                     'exptime': cam.get_exptime()},
+                                    image_size) == 0.0
+    assert plan.get_transition_time(configuration,
+                                    {'region': [[0, 0], [64, 64]]},
+                                    image_size) > 0.0
+
+
+def test_schedule_from_camera_configuration(cam):
+    """Full-frame steps matching the camera settings are run first
+    """
+    cam.configure(region=[[0, 0], [0, 0]], binsize=[1, 1])
+    exptime = cam.get_exptime()
+    binned = ExposureSpec(2, 'binned', binsize=[2, 2], exptime=exptime)
+    full = ExposureSpec(2, 'full', region=[[0, 0], [0, 0]], binsize=[1, 1],
+                        exptime=exptime)
+    plan = ExposurePlan([binned, full])
+    steps = plan.schedule(cam.get_configuration(), cam.get_image_size())
+    assert steps == [full, binned]
+    assert plan.timeline[0]['estimated_start'] == 0.0
+    names = [spec.name for spec, frame in plan.run(cam)]
+    assert names == ['full', 'full', 'binned', 'binned']
+    assert plan.steps == [full, binned]
@@ -0,0 +1,73 @@
+"""
+Tests of SDK call profiling.
+"""
+import qhpyccd
+from qhpyccd import CallProfile, InstrumentedSDK
+from qhpyccd.profiling import HISTOGRAM_NBINS
+
+
+def test_call_profile():
+    """Snapshots hold counts, durations and latency histograms
+    """
+    profile = CallProfile()
+    for ns in (1000, 3000, 2000):
+        profile.record('Slow', ns)
+    profile.record('Fast', 10)
+    profile.record('Huge', 1 << 60)
+    snapshot = profile.snapshot()
+    slow = snapshot['Slow']
+    assert slow['count'] == 3
+    assert abs(slow['total'] - 6e-6) < 1e-15
+    assert abs(slow['mean'] - 2e-6) < 1e-15
+    assert abs(slow['max'] - 3e-6) < 1e-15
+    # 1000, 2000 and 3000 ns are in [512, 1024[, [1024, 2048[ and [2048, 4096[
+    assert slow['histogram'][10:13] == [1, 1, 1]
+    assert sum(slow['histogram']) == 3
+    assert snapshot['Fast']['histogram'][4] == 1
+    assert snapshot['Huge']['histogram'][HISTOGRAM_NBINS - 1] == 1
+    # Snapshots are copies
+    slow['histogram'][0] = 99
+    assert profile.snapshot()['Slow']['histogram'][0] == 0
+    lines = profile.report().splitlines()
+    assert lines[0].startswith('Function')
+    assert [line.split()[0] for line in lines[1:]] == ['Huge', 'Slow', 'Fast']
+    assert profile.reset().snapshot() == {}
+
+
+def test_profile_sdk(cam, sdk):
+    """SDK calls are timed inside the block only
+    """
+    assert qhpyccd.lib is sdk
+    with qhpyccd.profile_sdk() as profile:
+        assert isinstance(qhpyccd.lib, InstrumentedSDK)
+        cam.get_image()
+    assert qhpyccd.lib is sdk
+    cam.get_image()
+    snapshot = profile.snapshot()
+    assert snapshot['ExpQHYCCDSingleFrame']['count'] == 1
+    assert snapshot['GetQHYCCDSingleFrame']['count'] == 1
+    assert 'GetQHYCCDSingleFrame' in profile.report()
+
+
+def test_nested_profiles(cam, sdk):
+    """Profiles are attached and detached independently
+    """
+    outer = qhpyccd.enable_profiling()
+    try:
+        cam.get_image()
+        with qhpyccd.profile_sdk() as inner:
+            cam.get_image()
+        cam.get_image()
+        # The backend can be replaced while profiling
+        cam.close()
+        new_sdk = qhpyccd.use_simulator(size=[64, 48])
+        assert qhpyccd.lib.sdk is new_sdk
+        assert qhpyccd.lib.profiles == (outer,)
+    finally:
+        qhpyccd.disable_profiling(outer)
+    assert qhpyccd.lib is new_sdk
+    assert outer.snapshot()['GetQHYCCDSingleFrame']['count'] == 3
+    assert inner.snapshot()['GetQHYCCDSingleFrame']['count'] == 1
+    # Disabling profiling when it is off has no effect
+    qhpyccd.disable_profiling()
+    assert qhpyccd.lib is new_sdk
@@ -0,0 +1,54 @@
+"""
+Tests of pipelined image sequences.
+"""
+import numpy as np
+import pytest
+
+
+def test_sequence_pipeline(cam, sdk):
+    """Frames come in order, with the next exposure already running
+    """
+    seqno = cam._seqno
+    frames = []
+    for frame in cam.sequence(4, nbuffers=2):
+        assert frame.data.shape == cam.image.shape
+        assert not np.shares_memory(frame.data, cam.image)
+        # The next exposure is started before the frame is handed out
+        assert (sdk.cameras[0].exp_start is not None) == (len(frames) < 3)
+        if frames:
+            assert frames[-1].is_released()
+            assert frame.t_start >= frames[-1].t_end
+        assert frame.t_end - frame.t_start >= cam.get_exptime()
+        frames.append(frame)
+    assert [frame.seqno for frame in frames] == list(range(seqno, seqno + 4))
+    assert sdk.ncalls['ExpQHYCCDSingleFrame'] == 4
+    assert 'CancelQHYCCDExposingAndReadout' not in sdk.ncalls
+
+
+def test_sequence_held_frames(cam):
+    """Frames kept by the caller exhaust the buffers
+    """
+    frames = []
+    with pytest.raises(RuntimeError):
+        for frame in cam.sequence(4, nbuffers=2, autorelease=False):
+            frames.append(frame)
+    assert len(frames) == 2
+    assert not any(frame.is_released() for frame in frames)
+    assert frames[0].slot != frames[1].slot
+
+
+def test_sequence_close_cancels(cam, sdk):
+    """Closing a sequence early cancels the pending exposure
+    """
+    seq = cam.sequence(10)
+    frame = next(seq)
+    assert sdk.cameras[0].exp_start is not None
+    seq.close()
+    # The last frame remains valid after breaking out of the sequence
+    assert not frame.is_released()
+    assert sdk.ncalls['CancelQHYCCDExposingAndReadout'] == 1
+    assert sdk.cameras[0].exp_start is None
+    # The camera remains usable
+    seqno = frame.seqno
+    cam.get_image()
+    assert cam.frame.seqno == seqno + 1
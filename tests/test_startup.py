@@ -0,0 +1,58 @@
+"""
+Tests of camera initialization.
+"""
+import logging
+
+import qhpyccd
+
+
+def test_quiet_constructor(sdk, capsys, caplog):
+    """Opening a camera prints nothing and logs at debug level only
+    """
+    with caplog.at_level(logging.DEBUG, logger='qhpyccd'):
+        cam = qhpyccd.qhyccd(exptime=0.01, cache_dir=None)
+    assert capsys.readouterr().out == ''
+    assert caplog.records
+    assert all(record.levelno == logging.DEBUG for record in caplog.records)
+    assert any('QHYSIM-0000' in record.getMessage() \
+               for record in caplog.records)
+    assert sdk.ncalls['GetQHYCCDFWVersion'] == 1
+    cam.close()
+
+
+def test_constructor_sdk_calls(sdk):
+    """Settings are written once and never read back
+    """
+    cam = qhpyccd.qhyccd(exptime=0.01, cache_dir=None)
+    assert 'GetQHYCCDParam' not in sdk.ncalls
+    # USB traffic, gain, offset and exposure time
+    assert sdk.ncalls['SetQHYCCDParam'] == 4
+    for function in ('SetQHYCCDStreamMode', 'SetQHYCCDResolution',
+                     'SetQHYCCDBinMode', 'SetQHYCCDBitsMode',
+                     'GetQHYCCDChipInfo'):
+        assert sdk.ncalls[function] == 1
+    # The firmware version is only queried when logged
+    assert 'GetQHYCCDFWVersion' not in sdk.ncalls
+    cam.close()
+
+
+def test_unchanged_settings(cam, sdk):
+    """Setting the current values makes no SDK call nor reallocation
+    """
+    ncalls = dict(sdk.ncalls)
+    buffer, image = cam._image_buffer, cam.image
+    start, size = cam.get_region()
+    cam.set_region(start, size)
+    cam.set_region([0, 0], [0, 0])
+    cam.set_binsize([1, 1])
+    cam.set_bitdepth(16)
+    cam.set_gain(cam.get_gain())
+    cam.set_offset(cam.get_offset())
+    cam.set_exptime(cam.get_exptime())
+    cam.set_usbtraffic(cam.get_usbtraffic())
+    assert sdk.ncalls == ncalls
+    assert cam._image_buffer is buffer and cam.image is image
+    # Smaller frames reuse the image buffer
+    cam.set_region([10, 10], [100, 50])
+    assert cam._image_buffer is buffer
+    assert cam.image.shape == (50, 100)
@@ -0,0 +1,86 @@
+"""
+Tests of frame statistics.
+"""
+import numpy as np
+import pytest
+from qhpyccd import FrameStatistics, frame_stats
+
+def check_stats(stats, data):
+    """Compare statistics with a numpy reference
+    """
+    assert stats['npix'] == data.size
+    assert stats['min'] == data.min() and stats['max'] == data.max()
+    np.testing.assert_allclose(stats['mean'], data.mean(dtype=np.float64),
+                               rtol=1e-6)
+    np.testing.assert_allclose(stats['std'], data.std(dtype=np.float64),
+                               rtol=1e-6)
+
+
+def test_get_image_stats_attached(cam):
+    """Statistics of the last image are attached to its frame
+    """
+    cam.get_image()
+    stats = cam.get_image_stats(nbins=None)
+    assert cam.frame.stats is stats
+    check_stats(stats, cam.image)
+
+
+def test_frame_statistics_on_acquisitions(cam):
+    """Single and sequence frames carry statistics once enabled
+    """
+    cam.get_image()
+    assert cam.frame.stats is None
+    cam.set_frame_statistics(stride=2, nbins=None)
+    cam.get_image()
+    check_stats(cam.frame.stats, cam.image[::2, ::2])
+    for frame in cam.sequence(3):
+        check_stats(frame.stats, frame.data[::2, ::2])
+    cam.set_frame_statistics(enable=False)
+    cam.get_image()
+    assert cam.frame.stats is None
+
+
+def test_stride_and_roi():
+    """Subsampled and ROI statistics match numpy
+    """
+    rng = np.random.default_rng(3)
+    data = rng.integers(0, 65536, (64, 48), dtype=np.uint16)
+    check_stats(frame_stats(data, nbins=None), data)
+    check_stats(frame_stats(data, stride=3, nbins=None), data[::3, ::3])
+    check_stats(frame_stats(data, roi=([4, 8], [16, 20]), nbins=None),
+                data[8:28, 4:20])
+    stats = frame_stats(data, saturation=60000)
+    assert stats['nsaturated'] == (data >= 60000).sum()
+    assert stats['histogram'].sum() == data.size
+
+
+def test_histogram_and_types():
+    """Rebinned histograms match numpy for 8 and 16-bit frames
+    """
+    rng = np.random.default_rng(5)
+    for dtype, nvalues in ((np.uint8, 256), (np.uint16, 65536)):
+        data = rng.integers(0, nvalues, (32, 40, 3), dtype=dtype)
+        stats = frame_stats(data, nbins=64)
+        check_stats(stats, data)
+        reference = np.histogram(data, bins=64, range=(0, nvalues))[0]
+        assert (stats['histogram'] == reference).all()
+        assert len(frame_stats(data, nbins=None)['histogram']) == nvalues
+    empty = frame_stats(data, roi=([0, 0], [0, 0]))
+    assert empty['npix'] == 0 and np.isnan(empty['mean'])
+    with pytest.raises(ValueError):
+        frame_stats(data.astype(np.float32))
+
+
+def test_stream_stage(cam):
+    """A statistics stage attaches statistics to streamed frames
+    """
+    roi = ([16, 8], [64, 32])
+    stream = cam.start_stream(stages=[FrameStatistics(stride=2, roi=roi,
+                                                      nbins=None)])
+    try:
+        for i in range(3):
+            frame = stream.get(2.0)
+            check_stats(frame.stats, frame.data[8:40:2, 16:80:2])
+            frame.release()
+    finally:
+        stream.stop()
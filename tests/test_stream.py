@@ -0,0 +1,110 @@
+"""
+Tests of background live streams and their queue overflow policies.
+"""
+import time
+
+import numpy as np
+import pytest
+from qhpyccd import Frame, FrameRing
+from qhpyccd.stream import FrameQueue
+
+
+def ring_frames(ring, n):
+    """Return n frames acquired from a ring, numbered from 0
+    """
+    return [Frame(ring, ring.acquire(), None, seqno=i) for i in range(n)]
+
+
+def wait_overflow(stream, timeout=2.0):
+    """Wait until the stream has dropped frames because of overflows
+    """
+    t = time.time()
+    while stream.get_ndropped() < 3 and time.time() - t < timeout:
+        time.sleep(0.01)
+
+
+def test_queue_policies():
+    """Overflowing frames are dropped and released according to the policy
+    """
+    with pytest.raises(ValueError):
+        FrameQueue(2, 'drop-all')
+    for overflow, kept in (('drop-oldest', [1, 2]), ('drop-newest', [0, 1])):
+        ring = FrameRing(3, (2, 2), np.uint8)
+        q = FrameQueue(2, overflow)
+        for frame in ring_frames(ring, 3):
+            assert q.put(frame)
+        assert q.qsize() == 2 and q.ndropped == 1
+        assert ring.get_nfree() == 1
+        assert [q.get(0).seqno for i in range(2)] == kept
+    ring = FrameRing(3, (2, 2), np.uint8)
+    q = FrameQueue(2, 'block')
+    frames = ring_frames(ring, 3)
+    assert q.put(frames[0]) and q.put(frames[1])
+    assert not q.put(frames[2], timeout=0.05)
+    assert q.ndropped == 0 and not frames[2].is_released()
+    q.close()
+    assert not q.put(frames[2])
+
+
+def test_stream_block(cam):
+    """A blocked stream delivers consecutive frames without dropping any
+    """
+    seqno = cam._seqno
+    stream = cam.start_stream(nbuffers=6, queue_size=2, overflow='block')
+    try:
+        time.sleep(0.2)
+        assert stream.queue.qsize() == 2
+        for i in range(5):
+            frame = stream.get(2.0)
+            assert frame.seqno == seqno + i
+            frame.release()
+        assert stream.get_ndropped() == 0
+        assert stream.get_counters()['noverflow'] == 0
+    finally:
+        stream.stop()
+    assert cam.get_stream_mode() == 'single'
+    assert stream.get(0) is None
+
+
+def test_stream_drop_oldest(cam):
+    """A stream dropping the oldest frames keeps the latest ones
+    """
+    seqno = cam._seqno
+    stream = cam.start_stream(nbuffers=6, queue_size=2,
+                              overflow='drop-oldest')
+    try:
+        wait_overflow(stream)
+        frame = stream.get(2.0)
+        assert frame.seqno > seqno + 1
+        frame.release()
+        counters = stream.get_counters()
+        assert counters['noverflow'] >= 3
+        assert counters['ndropped'] >= counters['noverflow']
+    finally:
+        stream.stop()
+    assert cam.get_stream_mode() == 'single'
+
+
+def test_stream_drop_newest(cam):
+    """A stream dropping the newest frames keeps the first ones
+    """
+    seqno = cam._seqno
+    stream = cam.start_stream(nbuffers=6, queue_size=2,
+                              overflow='drop-newest')
+    try:
+        wait_overflow(stream)
+        frames = [stream.get(2.0) for i in range(2)]
+        assert [frame.seqno for frame in frames] == [seqno, seqno + 1]
+        for frame in frames:
+            frame.release()
+        assert stream.get_ndropped() >= 3
+    finally:
+        stream.stop()
+
+
+def test_stream_needs_spare_buffers(cam):
+    """The live ring must be larger than the queue
+    """
+    with pytest.raises(RuntimeError):
+        cam.start_stream(nbuffers=4, queue_size=4)
+    assert cam.get_stream_mode() == 'single'
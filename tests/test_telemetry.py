@@ -0,0 +1,181 @@
+"""
+Tests of telemetry sampling and cooler settling.
+"""
+import gc
+import threading
+import time
+import numpy as np
+import pytest
+import qhpyccd
+
+def test_settle_finishes_when_sampler_stops(cam):
+    """Waiters are released when the telemetry sampler stops
+    """
+    settle = cam.wait_for_cooler(window=3600.0)
+    timer = threading.Timer(0.2, cam.stop_telemetry)
+    timer.start()
+    t = time.monotonic()
+    assert not settle.wait(10.0)
+    assert time.monotonic() - t < 5.0
+    assert settle.settled is False
+    timer.join()
+
+
+def test_settle_on_stopped_sampler(cam):
+    """Monitoring a stopped sampler fails right away
+    """
+    sampler = cam.start_telemetry(rate=10.0)
+    sampler.stop()
+    from qhpyccd import CoolerSettle
+    assert CoolerSettle(sampler).settled is False
+
+
+def test_target_temperature_timeout(cam):
+    """Waiting for the cooler honors the timeout even without samples
+    """
+    sampler = cam.start_telemetry(rate=0.1)
+    t = time.monotonic()
+    with pytest.raises(RuntimeError):
+        cam.set_target_temperature(-10.0, wait=0.3)
+    assert time.monotonic() - t < 2.0
+    sampler.stop()
+
+
+def test_sampling_during_exposures(cam):
+    """Samples are recorded while frames are exposed
+    """
+    cam.set_exptime(1.0)
+    sampler = cam.start_telemetry(rate=20.0)
+    time.sleep(0.1)
+    count = sampler.get_count()
+    for frame in cam.sequence(2):
+        pass
+    cam.get_image()
+    # About 60 samples in 3 s of exposures
+    assert sampler.get_count() - count > 30
+    assert cam.frame.metadata.telemetry['time'] > cam.frame.t_start
+    sampler.stop()
+    cam.set_exptime(0.01)
+
+
+def test_cancel_interrupts_exposure_wait(cam):
+    """cancel_exposure() ends the wait for the exposure right away
+    """
+    cam.set_exptime(5.0)
+    timer = threading.Timer(0.2, cam.cancel_exposure)
+    timer.start()
+    t = time.monotonic()
+    with pytest.raises(RuntimeError):
+        cam.get_image()
+    assert time.monotonic() - t < 2.0
+    timer.join()
+    cam.set_exptime(0.01)
+    cam.get_image()
+
+
+def test_settle_without_cooler():
+    """Settling cannot be monitored without a cooler target
+    """
+    from qhpyccd import simulator
+    controls = tuple(c for c in simulator.DEFAULT_CONTROLS \
+                     if c != simulator.CONTROL_COOLER)
+    qhpyccd.use_simulator(size=[64, 48], controls=controls)
+    cam = qhpyccd.qhyccd(exptime=0.01, cache_dir=None)
+    with pytest.raises(RuntimeError):
+        cam.wait_for_cooler(timeout=None)
+    sampler = cam.start_telemetry(rate=10.0)
+    from qhpyccd import CoolerSettle
+    with pytest.raises(RuntimeError):
+        CoolerSettle(sampler)
+    cam.close()
+
+
+def test_settle_window_longer_than_ring(cam):
+    """A window the sampler ring cannot hold is rejected
+    """
+    cam.start_telemetry(rate=10.0, nsamples=50)
+    with pytest.raises(ValueError):
+        cam.wait_for_cooler(window=30.0)
+    # 49 sample periods of 0.1 s cover a 4 s window
+    settle = cam.wait_for_cooler(window=4.0)
+    assert settle.cancel().settled is False
+    cam.stop_telemetry()
+
+
+def wait_count(sampler, count, timeout=2.0):
+    """Wait until the sampler has recorded count samples
+    """
+    t = time.monotonic()
+    while sampler.get_count() < count and time.monotonic() - t < timeout:
+        time.sleep(0.01)
+    return sampler.get_count()
+
+
+def test_sampler_ring(cam):
+    """The ring keeps the latest samples in chronological order
+    """
+    with pytest.raises(ValueError):
+        cam.start_telemetry(rate=0.0)
+    sampler = cam.start_telemetry(rate=100.0, nsamples=5)
+    assert wait_count(sampler, 12) >= 12
+    sampler.stop()
+    samples = sampler.get_samples()
+    assert samples.shape == (5, 4)
+    assert (np.diff(samples[:, 0]) > 0.0).all()
+    latest = sampler.get_latest()
+    assert list(latest) == ['time', 'temperature', 'target', 'pwm']
+    assert list(latest.values()) == samples[-1].tolist()
+    assert len(sampler.get_samples(duration=0.0)) == 1
+
+
+def test_sampler_values(cam):
+    """Samples and their statistics match the camera telemetry
+    """
+    cam.set_target_temperature(-10.0)
+    sampler = cam.start_telemetry(rate=100.0)
+    wait_count(sampler, 20)
+    sampler.stop()
+    assert sampler.get_latest()['target'] == cam.get_target_temperature()
+    stats = sampler.get_stats()
+    assert stats['nsamples'] == sampler.get_count()
+    assert stats['target']['mean'] == -10.0
+    assert stats['target']['std'] == 0.0
+    samples = sampler.get_samples()
+    temperature = stats['temperature']
+    assert temperature['min'] == samples[:, 1].min()
+    assert temperature['max'] == samples[:, 1].max()
+    # Cooling down
+    assert temperature['slope'] <= 0.0
+    assert cam.get_temperature() <= temperature['max']
+
+
+def test_busy_camera_skips_samples(cam):
+    """Samples are skipped rather than waiting for a busy camera
+    """
+    sampler = cam.start_telemetry(rate=50.0)
+    wait_count(sampler, 2)
+    with cam._lock:
+        count = sampler.get_count()
+        time.sleep(0.3)
+        assert sampler.get_count() == count
+    assert sampler.nskipped > 0
+    assert wait_count(sampler, count + 2) >= count + 2
+    sampler.stop()
+
+
+def test_unsupported_telemetry():
+    """Quantities the camera does not provide are recorded as NaN
+    """
+    from qhpyccd import simulator
+    controls = tuple(c for c in simulator.DEFAULT_CONTROLS \
+                     if c != simulator.CONTROL_CURPWM)
+    gc.collect()
+    qhpyccd.use_simulator(size=[64, 48], controls=controls)
+    cam = qhpyccd.qhyccd(exptime=0.01, cache_dir=None)
+    sampler = cam.start_telemetry(rate=100.0)
+    wait_count(sampler, 3)
+    sampler.stop()
+    assert np.isnan(sampler.get_latest()['pwm'])
+    assert not np.isnan(sampler.get_latest()['temperature'])
+    assert np.isnan(sampler.get_stats()['pwm']['mean'])
+    cam.close()